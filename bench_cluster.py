@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+# Benchmarks working out the per-zoom marker clusters for synthetic storms
+# of 1k, 10k and 100k outages scattered over the service area, and
+# reports the size of the cluster files against the marker feed itself.
+#
+# Usage: bench_cluster.py [outages ...]
+#
+# Needs secrets.py, like generate_map.py itself.
+
+import gzip
+import random
+import sys
+import time
+
+from StringIO import StringIO
+
+import generate_map
+
+from generate_map import json
+
+# Roughly the RG&E service area
+SOUTH, NORTH = 42.1, 43.4
+WEST, EAST = -78.9, -76.1
+
+
+def synthetic_feed(outages, seed=1):
+    # outages bunch up around a few dozen towns, as they do in a storm
+    rnd = random.Random(seed)
+    towns = [(rnd.uniform(SOUTH, NORTH), rnd.uniform(WEST, EAST))
+             for i in range(60)]
+    now = time.time()
+    features = []
+    for i in range(outages):
+        lat, lng = rnd.choice(towns)
+        total = rnd.randint(1, 300)
+        features.append(generate_map.produceFeature(
+            'town|location|street %d' % i,
+            rnd.gauss(lat, 0.03), rnd.gauss(lng, 0.04), 'STREET %d' % i,
+            now - rnd.uniform(0, 6*60*60),
+            { 'TotalCustomers': total,
+              'CustomersWithoutPower': rnd.randint(1, total),
+              'EstimatedRestoration': 'Assessing' }))
+    return generate_map.produceFeed(features, int(now),
+                                     { 'asof': '', 'streets': outages,
+                                       'locales': '' })
+
+
+def sizes(data):
+    text = json.dumps(data, separators=(',', ':'))
+    buf = StringIO()
+    fd = gzip.GzipFile(fileobj=buf, mode='wb')
+    fd.write(text)
+    fd.close()
+    return len(text), len(buf.getvalue())
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+
+    print "%8s %9s %9s %9s %11s %11s" % ("outages", "cluster", "encode",
+                                         "clusters", "all zooms",
+                                         "feed")
+    for outages in counts:
+        feed = synthetic_feed(outages)
+
+        start = time.time()
+        levels = generate_map.produceClusters(feed)
+        clustered = time.time() - start
+
+        start = time.time()
+        for level in levels.values():
+            json.dumps(level, separators=(',', ':'))
+        encoded = time.time() - start
+
+        raw = gz = 0
+        for level in levels.values():
+            r, g = sizes(level)
+            raw += r
+            gz += g
+        feedraw, feedgz = sizes(feed)
+        print "%8d %8.3fs %8.3fs %9d %5dk/%4dk %5dk/%4dk" % (
+            outages, clustered, encoded,
+            len(levels[generate_map.CLUSTER_MIN_ZOOM]['clusters']),
+            raw / 1024, gz / 1024, feedraw / 1024, feedgz / 1024)
+
+        for zoom in sorted(levels):
+            r, g = sizes(levels[zoom])
+            print "%26s zoom %2d: %6d clusters %6dk/%4dk" % (
+                "", zoom, len(levels[zoom]['clusters']), r / 1024, g / 1024)
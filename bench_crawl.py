@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+# Benchmarks scrape_rge.crawl_outages against a local RG&E stand-in.
+#
+# Usage: bench_crawl.py [pagedir]
+#
+# With no argument, serves a synthetic site; otherwise serves the saved
+# pages in pagedir (which must include scrape_rge.START_URL).
+
+import sys
+import time
+
+import fakerge
+import scrape_rge
+
+LATENCY = 0.02
+
+
+class OneShotFetcher(scrape_rge.Fetcher):
+    """The old behaviour: one request at a time, a new handle every time."""
+
+    def __init__(self):
+        scrape_rge.Fetcher.__init__(self, workers=1)
+
+    def fetch(self, url):
+        return scrape_rge.get_url(url).getvalue()
+
+
+def run(server, fetcher):
+    before = server.requests
+    start = time.time()
+    try:
+        result = scrape_rge.crawl_outages(server.base_url,
+                                          scrape_rge.START_URL, fetcher)
+    finally:
+        fetcher.close()
+    return result, time.time() - start, server.requests - before
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        pages = fakerge.load_site(sys.argv[1])
+    else:
+        pages = fakerge.synthetic_site(counties=2, towns=6, locations=4,
+                                       streets=15)
+
+    server = fakerge.StandinServer(pages, latency=LATENCY).start()
+    try:
+        modes = [('sequential, no reuse', OneShotFetcher),
+                 ('1 worker, keep-alive', lambda: scrape_rge.Fetcher(1)),
+                 ('4 workers', lambda: scrape_rge.Fetcher(4)),
+                 ('8 workers', lambda: scrape_rge.Fetcher(8, 8))]
+        baseline = None
+        for name, factory in modes:
+            result, elapsed, requests = run(server, factory())
+            if baseline is None:
+                baseline = (result, elapsed)
+            elif result != baseline[0]:
+                sys.stderr.write("%s: result differs from sequential crawl\n"
+                                 % name)
+                sys.exit(1)
+            print "%-22s %4d pages  %7.3fs  %5.2fx" % (
+                name, requests, elapsed, baseline[1] / elapsed)
+    finally:
+        server.stop()
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+# Benchmarks a run against an RG&E that won't answer: runs the generator
+# once against a healthy local stand-in (see fakerge) to fill the caches,
+# then again with some street pages stalling and some failing, and with
+# the start page stalling too.  Reports how long each run took against
+# the crawl deadline, and how many pages and markers came from the last
+# good copy.
+#
+# Usage: bench_deadline.py [deadline [timeout [stall]]]
+#
+#   deadline  generate_map.CRAWL_DEADLINE for the runs, in seconds
+#             (default 10)
+#   timeout   scrape_rge.REQUEST_TIMEOUT, in seconds (default 1; it's 30
+#             against a 5 minute deadline in earnest)
+#   stall     how long stalled pages stall, in seconds (default 60)
+#
+# Needs secrets.py, like generate_map.py itself.  Runs in a scratch
+# directory.
+
+import shutil
+import sys
+import tempfile
+
+import bench_run
+import fakerge
+import generate_map
+import geoqueue
+import scrape_rge
+
+# Of the street pages, one in STALL_EVERY stalls and one in FAIL_EVERY
+# gets a 503
+STALL_EVERY = 3
+FAIL_EVERY = 7
+
+
+def markers(workdir):
+    feed = generate_map.readJSON(workdir + '/' + generate_map.FEED_FILE)
+    return (len(feed['features']),
+            len([f for f in feed['features'] if f['properties'].get('stale')]))
+
+
+if __name__ == '__main__':
+    deadline = len(sys.argv) > 1 and float(sys.argv[1]) or 10
+    timeout = len(sys.argv) > 2 and float(sys.argv[2]) or 1
+    stall = len(sys.argv) > 3 and float(sys.argv[3]) or 60
+
+    pages = fakerge.synthetic_site(4, 5, 5, 10)
+    streetpages = sorted(name for name in pages if 'L' in name)
+    server = fakerge.StandinServer(pages).start()
+    geocoder = fakerge.StandinGeocoder().start()
+    generate_map.GEOCODE_URL = geocoder.url
+    generate_map.geocodeLimiter = geoqueue.TokenBucket(bench_run.GEO_RATE,
+                                                       bench_run.GEO_BURST)
+    generate_map.GEOCODE_CONCURRENCY = bench_run.GEO_CONCURRENCY
+    generate_map.CRAWL_DEADLINE = deadline
+    scrape_rge.REQUEST_TIMEOUT = timeout
+    workdir = tempfile.mkdtemp(prefix='bench_deadline.')
+
+    def faults(run):
+        server.stalls.clear()
+        server.errors.clear()
+        if run == 'healthy':
+            return
+        for i, name in enumerate(streetpages):
+            if i % STALL_EVERY == 0:
+                server.stalls[name] = stall
+            elif i % FAIL_EVERY == 0:
+                server.errors[name] = 503
+        if run == 'start stalls':
+            server.stalls[scrape_rge.START_URL] = stall
+
+    try:
+        print "%-14s %8s %6s %6s %6s %8s %7s" % (
+            "run", "wall", "fresh", "stale", "missing", "markers", "stale")
+        for run in ('healthy', 'pages fail', 'start stalls'):
+            faults(run)
+            elapsed, report = bench_run.run_generator(workdir, server.base_url)
+            stats = report['values']['pages']
+            features, stale = markers(workdir)
+            print "%-14s %7.2fs %6d %6d %7d %8d %7d" % (
+                run, elapsed,
+                stats['parsed'] + stats['notmodified'] + stats['unchanged'],
+                stats['stale'], stats['missing'], features, stale)
+    finally:
+        server.stop()
+        geocoder.stop()
+        shutil.rmtree(workdir)
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+
+# Benchmarks geocoding a cold cache through geoqueue.GeocodeQueue against a
+# local stand-in geocoder, compared with the old one-at-a-time lookups with
+# a one-second sleep after each.  The last run injects server errors, to
+# show lookups being held off rather than piling onto a failing geocoder.
+#
+# Usage: bench_geocode.py [lookups [latency]]
+#
+# Needs secrets.py, like generate_map.py itself.
+
+import sys
+import time
+
+import fakerge
+import generate_map
+import geoqueue
+
+OLD_SAMPLE = 5
+
+
+def old_way(queries):
+    for query in queries:
+        try:
+            generate_map.fetchGeocode(query)
+        except Exception:
+            pass
+        time.sleep(1)
+
+
+def queued(queries, rate, burst, concurrency):
+    queue = geoqueue.GeocodeQueue(generate_map.fetchGeocode, rate, burst,
+                                  concurrency)
+    for i, query in enumerate(queries):
+        queue.submit(i, query)
+    failures = heldoff = 0
+    for key, result, error in queue.finish():
+        if isinstance(error, geoqueue.HeldOff):
+            heldoff += 1
+        elif error is not None:
+            failures += 1
+    return failures, heldoff
+
+
+if __name__ == '__main__':
+    lookups = len(sys.argv) > 1 and int(sys.argv[1]) or 300
+    latency = len(sys.argv) > 2 and float(sys.argv[2]) or 0.15
+
+    geocoder = fakerge.StandinGeocoder(latency=latency).start()
+    generate_map.GEOCODE_URL = geocoder.url
+    queries = ['%d MAIN ST, ROCHESTER NY' % i for i in range(lookups)]
+
+    try:
+        start = time.time()
+        old_way(queries[:OLD_SAMPLE])
+        old = (time.time() - start) / OLD_SAMPLE * lookups
+        print "%d lookups, %.2fs latency" % (lookups, latency)
+        print "%-34s %8.2fs  (extrapolated)" % ("sequential + sleep(1)", old)
+
+        for rate, burst, concurrency, errors in [(10, 5, 1, 0), (10, 5, 4, 0),
+                                                 (50, 10, 8, 0),
+                                                 (50, 10, 16, 0),
+                                                 (50, 10, 8, 0.02)]:
+            geocoder.httpd.error_rate = errors
+            start = time.time()
+            failures, heldoff = queued(queries, rate, burst, concurrency)
+            elapsed = time.time() - start
+            print "%-34s %8.2fs  %6.1fx  %d failed, %d held off" % (
+                "%d/s, burst %d, %d in flight%s" % (
+                    rate, burst, concurrency, errors and ", errors" or ""),
+                elapsed, old / elapsed, failures, heldoff)
+    finally:
+        geocoder.stop()
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+# Benchmarks localgeo: importing a synthetic street point file, loading the
+# table, and answering lookups.
+#
+# Usage: bench_localgeo.py [streets [lookups]]
+
+import csv
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import fakerge
+import localgeo
+import streetnames
+
+TOWNS = ['Rochester', 'Brighton', 'Pittsford', 'Penfield', 'Webster',
+         'Greece', 'Irondequoit', 'Henrietta', 'Chili', 'Gates', 'Perinton',
+         'Fairport', 'Mendon', 'Honeoye Falls', 'Rush', 'Wheatland']
+
+
+def write_points(filename, streets, rand):
+    fd = open(filename, 'wb')
+    out = csv.writer(fd)
+    out.writerow(['street', 'town', 'lat', 'lon'])
+    names = []
+    for i in range(streets):
+        street = '%s %d %s' % (rand.choice(fakerge.NAMES), i,
+                               rand.choice(fakerge.SUFFIXES))
+        town = rand.choice(TOWNS)
+        names.append((town, street))
+        lat = 42.9 + rand.random() * 0.4
+        lng = -77.9 + rand.random() * 0.6
+        for j in range(5):
+            out.writerow([street, town, lat + j * 0.0005, lng + j * 0.0005])
+    fd.close()
+    return names
+
+
+if __name__ == '__main__':
+    streets = len(sys.argv) > 1 and int(sys.argv[1]) or 50000
+    lookups = len(sys.argv) > 2 and int(sys.argv[2]) or 200000
+    rand = random.Random(0)
+    workdir = tempfile.mkdtemp()
+    try:
+        pointfile = os.path.join(workdir, 'points.csv')
+        dbfile = os.path.join(workdir, 'streets.sqlite3')
+        names = write_points(pointfile, streets, rand)
+
+        start = time.time()
+        db = localgeo.initDB(dbfile)
+        localgeo.store(db, localgeo.read_csv(pointfile))
+        db.close()
+        print "import: %d streets in %.2fs" % (streets, time.time() - start)
+
+        start = time.time()
+        geocoder = localgeo.LocalGeocoder(dbfile)
+        print "load:   %d streets in %.2fs" % (len(geocoder),
+                                               time.time() - start)
+
+        keys = []
+        for i in range(lookups):
+            town, street = rand.choice(names)
+            if i % 10 == 0:
+                street = 'NOWHERE ' + street
+            keys.append((streetnames.normalize_street(street),
+                         streetnames.normalize_place(town)))
+
+        start = time.time()
+        found = 0
+        for street, town in keys:
+            if geocoder.lookup(street, town, town) is not None:
+                found += 1
+        elapsed = time.time() - start
+        print "lookup: %d (%d found) in %.2fs, %.2f us each, %d/s" % (
+            lookups, found, elapsed, 1e6 * elapsed / lookups,
+            lookups / elapsed)
+    finally:
+        shutil.rmtree(workdir)
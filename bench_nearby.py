@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+# Load test for the "outages near me" service (see nearby): builds an
+# index of synthetic geocoded outages scattered around Rochester, times
+# each kind of query against it directly (and /near against a scan of
+# every street), then over HTTP on one keep-alive connection to a
+# nearby.QueryServer, as many as it'll answer in a few seconds.  Client
+# and server share one process (and so one core), so the HTTP figure is
+# a floor.
+#
+# Usage: bench_nearby.py [streets [seconds]]
+#
+#   streets   outages in the index (default 20000)
+#   seconds   how long to keep the HTTP queries coming (default 5)
+
+import httplib
+import random
+import sys
+import time
+import urllib
+
+import fakerge
+import nearby
+import outagerecords
+
+TOWNS = 150
+QUERIES = 2000
+
+
+def outages(streets, seed=0):
+    rand = random.Random(seed)
+    for i in range(streets):
+        town = 'Town%d' % (i % TOWNS)
+        street = '%s %d %s' % (rand.choice(fakerge.NAMES), i // TOWNS,
+                               rand.choice(fakerge.SUFFIXES))
+        total = rand.randint(5, 400)
+        outage = outagerecords.StreetOutage('Monroe', town, '', street, total,
+                                            rand.randint(1, total), 'Assessing')
+        lat = 42.9 + rand.random() * 0.4
+        lng = -77.9 + rand.random() * 0.6
+        outage.geocoded({ 'formattedaddress': '%s, %s, NY' % (street, town),
+                          'latitude': lat,
+                          'longitude': lng,
+                          'locationtype': 'GEOMETRIC_CENTER',
+                          'viewport': (lat - 0.005, lng - 0.005,
+                                       lat + 0.005, lng + 0.005) })
+        yield outage
+
+
+def queries(index, count, seed=1):
+    # (path, parameters) of each kind, in turn
+    rand = random.Random(seed)
+    picks = [o for o in index.towns.values()[0]]
+    for i in range(count):
+        lat = 42.9 + rand.random() * 0.4
+        lng = -77.9 + rand.random() * 0.6
+        outage = rand.choice(picks)
+        yield [('/near', { 'lat': lat, 'lng': lng }),
+               ('/near', { 'street': outage.street, 'town': outage.town }),
+               ('/box', { 'south': lat, 'west': lng, 'north': lat + 0.02,
+                          'east': lng + 0.03 }),
+               ('/town', { 'town': outage.town }),
+               ('/street', { 'street': outage.street })][i % 5]
+
+
+def direct(index, asked):
+    # microseconds per query of each kind, and streets per answer
+    times = {}
+    for path, params in asked:
+        kind = path + (path == '/near' and 'street' in params and '?street' or '')
+        query = dict((name, [str(value)]) for name, value in params.items())
+        start = time.time()
+        found = nearby.answer(index, path, query)
+        elapsed = time.time() - start
+        stats = times.setdefault(kind, [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] += found['count']
+    return times
+
+
+def scan(index, asked):
+    # microseconds per /near?lat= query, looking at every street instead
+    # of the grid
+    everything = [o for cell in index.cells.values() for o in cell]
+    count = 0
+    start = time.time()
+    for path, params in asked:
+        if path == '/near' and 'lat' in params:
+            lat, lng = params['lat'], params['lng']
+            found = [(nearby.distance(lat, lng, o.latitude, o.longitude), o)
+                     for o in everything]
+            found = [item for item in found if item[0] <= nearby.RADIUS]
+            found.sort(key=lambda item: item[0])
+            count += 1
+    return (time.time() - start) / count
+
+
+def over_http(server, asked, seconds):
+    host, port = server.httpd.server_address
+    conn = httplib.HTTPConnection(host, port)
+    urls = ['%s?%s' % (path, urllib.urlencode(params)) for path, params in asked]
+    done = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        for url in urls[:100]:
+            conn.request('GET', url)
+            response = conn.getresponse()
+            body = response.read()
+            if response.status != 200:
+                raise Exception("%s: %d %s" % (url, response.status, body))
+        done += 100
+        urls = urls[100:] + urls[:100]
+    elapsed = time.time() - start
+    conn.close()
+    return done, elapsed
+
+
+if __name__ == '__main__':
+    streets = len(sys.argv) > 1 and int(sys.argv[1]) or 20000
+    seconds = len(sys.argv) > 2 and float(sys.argv[2]) or 5
+
+    start = time.time()
+    index = nearby.OutageIndex(outages(streets))
+    print "%d streets indexed in %.3fs, %d cells" % (
+        streets, time.time() - start, len(index.cells))
+
+    asked = list(queries(index, QUERIES))
+    print "%-14s %10s %10s" % ("query", "per query", "streets")
+    for kind, (count, elapsed, found) in sorted(direct(index, asked).items()):
+        print "%-14s %9.0fus %10.1f" % (kind, elapsed / count * 1e6,
+                                        float(found) / count)
+
+    print "%-14s %9.0fus  (every street, no grid)" % ("/near scan",
+                                                     scan(index, asked) * 1e6)
+
+    server = nearby.QueryServer(0).start()
+    server.index = index
+    try:
+        done, elapsed = over_http(server, asked, seconds)
+        print "HTTP: %d queries in %.1fs, %.0f/s on one connection" % (
+            done, elapsed, done / elapsed)
+    finally:
+        server.stop()
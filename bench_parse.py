@@ -0,0 +1,72 @@
+#!/usr/bin/python
+
+# Checks that scrape_rge's fast table extractor agrees with the BeautifulSoup
+# parser, then times both.
+#
+# Usage: bench_parse.py [pagedir]
+#
+# With no argument, uses a synthetic site plus a few awkward hand-written
+# pages; otherwise uses the saved pages in pagedir.  Exits nonzero if any
+# page parses differently.
+
+import sys
+import time
+
+import fakerge
+import scrape_rge
+
+ROUNDS = 5
+
+# Markup the synthetic site doesn't exercise.
+ODDITIES = {
+    'unclosed.html': """<html><body><p>Intro</p>
+<TABLE><TR><TH>Town<TH>Total<TH>Out
+<TR><TD><A HREF="T1.html">Brighton</A><TD>1,234<TD>56
+<TR><TD>&nbsp;<TD>&nbsp;<TD>&nbsp;
+<TR><TD>LONG POND RD<TD>7<TD>7<TD>Unknown
+</TABLE><table><tr><td>second table</td></tr></table>""",
+    'nested.html': """<table>
+<tr><th>&nbsp;</th><th>&nbsp;</th></tr>
+<tr><th>Street</th><th>Customers</th><th>Out</th></tr>
+<tr><td><b>BOLD</b> ST</td><td><font color="red">1</font></td><td>1<br>x<br/></td></tr>
+<tr><td>A &amp; B&#39;s <!-- note --> RD</td><td>2</td><td>2</td></tr>
+<tr><td><a href="x.html?a=1&amp;b=2" title='say "hi"'>Link &amp; co</a> tail</td><td>3</td></tr>
+<tr><td><a href="y.html"><b>bold</b>rest</a></td><td>4</td></tr>
+</table>""",
+}
+
+
+def timed(func, corpus):
+    start = time.time()
+    for i in range(ROUNDS):
+        for content in corpus.values():
+            func(content)
+    return (time.time() - start) / ROUNDS
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        corpus = fakerge.load_site(sys.argv[1])
+    else:
+        corpus = fakerge.synthetic_site(counties=2, towns=6, locations=4,
+                                        streets=40)
+        corpus.update(ODDITIES)
+
+    failures = 0
+    for name, content in sorted(corpus.items()):
+        soup = scrape_rge.parse_page(content, 'soup')
+        fast = scrape_rge.parse_page(content, 'fast')
+        if soup != fast:
+            failures += 1
+            sys.stderr.write("MISMATCH %s:\n  soup: %r\n  fast: %r\n"
+                             % (name, soup, fast))
+    print "%d pages, %d mismatches" % (len(corpus), failures)
+
+    soup = timed(lambda c: scrape_rge.parse_page(c, 'soup'), corpus)
+    fast = timed(lambda c: scrape_rge.parse_page(c, 'fast'), corpus)
+    nbytes = sum(len(c) for c in corpus.values())
+    print "soup: %7.3fs  (%6.2f MB/s)" % (soup, nbytes / soup / 1e6)
+    print "fast: %7.3fs  (%6.2f MB/s)  %5.2fx" % (fast, nbytes / fast / 1e6,
+                                                 soup / fast)
+
+    sys.exit(failures and 1 or 0)
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+# Benchmarks how a run holds its street outages: the dictionaries
+# generateMap used to keep (the crawl's record, a data.json copy with the
+# geocode result in it, and the result again for fitting the map) against
+# an outagerecords.OutageTable.  Reports memory per street and the time to
+# build them and write data.json, and checks both write the same bytes.
+#
+# Usage: bench_records.py [streets ...]
+#
+# Needs secrets.py, like generate_map.py itself.  Linux only (see
+# bench_render).
+
+import sys
+import time
+
+from StringIO import StringIO
+
+import bench_render
+import generate_map
+import outagerecords
+
+# streets per location page
+PAGE = 25
+
+
+def crawl(streets):
+    # What iter_outages hands over, as (county, town, location, street,
+    # total, out, restoration, geocode result): names above the street are
+    # shared by a page's streets, the rest are new strings each time, as
+    # they are from the parser.
+    for i in range(streets):
+        page = i // PAGE
+        if i % PAGE == 0:
+            county = 'County%d' % (page % 7)
+            town = 'Town%d' % (page % 150)
+            location = 'Location%d' % page
+        street = 'STREET %d RD' % i
+        lat = 43.0 + (i % 997) / 1000.0
+        lng = -77.9 + (i % 991) / 1000.0
+        yield (county, town, location, street, 1 + i % 300, 1 + i % 150,
+               '%s' % 'Assessing',
+               { 'formattedaddress': '%s, %s, NY' % (street, town),
+                 'latitude': lat,
+                 'longitude': lng,
+                 'locationtype': i % 3 and 'GEOMETRIC_CENTER' or 'APPROXIMATE',
+                 'viewport': (lat - 0.01, lng - 0.01, lat + 0.01, lng + 0.01) })
+
+
+def dictionaries(streets):
+    # as generateMap did it before OutageTable
+    newjsondict = {}
+    pointlist = []
+    for county, town, location, street, total, out, eta, geo in crawl(streets):
+        record = { 'County': county, 'Town': town, 'Location': location,
+                   'Street': street, 'TotalCustomers': total,
+                   'CustomersWithoutPower': out, 'EstimatedRestoration': eta }
+        streetinfo = dict(geo)
+        streetdata = dict((key, record[key]) for key in
+                          ('TotalCustomers', 'CustomersWithoutPower',
+                           'EstimatedRestoration'))
+        newjsondict.setdefault(county, {}).setdefault(town, {}).setdefault(location, {})[street] = streetdata
+        if streetinfo['locationtype'] == 'APPROXIMATE':
+            streetinfo['formattedaddress'] = '%s? (%s)' % (street, streetinfo['formattedaddress'])
+        streetdata['geo'] = streetinfo
+        streetdata['firstreport'] = 1000000000
+        pointlist.append(streetinfo)
+    return newjsondict, pointlist
+
+
+def table(streets):
+    outages = outagerecords.OutageTable()
+    for county, town, location, street, total, out, eta, geo in crawl(streets):
+        record = outagerecords.StreetOutage(county, town, location, street,
+                                            total, out, eta)
+        record.firstreport = 1000000000
+        record.geocoded(dict(geo))
+        if record.locationtype == 'APPROXIMATE':
+            record.address = '%s? (%s)' % (street, record.address)
+        outages.add(record)
+    return outages
+
+
+def timed(func, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def written(data):
+    out = StringIO()
+    generate_map.writeJSON(out, data)
+    return out.getvalue()
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [20000]
+
+    print "%8s %-13s %10s %9s %10s" % ("streets", "", "per street",
+                                       "build", "data.json")
+    for streets in counts:
+        outputs = []
+        for name, build, data in (
+                ('dictionaries', dictionaries, lambda built: built[0]),
+                ('OutageTable', table, lambda built: built.tree())):
+            # (held onto, so it's all there at the peak)
+            held = []
+            elapsed, peak = bench_render.measure(
+                lambda: held.append(build(streets)))
+            built = build(streets)
+            serialize, text = timed(lambda: written(data(built)))
+            outputs.append(text)
+            print "%8d %-13s %9.0fB %8.3fs %9.3fs" % (
+                streets, name, float(peak) / streets, elapsed, serialize)
+        if outputs[0] != outputs[1]:
+            sys.stderr.write("Outputs differ!\n")
+            sys.exit(1)
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+
+# Benchmarks publishing the marker feed and the map page for a synthetic
+# storm (50k outages by default): built up whole as strings and then
+# published, against written straight to the publisher a piece at a time
+# (generate_map.writeJSON and writeMapPage).  Reports the time and the
+# peak memory each takes on top of the feed itself, and checks they write
+# the same bytes.  Then runs generateMap itself over a synthetic site of
+# about as many outages, replayed with no network (see bench_replay), and
+# reports its time and peak memory as a whole.
+#
+# Usage: bench_render.py [outages ...]
+#
+# Needs secrets.py, like generate_map.py itself.  Linux only (reads
+# /proc/self/statm).
+
+import codecs
+import hashlib
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from StringIO import StringIO
+
+import bench_cluster
+import bench_replay
+import fakerge
+import generate_map
+import geoqueue
+import publish
+import scrape_rge
+
+from generate_map import json
+
+
+def rss():
+    fd = open('/proc/self/statm', 'r')
+    pages = int(fd.read().split()[1])
+    fd.close()
+    return pages * resource.getpagesize()
+
+
+def measure(func):
+    # Runs func in a child process.  Returns tuple of (seconds, bytes of
+    # memory used at the peak over what the child started with).
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        base = rss()
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - base
+        os.write(w, json.dumps([elapsed, peak]))
+        os._exit(0)
+    os.close(w)
+    result = json.loads(os.read(r, 1024))
+    os.close(r)
+    os.waitpid(pid, 0)
+    return result
+
+
+def page_args(feed):
+    summary = feed['summary']
+    lngs, lats = zip(*[f['geometry']['coordinates'] for f in feed['features']])
+    return ('apikey', lats, lngs, summary['asof'], summary['streets'],
+            summary['locales'], 'dev', 'dev')
+
+
+def whole(feed):
+    publisher = publish.Publisher()
+    publisher.publish(generate_map.FEED_FILE, generate_map.encodeJSON(feed))
+    page = StringIO()
+    generate_map.writeMapPage(page, *page_args(feed))
+    publisher.publish(generate_map.HTML_FILE, page.getvalue().encode('utf-8'))
+
+
+def streamed(feed):
+    publisher = publish.Publisher()
+    generate_map.publishJSON(publisher, generate_map.FEED_FILE, feed)
+    page = publisher.open(generate_map.HTML_FILE)
+    generate_map.writeMapPage(codecs.getwriter('utf-8')(page),
+                              *page_args(feed))
+    page.close()
+
+
+def generator_archive(outages):
+    # Archives a synthetic site of about that many outages as one run
+    pages = fakerge.synthetic_site(counties=4, towns=5, locations=5,
+                                   streets=max(1, outages // 100))
+    archive = scrape_rge.SnapshotArchive()
+    archive.begin(bench_replay.BASE_URL, time.time())
+    for name, content in pages.items():
+        archive.add(bench_replay.BASE_URL + name,
+                    hashlib.sha1(content).hexdigest(), content)
+    archive.finish()
+    return archive
+
+
+def generator(archive):
+    state = generate_map.MapState(archive=False)
+    state.geocoder = bench_replay.geocoder
+    generate_map.geocodeLimiter = geoqueue.TokenBucket(1e6, 1000)
+    try:
+        generate_map.replayRuns(state, archive, archive.runs(), StringIO())
+    finally:
+        state.close()
+
+
+def published():
+    # contents of what was published, for comparing
+    contents = {}
+    for name in os.listdir('.'):
+        fd = open(name, 'rb')
+        contents[name] = fd.read()
+        fd.close()
+        os.remove(name)
+    return contents
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [50000]
+
+    workdir = tempfile.mkdtemp(prefix='bench_render.')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        print "%8s %-9s %9s %9s %9s" % ("outages", "", "time", "peak mem",
+                                        "feed")
+        for outages in counts:
+            feed = bench_cluster.synthetic_feed(outages)
+            feed['summary']['locales'] = '<br/>'.join(
+                '<strong>Town %d</strong>:&nbsp;%d&nbsp;streets' % (i, i)
+                for i in range(200))
+
+            outputs = []
+            for name, func in (('whole', whole), ('streamed', streamed)):
+                elapsed, peak = measure(lambda: func(feed))
+                outputs.append(published())
+                print "%8d %-9s %8.3fs %8.1fM %8.1fM" % (
+                    outages, name, elapsed, peak / 1e6,
+                    len(outputs[-1][generate_map.FEED_FILE]) / 1e6)
+            if outputs[0] != outputs[1]:
+                sys.stderr.write("Outputs differ!\n")
+                sys.exit(1)
+
+            archive = generator_archive(outages)
+            elapsed, peak = measure(lambda: generator(archive))
+            archive.close()
+            contents = published()
+            print "%8d %-9s %8.3fs %8.1fM %8.1fM" % (
+                outages, "generator", elapsed, peak / 1e6,
+                len(contents[generate_map.FEED_FILE]) / 1e6)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+
+# Benchmarks the snapshot archive: archives a synthetic storm (a run every
+# 15 minutes, a few street pages changing each time), reports how small
+# the archive is against keeping every page of every run, then replays the
+# storm through the generator with no network and times it, with
+# incremental runs (see generate_map.INCREMENTAL) and without.
+#
+# Usage: bench_replay.py [runs [streets per location [runs per change]]]
+#
+# With runs per change above 1, that many runs in a row see the same pages,
+# as when RG&E updates its pages less often than they are polled.
+#
+# Needs secrets.py, like generate_map.py itself.  Runs in a scratch
+# directory.
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from StringIO import StringIO
+
+import fakerge
+import generate_map
+import geoqueue
+import scrape_rge
+
+BASE_URL = 'http://standin.invalid/'
+INTERVAL = 15*60
+
+# One page in CHANGED switches between two versions each run
+CHANGED = 10
+
+
+def storm(runs, streets, every=1):
+    # Yields a dictionary of pages for each run, changing every so many runs
+    calm = fakerge.synthetic_site(counties=4, towns=5, locations=5,
+                                  streets=streets, seed=0)
+    stormy = fakerge.synthetic_site(counties=4, towns=5, locations=5,
+                                    streets=streets, seed=1)
+    names = sorted(calm)
+    for run in range(runs):
+        step = run // every
+        yield dict((name, (i + step) % CHANGED and calm[name] or stormy[name])
+                   for i, name in enumerate(names))
+
+
+def geocoder(location, url=None):
+    # fetchGeocode, minus the network
+    data = fakerge.fake_geocode(location)
+    viewport = data['geometry']['viewport']
+    return { 'formattedaddress': data['formatted_address'],
+             'latitude': data['geometry']['location']['lat'],
+             'longitude': data['geometry']['location']['lng'],
+             'locationtype': data['geometry']['location_type'],
+             'viewport': (viewport['southwest']['lat'],
+                          viewport['southwest']['lng'],
+                          viewport['northeast']['lat'],
+                          viewport['northeast']['lng']) }
+
+
+if __name__ == '__main__':
+    runs = len(sys.argv) > 1 and int(sys.argv[1]) or 96
+    streets = len(sys.argv) > 2 and int(sys.argv[2]) or 10
+    every = len(sys.argv) > 3 and int(sys.argv[3]) or 1
+
+    workdir = tempfile.mkdtemp(prefix='bench_replay.')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        archive = scrape_rge.SnapshotArchive()
+        start = time.time()
+        then = time.time() - runs * INTERVAL
+        raw = 0
+        for i, pages in enumerate(storm(runs, streets, every)):
+            archive.begin(BASE_URL, then + i * INTERVAL)
+            for name, content in pages.items():
+                archive.add(BASE_URL + name, hashlib.sha1(content).hexdigest(),
+                            content)
+                raw += len(content)
+            archive.finish()
+        archived = time.time() - start
+        size = os.path.getsize(scrape_rge.SNAPSHOT_FILE)
+        print "%d runs of %d pages archived in %.2fs" % (runs, len(pages),
+                                                        archived)
+        print "raw %.1f MB, archive %.2f MB (%.1fx smaller)" % (
+            raw / 1e6, size / 1e6, float(raw) / size)
+
+        generate_map.geocodeLimiter = geoqueue.TokenBucket(1e6, 1000)
+        generate_map.RUN_REPORT_FILE = 'runreport.json'
+        for incremental in (False, True):
+            generate_map.INCREMENTAL = incremental
+            state = generate_map.MapState(archive=False)
+            state.geocoder = geocoder
+            try:
+                start = time.time()
+                generate_map.replayRuns(state, archive, archive.runs(),
+                                        StringIO())
+                elapsed = time.time() - start
+            finally:
+                state.close()
+            records = generate_map.readJSON(
+                generate_map.RUN_REPORT_FILE)['values']['records']
+            print ("replayed %d runs in %.2fs: %.1f runs/s, %.0f streets/s"
+                   " (%s; last run %d reused, %d recomputed)" % (
+                runs, elapsed, runs / elapsed,
+                runs * 4 * 5 * 5 * streets / elapsed,
+                incremental and "incremental" or "full",
+                records['reused'], records['recomputed']))
+            for name in os.listdir('.'):
+                if name != scrape_rge.SNAPSHOT_FILE:
+                    os.remove(name)
+        archive.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
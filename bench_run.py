@@ -0,0 +1,189 @@
+#!/usr/bin/python
+
+# End-to-end benchmarks: runs the whole generator against a local RG&E
+# stand-in and stub geocoder (see fakerge), for a few outage scenarios,
+# and times crawl_outages and the table parsers on their own as well.
+#
+# Each scenario is run cold (empty caches) and then warm (nothing has
+# changed, so pages come back 304 and every street is in the geocode
+# cache).  Stage timings come from the run report (see runreport).
+#
+# Usage: bench_run.py [--pages DIR] [--latency S] [--geolatency S]
+#                     [--save FILE] [--compare FILE] [scenario ...]
+#
+#   --pages DIR      adds a "recorded" scenario serving the saved pages in
+#                    DIR (which must include scrape_rge.START_URL)
+#   --latency S      page server latency, in seconds (default 0.005)
+#   --geolatency S   stub geocoder latency, in seconds (default 0.02)
+#   --save FILE      writes the timings to FILE, as JSON
+#   --compare FILE   shows timings against ones saved earlier, and exits
+#                    nonzero if anything got more than SLOWER times slower
+#
+# Scenarios are quiet, 1k and 20k (streets); quiet and 1k by default.
+#
+# Needs secrets.py, like generate_map.py itself.  Runs in a scratch
+# directory, so the real caches and output are left alone.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from StringIO import StringIO
+
+import fakerge
+import generate_map
+import geoqueue
+import scrape_rge
+
+from generate_map import json
+
+# name -> synthetic_site arguments (counties, towns, locations, streets)
+SCENARIOS = {
+    'quiet': (1, 2, 1, 3),
+    '1k': (4, 5, 5, 10),
+    '20k': (8, 10, 10, 25),
+}
+DEFAULT_SCENARIOS = ['quiet', '1k']
+
+LATENCY = 0.005
+GEO_LATENCY = 0.02
+
+# The stub geocoder is ours to hammer
+GEO_RATE = 1000
+GEO_BURST = 50
+GEO_CONCURRENCY = 16
+
+# Slowdown past which --compare calls it a regression, and timings too
+# short to judge
+SLOWER = 1.25
+NOISE = 0.05
+
+
+def run_generator(workdir, base_url):
+    # One generateMap run in workdir.  Returns wall time and the report.
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    generate_map.RUN_REPORT_FILE = 'runreport.json'
+    try:
+        state = generate_map.MapState()
+        state.base_url = base_url
+        try:
+            start = time.time()
+            generate_map.generateMap(state, StringIO())
+            elapsed = time.time() - start
+        finally:
+            state.close()
+        fd = open(generate_map.RUN_REPORT_FILE, 'r')
+        report = json.load(fd)
+        fd.close()
+    finally:
+        os.chdir(cwd)
+    return elapsed, report
+
+
+def run_scenario(pages, latency, geolatency):
+    """Benchmarks one site.  Returns dictionary of measure -> seconds."""
+    timings = {}
+    server = fakerge.StandinServer(pages, latency=latency).start()
+    geocoder = fakerge.StandinGeocoder(latency=geolatency).start()
+    workdir = tempfile.mkdtemp(prefix='bench_run.')
+    try:
+        # crawl_outages on its own, no caches
+        fetcher = scrape_rge.Fetcher()
+        start = time.time()
+        try:
+            scrape_rge.crawl_outages(server.base_url, scrape_rge.START_URL,
+                                     fetcher)
+        finally:
+            fetcher.close()
+        timings['crawl_outages'] = time.time() - start
+
+        # the parsers on their own
+        for parser in ('fast', 'soup'):
+            if parser == 'soup' and scrape_rge.BeautifulSoup is None:
+                continue
+            start = time.time()
+            for content in pages.values():
+                scrape_rge.parse_page(content, parser)
+            timings['parse_%s' % parser] = time.time() - start
+
+        # the whole generator, cold then warm
+        generate_map.GEOCODE_URL = geocoder.url
+        generate_map.geocodeLimiter = geoqueue.TokenBucket(GEO_RATE, GEO_BURST)
+        generate_map.GEOCODE_CONCURRENCY = GEO_CONCURRENCY
+        for run in ('cold', 'warm'):
+            elapsed, report = run_generator(workdir, server.base_url)
+            timings[run] = elapsed
+            for stage, times in report['stages'].items():
+                timings['%s.%s' % (run, stage)] = times['wall']
+    finally:
+        server.stop()
+        geocoder.stop()
+        shutil.rmtree(workdir)
+    return timings
+
+
+def compare(results, baseline):
+    """Prints results against baseline.  Returns the number of regressions."""
+    regressions = 0
+    for scenario in sorted(results):
+        for measure, seconds in sorted(results[scenario].items()):
+            before = baseline.get(scenario, {}).get(measure)
+            line = "%-8s %-26s %9.3fs" % (scenario, measure, seconds)
+            if before:
+                line += "  %9.3fs  %6.2fx" % (before, seconds / before)
+                if seconds > before * SLOWER and seconds - before > NOISE:
+                    line += "  SLOWER"
+                    regressions += 1
+            print line
+    return regressions
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    pagedir = save = baseline = None
+    latency = LATENCY
+    geolatency = GEO_LATENCY
+    while args[:1] in (['--pages'], ['--latency'], ['--geolatency'],
+                       ['--save'], ['--compare']):
+        if args[0] == '--pages':
+            pagedir = args[1]
+        elif args[0] == '--latency':
+            latency = float(args[1])
+        elif args[0] == '--geolatency':
+            geolatency = float(args[1])
+        elif args[0] == '--save':
+            save = args[1]
+        else:
+            fd = open(args[1], 'r')
+            baseline = json.load(fd)
+            fd.close()
+        args = args[2:]
+
+    sites = {}
+    for name in args or (pagedir is None and DEFAULT_SCENARIOS or []):
+        if name not in SCENARIOS:
+            sys.stderr.write("Unknown scenario %s; try %s\n"
+                             % (name, ', '.join(sorted(SCENARIOS))))
+            sys.exit(1)
+        counties, towns, locations, streets = SCENARIOS[name]
+        sites[name] = fakerge.synthetic_site(counties, towns, locations,
+                                             streets)
+    if pagedir is not None:
+        sites['recorded'] = fakerge.load_site(pagedir)
+
+    results = {}
+    for name, pages in sorted(sites.items()):
+        sys.stderr.write("%s: %d pages...\n" % (name, len(pages)))
+        results[name] = run_scenario(pages, latency, geolatency)
+
+    regressions = compare(results, baseline or {})
+
+    if save:
+        fd = open(save, 'w')
+        json.dump(results, fd, indent=1, sort_keys=True)
+        fd.close()
+
+    sys.exit(regressions and 1 or 0)
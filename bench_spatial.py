@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+# Benchmarks spatial.summarize against the bounding box loop
+# produceMapHeader used to run, over 1k, 10k and 100k synthetic outages
+# with a few strays, and checks that each gives the same answer with the
+# points shuffled.
+#
+# Usage: bench_spatial.py [points ...]
+#
+# Needs secrets.py, like generate_map.py itself.
+
+import random
+import sys
+import time
+
+import generate_map
+import spatial
+
+# Roughly the RG&E service area
+SOUTH, NORTH = 42.1, 43.4
+WEST, EAST = -78.9, -76.1
+
+
+def old_summary(lats, lngs):
+    # produceMapHeader's loop and zoom ladder, before spatial
+    minLat = 44.9
+    maxLat = 42.1
+    minLng = -76.1
+    maxLng = -78.9
+    for lat, lng in zip(lats, lngs):
+        if generate_map.distance_on_unit_sphere((minLat+maxLat)/2, (minLng+maxLng)/2, lat, lng)*3960 < 30:
+            minLat = min(lat, minLat)
+            maxLat = max(lat, maxLat)
+            minLng = min(lng, minLng)
+            maxLng = max(lng, maxLng)
+    distance = generate_map.distance_on_unit_sphere(minLat, minLng, maxLat, maxLng) * 3960
+    if distance < 5:
+        zoom = 15
+    elif distance < 8:
+        zoom = 13
+    elif distance < 13:
+        zoom = 12
+    elif distance < 29:
+        zoom = 11
+    elif distance < 35:
+        zoom = 10
+    else:
+        zoom = 9
+    return minLat, minLng, maxLat, maxLng, zoom
+
+
+def new_summary(lats, lngs):
+    s = spatial.summarize(lats, lngs)
+    return s['south'], s['west'], s['north'], s['east'], s['zoom']
+
+
+def synthetic_points(count, seed=1):
+    # a storm around a handful of towns, plus the odd geocoding blunder
+    rnd = random.Random(seed)
+    towns = [(rnd.gauss(43.15, 0.1), rnd.gauss(-77.6, 0.15))
+             for i in range(12)]
+    lats = []
+    lngs = []
+    for i in range(count):
+        if rnd.random() < 0.01:
+            lats.append(rnd.uniform(SOUTH - 2, NORTH + 2))
+            lngs.append(rnd.uniform(WEST - 2, EAST + 2))
+        else:
+            lat, lng = rnd.choice(towns)
+            lats.append(rnd.gauss(lat, 0.02))
+            lngs.append(rnd.gauss(lng, 0.03))
+    return lats, lngs
+
+
+def timed(func, lats, lngs):
+    start = time.time()
+    result = func(lats, lngs)
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    numpy = spatial.numpy
+
+    methods = [('old loop', old_summary)]
+    if numpy is not None:
+        methods.append(('numpy', new_summary))
+    methods.append(('python', new_summary))
+
+    print "%8s %-9s %9s %6s %5s  %s" % ("points", "method", "time",
+                                        "speed", "zoom", "order-independent")
+    for count in counts:
+        lats, lngs = synthetic_points(count)
+        order = range(count)
+        random.Random(2).shuffle(order)
+        shuffled = ([lats[i] for i in order], [lngs[i] for i in order])
+
+        baseline = None
+        for name, func in methods:
+            spatial.numpy = name != 'python' and numpy or None
+            result, elapsed = timed(func, lats, lngs)
+            again, _ = timed(func, *shuffled)
+            if baseline is None:
+                baseline = elapsed
+            print "%8d %-9s %8.4fs %5.1fx %5d  %s" % (
+                count, name, elapsed, baseline / elapsed, result[4],
+                result == again and "yes" or "no")
+    spatial.numpy = numpy
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+
+# Reports the geocode cache hit rate with and without street name
+# normalization over a corpus of outage runs.
+#
+# Usage: bench_streetnames.py [data.json ...]
+#
+# Each data.json (as written by generate_map.py) is taken as one run, in
+# order, against a cache that starts empty.  With no arguments, a built-in
+# sample of spellings seen on RG&E's pages is used.
+
+import sys
+import time
+
+try:
+    import json
+except:
+    import simplejson as json
+
+import streetnames
+
+SAMPLE = [
+    ('ROCHESTER', 'ROCHESTER', ['MAIN ST', 'MAIN STREET', 'N MAIN ST',
+                                'NORTH MAIN ST', 'EAST AVE', 'EAST AVENUE',
+                                'MONROE AVE', 'MONROE AV', 'ST PAUL ST',
+                                'ST PAUL STREET', 'LAKE AVE', 'LAKE AVENUE',
+                                'CULVER RD', 'CULVER ROAD', 'ELMWOOD AVE']),
+    ('PENFIELD', 'PENFIELD', ['FIVE MILE LINE RD', 'FIVE MILE LINE ROAD',
+                              'BAIRD RD', 'PENFIELD CENTER RD',
+                              'HIGH POINT LA', 'HIGH POINT LANE',
+                              'HIGH POINT LN', 'SHADOW PINES CI',
+                              'SHADOW PINES CIRCLE']),
+    ('MENDON', 'HONEOYE%20FL', ['EAST ST', 'EAST STREET', 'W MAIN ST',
+                                'WEST MAIN STREET', 'N MAIN ST']),
+    ('MENDON', 'HONEOYE FALLS', ['EAST ST', 'W MAIN ST', 'MONROE ST']),
+    ('BRIGHTON', 'BRIGHTON', ['LAC DE VILLE BL', 'LAC DE VILLE BLVD',
+                              'LAC DE VILLE BOULEVARD', 'ELMWOOD TERR',
+                              'ELMWOOD TERRACE', 'HIGHLAND PKW',
+                              'HIGHLAND PARKWAY']),
+]
+
+
+def old_key(town, location, street):
+    # generate_map.geocode's key before normalization
+    town = town.lower().strip()
+    location = location and location.lower().strip() or town
+    street = street.lower().strip()
+    if street.endswith(' la'):
+        street += 'ne'
+    return (town, location, street)
+
+
+def new_key(town, location, street):
+    town = streetnames.normalize_place(town)
+    location = location and streetnames.normalize_place(location) or town
+    return (town, location, streetnames.normalize_street(street))
+
+
+def load_runs(filenames):
+    runs = []
+    for filename in filenames:
+        fd = open(filename, 'r')
+        data = json.load(fd)
+        fd.close()
+        runs.append([(town, location, street)
+                     for county in data.values()
+                     for town, locations in county.items()
+                     for location, streets in locations.items()
+                     for street in streets])
+    return runs
+
+
+def hit_rate(runs, keyfunc):
+    cache = set()
+    lookups = hits = 0
+    for run in runs:
+        for town, location, street in run:
+            key = keyfunc(town, location, street)
+            lookups += 1
+            if key in cache:
+                hits += 1
+            cache.add(key)
+    return lookups, hits, len(cache)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        runs = load_runs(sys.argv[1:])
+    else:
+        runs = [[(town, location, street) for town, location, streets in SAMPLE
+                 for street in streets]]
+
+    for name, keyfunc in (('before', old_key), ('after', new_key)):
+        start = time.time()
+        lookups, hits, keys = hit_rate(runs, keyfunc)
+        elapsed = time.time() - start
+        print "%-7s %6d lookups  %6d keys  %5.1f%% hits  %.1f us/key" % (
+            name, lookups, keys, 100.0 * hits / max(lookups, 1),
+            1e6 * elapsed / max(lookups, 1))
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+# Server-side marker clustering, so the map never has to build a marker for
+# every outage in a big storm.
+#
+# Points are bucketed on a grid of GRID_SIZE pixels in the map's own
+# (Web Mercator) pixel space.  Grid cells at one zoom level are exactly
+# four cells of the next, so the points are only projected once, at the
+# deepest zoom, and each shallower level is made by merging the one below.
+#
+# A cluster is a list of [latitude, longitude, count, customers without
+# power, total customers, oldest first report, id]: the position is the
+# mean of its points, the oldest first report is None if none of them has
+# one, and id is the point's own ID when it is alone (and None otherwise),
+# so the map can show the real marker instead.
+
+import math
+
+TILE_SIZE = 256
+
+# Grid cell size, in pixels; the same as Google's MarkerClusterer uses
+GRID_SIZE = 60
+
+
+def project(lat, lng, zoom):
+    """Returns (x, y) world pixel coordinates of a point at a zoom level.
+
+    >>> project(0, 0, 0)
+    (128.0, 128.0)
+    >>> [int(c) for c in project(43.15, -77.6, 10)]
+    [74565, 96175]
+    """
+    scale = TILE_SIZE * 2**zoom
+    siny = min(max(math.sin(math.radians(lat)), -0.9999), 0.9999)
+    return ((lng + 180.0) / 360.0 * scale,
+            (0.5 - math.log((1 + siny) / (1 - siny)) / (4 * math.pi)) * scale)
+
+
+def _cells(points, zoom, grid):
+    # cell -> [sum lat, sum lng, count, without, total, oldest, id]
+    cells = {}
+    for lat, lng, without, total, firstreport, id in points:
+        x, y = project(lat, lng, zoom)
+        key = (int(x // grid), int(y // grid))
+        cell = cells.get(key)
+        if firstreport <= 0:
+            firstreport = None
+        if cell is None:
+            cells[key] = [lat, lng, 1, without, total, firstreport, id]
+        else:
+            cell[0] += lat
+            cell[1] += lng
+            cell[2] += 1
+            cell[3] += without
+            cell[4] += total
+            if firstreport is not None and (cell[5] is None or firstreport < cell[5]):
+                cell[5] = firstreport
+            cell[6] = None
+    return cells
+
+
+def _merge(cells):
+    parents = {}
+    for (cx, cy), cell in cells.items():
+        key = (cx >> 1, cy >> 1)
+        parent = parents.get(key)
+        if parent is None:
+            parents[key] = list(cell)
+        else:
+            parent[0] += cell[0]
+            parent[1] += cell[1]
+            parent[2] += cell[2]
+            parent[3] += cell[3]
+            parent[4] += cell[4]
+            if cell[5] is not None and (parent[5] is None or cell[5] < parent[5]):
+                parent[5] = cell[5]
+            parent[6] = None
+    return parents
+
+
+def _clusters(cells):
+    # in cell order, so the same points always make the same file
+    return [[round(cells[key][0] / cells[key][2], 6),
+             round(cells[key][1] / cells[key][2], 6)] + cells[key][2:]
+            for key in sorted(cells)]
+
+
+def cluster_zooms(points, minzoom, maxzoom, grid=GRID_SIZE):
+    """Clusters points at each zoom level from minzoom to maxzoom.
+
+    points is an iterable of (latitude, longitude, customers without power,
+    total customers, first report time, id); first report times of zero or
+    less are taken as unknown.
+
+    Returns dictionary of zoom level -> list of clusters.
+
+    >>> levels = cluster_zooms([(43.1, -77.6, 5, 10, -1, 'a'),
+    ...                         (43.1, -77.6, 1, 20, 1000, 'b'),
+    ...                         (43.3, -77.2, 2, 30, -1, 'c')], 8, 8)
+    >>> [c[2:] for c in levels[8]]
+    [[2, 6, 30, 1000, None], [1, 2, 30, None, 'c']]
+    """
+    cells = _cells(points, maxzoom, grid)
+    levels = {maxzoom: _clusters(cells)}
+    for zoom in range(maxzoom - 1, minzoom - 1, -1):
+        cells = _merge(cells)
+        levels[zoom] = _clusters(cells)
+    return levels
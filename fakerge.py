@@ -0,0 +1,340 @@
+#!/usr/bin/python
+
+# Local stand-ins for the RG&E outage report site and the Google geocoder,
+# for benchmarking without hitting the real things.
+#
+# StandinServer serves either a synthetic county/town/location/street tree
+# or a directory of saved pages, over HTTP/1.1 with keep-alive, ETags,
+# optional latency, and pages that stall or fail on demand.
+# StandinGeocoder answers geocoding requests in the Google JSON format,
+# with optional latency and injected failures.
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urlparse
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+SUFFIXES = ['ST', 'AVE', 'RD', 'DR', 'LA', 'PL', 'BLVD', 'CIR', 'TER', 'PKWY']
+NAMES = ['MAIN', 'ELM', 'PARK', 'LAKE', 'EAST', 'WEST', 'CULVER', 'MONROE',
+         'CLINTON', 'GENESEE', 'WINTON', 'BROOKS', 'CHILI', 'RIDGE', 'DEWEY',
+         'EMERSON', 'HUDSON', 'JOSEPH', 'PORTLAND', 'STONE', 'ELMWOOD', 'AVON']
+
+
+def _fmt(num):
+    return '{:,}'.format(num)
+
+
+def _table(headings, rows):
+    out = ['<table border="1">']
+    out.append('<tr>' + ''.join('<th>%s</th>' % h for h in headings) + '</tr>')
+    for row in rows:
+        out.append('<tr>' + ''.join('<td>%s</td>' % c for c in row) + '</tr>')
+    out.append('</table>')
+    return '\n'.join(out)
+
+
+def _page(title, table):
+    return """<html>
+<head><title>%s</title></head>
+<body>
+<h2>%s</h2>
+%s
+<p>Updated %s</p>
+</body>
+</html>
+""" % (title, title, table, time.strftime('%m/%d/%Y %I:%M %p'))
+
+
+def _link(href, text):
+    return '<a href="%s">%s</a>' % (href, text)
+
+
+def synthetic_site(counties=2, towns=4, locations=3, streets=10,
+                   start_url='RGE.html', seed=0):
+    """Builds a synthetic RG&E-style outage site.
+
+    Returns dictionary of page name to HTML, starting at start_url.
+    """
+
+    rand = random.Random(seed)
+    pages = {}
+    heading = ['Name', 'Total Customers', 'Customers Without Power']
+    back = [_link(start_url, 'Back to RG&amp;E'), '&nbsp;', '&nbsp;']
+
+    countyrows = []
+    for ci in range(counties):
+        county = 'County%d' % ci
+        countyfile = '%s.html' % county
+        countytotal = countyout = 0
+        townrows = []
+        for ti in range(towns):
+            town = '%s Town%d' % (county, ti)
+            townfile = 'C%dT%d.html' % (ci, ti)
+            towntotal = townout = 0
+            locationrows = []
+            for li in range(locations):
+                location = '%s Loc%d' % (town, li)
+                locationfile = 'C%dT%dL%d.html' % (ci, ti, li)
+                streetrows = []
+                loctotal = locout = 0
+                for si in range(streets):
+                    street = '%s %d %s' % (rand.choice(NAMES), si,
+                                           rand.choice(SUFFIXES))
+                    total = rand.randint(5, 400)
+                    out = rand.randint(1, total)
+                    loctotal += total
+                    locout += out
+                    streetrows.append([street, _fmt(total), _fmt(out),
+                                       rand.choice(['Unknown',
+                                                    'Assessing',
+                                                    '10/18 11:00 PM'])])
+                streetrows.append([_link(countyfile, 'Back to county'),
+                                   '&nbsp;', '&nbsp;'])
+                streetrows.append(back)
+                pages[locationfile] = _page(
+                    location, _table(['Street', 'Total Customers',
+                                      'Customers Without Power',
+                                      'Estimated Restoration'], streetrows))
+                locationrows.append([_link(locationfile, location),
+                                     _fmt(loctotal), _fmt(locout)])
+                towntotal += loctotal
+                townout += locout
+            locationrows.append(back)
+            pages[townfile] = _page(town, _table(heading, locationrows))
+            townrows.append([_link(townfile, town), _fmt(towntotal),
+                             _fmt(townout)])
+            countytotal += towntotal
+            countyout += townout
+        townrows.append(back)
+        pages[countyfile] = _page(county, _table(heading, townrows))
+        countyrows.append([_link(countyfile, county), _fmt(countytotal),
+                           _fmt(countyout)])
+
+    countyrows.append([_link('http://www.rge.com/', 'RG&amp;E Home'),
+                       '&nbsp;', '&nbsp;'])
+    countyrows.append(['&nbsp;', '&nbsp;', '&nbsp;'])
+    pages[start_url] = _page('RG&amp;E Outage Report',
+                             _table(heading, countyrows))
+    return pages
+
+
+def load_site(directory):
+    """Loads a directory of saved pages.
+
+    Returns dictionary of file name to HTML.
+    """
+
+    pages = {}
+    for name in os.listdir(directory):
+        if name.lower().endswith('.html'):
+            fd = open(os.path.join(directory, name), 'r')
+            pages[name] = fd.read()
+            fd.close()
+    return pages
+
+
+def save_site(pages, directory):
+    """Writes a dictionary of pages out to a directory."""
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name, content in pages.items():
+        fd = open(os.path.join(directory, name), 'w')
+        fd.write(content)
+        fd.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        name = self.path.lstrip('/').split('?')[0]
+        if name in server.stalls:
+            time.sleep(server.stalls[name])
+        if name in server.errors:
+            self.send_response(server.errors[name])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        content = server.pages.get(name)
+        if content is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def fake_geocode(address):
+    """Makes up a stable geocoding result for an address in the Rochester
+    area.  Returns the Google-style result dictionary."""
+
+    h = int(hashlib.md5(address).hexdigest()[:8], 16)
+    lat = 42.9 + (h % 1000) / 2500.0
+    lng = -77.9 + ((h >> 10) % 1000) / 1600.0
+    return {
+        'formatted_address': address.upper(),
+        'geometry': {
+            'location': {'lat': lat, 'lng': lng},
+            'location_type': h % 4 and 'GEOMETRIC_CENTER' or 'APPROXIMATE',
+            'viewport': {
+                'southwest': {'lat': lat - 0.005, 'lng': lng - 0.005},
+                'northeast': {'lat': lat + 0.005, 'lng': lng + 0.005},
+                },
+            },
+        }
+
+
+class _GeocodeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            roll = server.random.random()
+        if server.latency:
+            time.sleep(server.latency)
+
+        query = urlparse.parse_qs(urlparse.urlsplit(self.path).query)
+        address = query.get('address', [''])[0]
+
+        if roll < server.error_rate:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        roll -= server.error_rate
+        if roll < server.overlimit_rate:
+            body = {'status': 'OVER_QUERY_LIMIT', 'results': []}
+        elif 'NOWHERE' in address.upper():
+            body = {'status': 'ZERO_RESULTS', 'results': []}
+        else:
+            body = {'status': 'OK', 'results': [fake_geocode(address)]}
+
+        content = json.dumps(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandinServer(object):
+    """Serves a dictionary of pages on localhost in a background thread.
+
+    latency is the delay, in seconds, added to every response.  stalls
+    and errors are dictionaries of page name -> further delay, in
+    seconds, and page name -> HTTP status to answer with instead of the
+    page; both can be changed while it runs.
+    """
+
+    handler = _Handler
+
+    def __init__(self, pages, latency=0.0, port=0):
+        self.httpd = _ThreadingServer(('127.0.0.1', port), self.handler)
+        self.httpd.pages = pages
+        self.httpd.latency = latency
+        self.httpd.stalls = {}
+        self.httpd.errors = {}
+        self.httpd.requests = 0
+        self.httpd.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d/' % self.httpd.server_address[1]
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def stalls(self):
+        return self.httpd.stalls
+
+    @property
+    def errors(self):
+        return self.httpd.errors
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StandinGeocoder(StandinServer):
+    """Answers Google-style geocoding requests on localhost.
+
+    Addresses containing NOWHERE get ZERO_RESULTS.  Of the rest, a fraction
+    error_rate fail with HTTP 500 and overlimit_rate get OVER_QUERY_LIMIT.
+    url is the value for generate_map.GEOCODE_URL.
+    """
+
+    handler = _GeocodeHandler
+
+    def __init__(self, latency=0.0, error_rate=0.0, overlimit_rate=0.0,
+                 port=0, seed=0):
+        StandinServer.__init__(self, {}, latency, port)
+        self.httpd.error_rate = error_rate
+        self.httpd.overlimit_rate = overlimit_rate
+        self.httpd.random = random.Random(seed)
+
+    @property
+    def url(self):
+        return self.base_url + 'json'
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        sys.stderr.write("Usage: %s outputdir  (writes a synthetic site)\n"
+                         % sys.argv[0])
+        sys.exit(1)
+    save_site(synthetic_site(), sys.argv[1])
@@ -2,23 +2,15 @@
 
 BASEDIR=/var/www/hoopycat.com/html/rgeoutages/
 GENERATOR=$BASEDIR/generate_map.py
-HTMLFILE=$BASEDIR/index.html
+# The generator's whole log; kept out of BASEDIR, which is served to anyone
+LOGFILE=/var/tmp/rgeoutages-lastrun.log
 export TZ=America/New_York
 
 # Test for sanity
 [ -d "$BASEDIR" ] || (echo "Base directory missing: $BASEDIR"; exit 1)
 [ -x "$GENERATOR" ] || (echo "Generator script not executable: $GENERATOR"; exit 1)
 
-# All together now
+# All together now; the generator publishes index.html and friends itself,
+# leaving alone whatever hasn't changed
 cd $BASEDIR
-TEMPFILE=`tempfile`
-$GENERATOR > $TEMPFILE
-
-if [ -n "`cat $TEMPFILE`" ]; then
-    cp $TEMPFILE $HTMLFILE
-else
-    echo "$TEMPFILE was empty, utoh"
-fi
-
-rm $TEMPFILE
-
+$GENERATOR > $LOGFILE 2>&1 || (echo "Generator failed, see $LOGFILE"; exit 1)
@@ -1,10 +1,15 @@
 #!/usr/bin/python
 # vim: set fileencoding=utf-8 :
 
+import codecs
+import fcntl
 import math
 import os
+import signal
 import sqlite3
+import StringIO
 import sys
+import threading
 import time
 import urllib
 import urllib2
@@ -22,18 +27,170 @@ except:
     sys.stderr.write("You need to create a secrets.py file with a Google Maps API key.")
     sys.exit(1)
 
+import clusters
+import geoqueue
+import localgeo
+import metrics
+import nearby
+import outagehistory
+import outagerecords
+import publish
+import runreport
 import scrape_rge
+import spatial
+import streetnames
+import template
+
+
+# How long a geocoding result is good for, in seconds
+GEOCODE_TTL = 7*24*60*60
+
+# How many new geocoding results to hold before writing them out
+GEOCODE_BATCH = 100
+
+# Where geocoding requests go, and how hard we may lean on it: requests
+# per second, burst size, and requests in flight at once
+GEOCODE_URL = "http://maps.googleapis.com/maps/api/geocode/json"
+GEOCODE_RATE = 10
+GEOCODE_BURST = 5
+GEOCODE_CONCURRENCY = 4
+
+# Seconds a geocoding request may take
+GEOCODE_TIMEOUT = 15
+
+# Seconds a run may spend fetching RG&E's pages (see scrape_rge.Fetcher);
+# pages not fetched by then are taken from the last good copy, marked
+# stale, so the map still goes out on time
+CRAWL_DEADLINE = 5*60
+
+# Geocoder answers that mean the address itself is no good.  Those are
+# remembered for NEGATIVE_TTL, doubling with each repeat up to
+# NEGATIVE_MAX_TTL; anything else (timeouts, OVER_QUERY_LIMIT...) is
+# taken as the geocoder's problem and slows down every request instead.
+NEGATIVE_STATUSES = ('ZERO_RESULTS', 'INVALID_REQUEST')
+NEGATIVE_TTL = 6*60*60
+NEGATIVE_MAX_TTL = 7*24*60*60
+
+# Street centroid table for offline geocoding (see localgeo); used, ahead
+# of the Google, if it exists
+LOCALGEO_FILE = localgeo.DEFAULT_FILE
+
+# Where every crawl is archived for replaying (see
+# scrape_rge.SnapshotArchive), or None not to keep them.  The archive
+# holds every page RG&E served, so it goes outside the web root (say,
+# /var/lib/rgeoutages/snapshots.sqlite3), rather than beside index.html,
+# where anyone could download it.
+SNAPSHOT_FILE = None
+
+# Marker feed the map loads, and the changes since the previous run that
+# it polls for every FEED_POLL seconds
+FEED_FILE = 'markers.json'
+DELTA_FILE = 'markers.delta.json'
+FEED_POLL = 5*60
+
+# Marker clusters for each zoom level up to CLUSTER_MAX_ZOOM (see
+# clusters); the map shows the markers themselves past that, and
+# CLUSTER_MIN_ZOOM's clusters when zoomed further out than that
+CLUSTER_FILE = 'clusters.%d.json'
+CLUSTER_MIN_ZOOM = 6
+CLUSTER_MAX_ZOOM = 14
+
+# Zoom level the map goes to, at least, when a town in the list of towns
+# is clicked; the map centers on the town's outages (see
+# spatial.town_centroids)
+TOWN_ZOOM = 13
+
+# Per-run metrics (see metrics): Prometheus text, and munin plugin values
+# and config.  The Prometheus file is for node_exporter's textfile
+# collector, so it goes wherever that reads from (say,
+# /var/lib/node_exporter/textfile_collector/rgeoutages.prom), rather than
+# beside index.html, where anyone could read it; None for none.
+METRICS_FILE = None
+MUNIN_FILE = 'metrics.munin'
+MUNIN_CONFIG_FILE = 'metrics.munin.config'
+
+# Where each run's timings and counts (see runreport) go, or None for no
+# report; and whether to put the report in the page as well, as an HTML
+# comment (which means the page changes every run).  The report has every
+# URL fetched and how long it took, so it goes outside the web root (say,
+# /var/lib/rgeoutages/runreport.json), like METRICS_FILE.
+RUN_REPORT_FILE = None
+RUN_REPORT_IN_PAGE = False
+
+# The map page, and the outage data as scraped; published (see publish)
+# with the other files the map uses, big JSON files JSON_CHUNK list items
+# at a time
+HTML_FILE = 'index.html'
+DATA_FILE = 'data.json'
+JSON_CHUNK = 1000
+
+# Incremental runs: a street that hasn't changed since the previous run in
+# this process keeps its geocode result and marker (or the geocoder's
+# saying there's no such address; see NEGATIVE_STATUSES), rather than
+# having them worked out again, for up to INCREMENTAL_MAX_AGE seconds; and
+# if no street has changed, the marker feed, its clusters and data.json
+# are left as last published, rather than being made and encoded again
+INCREMENTAL = True
+INCREMENTAL_MAX_AGE = 6*60*60
+
+# Daemon mode (generate_map.py daemon): the lock that keeps runs from
+# overlapping, and the bounds on the time between runs
+LOCK_FILE = 'generate_map.lock'
+DAEMON_MIN_INTERVAL = 2*60
+DAEMON_MAX_INTERVAL = 15*60
+
+# Daemon mode answers "outages near me" queries (see nearby) on
+# QUERY_HOST:QUERY_PORT from the last run's outages, if QUERY_PORT is set
+QUERY_PORT = None
+QUERY_HOST = nearby.HOST
+
+# Where first report times were kept before outagehistory; read once
+HISTORY_FILE = 'history.json'
+
+# Shared by every geocoding request this process makes
+geocodeLimiter = geoqueue.TokenBucket(GEOCODE_RATE, GEOCODE_BURST)
+
+
+class GeocodeError(Exception):
+    """The geocoder answered without a result; status is its status code."""
+
+    def __init__(self, status, message=None):
+        Exception.__init__(self, message or "Empty results string: " + status)
+        self.status = status
+
+
+def isNegative(error):
+    """Tells whether a geocoding failure says the address itself is bad."""
+    return isinstance(error, GeocodeError) and error.status in NEGATIVE_STATUSES
+
+
+def negativeTTL(failures):
+    """How long to hold off on an address after its nth bad answer.
+
+    >>> negativeTTL(1) == NEGATIVE_TTL, negativeTTL(3) == 4*NEGATIVE_TTL
+    (True, True)
+    >>> negativeTTL(100) == NEGATIVE_MAX_TTL
+    True
+    """
+    return min(NEGATIVE_TTL * 2**min(failures-1, 32), NEGATIVE_MAX_TTL)
 
 
 def initDB(filename="rgeoutages.sqlite3"):
     """Connect to and initialize the cache database.
 
+    Older databases may hold several rows per street; those are reduced to
+    the most recent one before the unique index is built.  Databases from
+    before street name normalization are re-keyed (see rekeyCache), and
+    first report times are taken from HISTORY_FILE for databases from
+    before outagehistory.
+
     Optional: Filename of database
     Returns: db object
     """
 
     db = sqlite3.connect(filename)
     c = db.cursor()
+    c.execute('pragma journal_mode=wal')
     c.execute('pragma table_info(geocodecache2)')
     columns = ' '.join(i[1] for i in c.fetchall()).split()
     if columns == []:
@@ -44,11 +201,246 @@ def initDB(filename="rgeoutages.sqlite3"):
              lastcheck integer, viewport text)""")
         db.commit()
 
+    c.execute("""create table if not exists geocodefail
+        (town text, location text, streetname text, status text,
+         failures integer, retryafter integer,
+         primary key (town, location, streetname))""")
+
+    c.execute('pragma index_list(geocodecache2)')
+    if 'geocodecache2_key' not in [i[1] for i in c.fetchall()]:
+        # drop all but the newest row for each street
+        c.execute("""select rowid, town, location, streetname, lastcheck
+                     from geocodecache2""")
+        newest = {}
+        for rowid, town, location, streetname, lastcheck in c.fetchall():
+            key = (town, location, streetname)
+            if key not in newest or (lastcheck, rowid) > newest[key]:
+                newest[key] = (lastcheck, rowid)
+        keep = set(rowid for lastcheck, rowid in newest.values())
+        c.execute('select rowid from geocodecache2')
+        c.executemany('delete from geocodecache2 where rowid=?',
+                      [r for r in c.fetchall() if r[0] not in keep])
+        c.execute("""create unique index geocodecache2_key
+                     on geocodecache2 (town, location, streetname)""")
+        db.commit()
+
+    outagehistory.create_tables(db)
+
+    c.execute('pragma user_version')
+    version = c.fetchone()[0]
+    if version < 1:
+        rekeyCache(db)
+        c.execute('pragma user_version = 1')
+        db.commit()
+    if version < 2:
+        if os.path.exists(HISTORY_FILE):
+            outagehistory.import_json(db, HISTORY_FILE)
+        c.execute('pragma user_version = 2')
+        db.commit()
+
     return db
 
 
-def fetchGeocode(location):
-    """Fetches geocoding information.
+def rekeyCache(db):
+    """Rewrites the geocode cache's keys with the current street and place
+    name normalization.  Where several old keys become one, the newest
+    result (and the longest failure backoff) is kept.
+    """
+
+    c = db.cursor()
+    for table, columns, newer in (
+            ('geocodecache2', 'latitude, longitude, formattedaddress, locationtype, lastcheck, viewport', 4),
+            ('geocodefail', 'status, failures, retryafter', 2)):
+        c.execute('select town, location, streetname, %s from %s'
+                  % (columns, table))
+        rows = {}
+        for row in c.fetchall():
+            key = (streetnames.normalize_place(row[0]),
+                   streetnames.normalize_place(row[1]),
+                   streetnames.normalize_street(row[2]))
+            if key not in rows or row[3+newer] > rows[key][newer]:
+                rows[key] = row[3:]
+        c.execute('delete from %s' % table)
+        c.executemany('insert into %s (town, location, streetname, %s) values (%s)'
+                      % (table, columns, ','.join('?' * (len(columns.split(',')) + 3))),
+                      [key + value for key, value in rows.items()])
+    db.commit()
+
+
+def isFresh(lastcheck, now=None):
+    """Tells whether a cache entry checked at lastcheck is still good.
+
+    >>> isFresh(1000, now=1000 + GEOCODE_TTL - 1)
+    True
+    >>> isFresh(1000, now=1000 + GEOCODE_TTL)
+    False
+    """
+
+    if now is None:
+        now = time.time()
+    return lastcheck > now - GEOCODE_TTL
+
+
+class GeocodeCache(object):
+    """In-memory view of geocodecache2 and geocodefail, written back in
+    batches.
+
+    preload() reads both tables in one query apiece; put() and putFailure()
+    queue changes, which are written in a single transaction by flush()
+    (called automatically every GEOCODE_BATCH changes).  If local (a
+    localgeo.LocalGeocoder) is given, it answers whatever the cache can't
+    before the Google is asked.
+
+    stats counts lookups answered from the cache ('hits'), from the local
+    table ('local'), sent to the geocoder ('fetched'), failed ('failed'),
+    answered with a stale entry after failing ('stale'), and not attempted
+    because the address failed recently or the geocoder is being backed
+    off ('suppressed').
+    """
+
+    def __init__(self, db, local=None):
+        self.db = db
+        self.local = local
+        self.entries = {}
+        self.failures = {}
+        self.pending = {}
+        self.pendingfailures = {}
+        self.stats = dict.fromkeys(('hits', 'local', 'fetched', 'failed',
+                                    'stale', 'suppressed'), 0)
+
+    def preload(self):
+        c = self.db.cursor()
+        c.execute("""select town, location, streetname, latitude, longitude,
+                            formattedaddress, locationtype, viewport,
+                            lastcheck
+                     from geocodecache2""")
+        for (town, location, street, latitude, longitude, formattedaddress,
+             locationtype, viewport_json, lastcheck) in c.fetchall():
+            self.entries[(town, location, street)] = (
+                { 'formattedaddress': formattedaddress,
+                  'latitude': latitude,
+                  'longitude': longitude,
+                  'locationtype': locationtype,
+                  'viewport': tuple(json.loads(viewport_json)) },
+                lastcheck)
+        c.execute("""select town, location, streetname, status, failures,
+                            retryafter
+                     from geocodefail""")
+        for town, location, street, status, failures, retryafter in c.fetchall():
+            self.failures[(town, location, street)] = (status, failures,
+                                                       retryafter)
+
+    def get(self, key):
+        """Returns tuple of (result dictionary, lastcheck), or None."""
+        return self.entries.get(key)
+
+    def getFailure(self, key):
+        """Returns tuple of (status, failures, retryafter), or None."""
+        return self.failures.get(key)
+
+    def put(self, key, result, lastcheck=None):
+        if lastcheck is None:
+            lastcheck = time.time()
+        self.entries[key] = (result, lastcheck)
+        self.pending[key] = (result, lastcheck)
+        if key in self.failures:
+            del self.failures[key]
+            self.pendingfailures[key] = None
+        self._written()
+
+    def putFailure(self, key, status):
+        previous = self.failures.get(key)
+        failures = previous and previous[1] + 1 or 1
+        entry = (status, failures, time.time() + negativeTTL(failures))
+        self.failures[key] = entry
+        self.pendingfailures[key] = entry
+        self._written()
+
+    def _written(self):
+        if len(self.pending) + len(self.pendingfailures) >= GEOCODE_BATCH:
+            self.flush()
+
+    def check(self, key):
+        """Looks a street up before going to the geocoder.
+
+        Returns tuple of (result, error): a copy of a fresh cached result
+        or the local table's answer, or a GeocodeError if the street failed
+        recently and has no older result to fall back on, or (None, None)
+        if it should be fetched.
+        """
+        cached = self.entries.get(key)
+        if cached and isFresh(cached[1]):
+            self.stats['hits'] += 1
+            return dict(cached[0]), None
+        if self.local is not None:
+            town, location, street = key
+            result = self.local.lookup(street, location, town)
+            if result is not None:
+                self.stats['local'] += 1
+                return result, None
+        failure = self.failures.get(key)
+        if failure and failure[2] > time.time():
+            self.stats['suppressed'] += 1
+            if cached:
+                return dict(cached[0]), None
+            return None, GeocodeError(failure[0], "Empty results string: %s (%d times; retry after %s)" % (failure[0], failure[1], time.asctime(time.localtime(failure[2]))))
+        return None, None
+
+    def settle(self, key, result, error):
+        """Records the geocoder's answer for a street.  Bad addresses are
+        remembered; on any failure a stale result is used if there is one.
+
+        Returns tuple of (result, error) as for check().
+        """
+        if isinstance(error, geoqueue.HeldOff):
+            self.stats['suppressed'] += 1
+        else:
+            self.stats['fetched'] += 1
+        if error is None:
+            self.put(key, result)
+            return dict(result), None
+        if not isinstance(error, geoqueue.HeldOff):
+            self.stats['failed'] += 1
+        if isNegative(error):
+            self.putFailure(key, error.status)
+        cached = self.entries.get(key)
+        if cached:
+            self.stats['stale'] += 1
+            return dict(cached[0]), None
+        return None, error
+
+    def flush(self):
+        rows = [(town, location, street, result['latitude'],
+                 result['longitude'], result['formattedaddress'],
+                 result['locationtype'], lastcheck,
+                 json.dumps(result['viewport']))
+                for (town, location, street), (result, lastcheck)
+                in self.pending.items()]
+        failrows = [key + entry for key, entry in self.pendingfailures.items()
+                    if entry]
+        cleared = [key for key, entry in self.pendingfailures.items()
+                   if not entry]
+        self.pending = {}
+        self.pendingfailures = {}
+        if rows or failrows or cleared:
+            self.db.executemany("""insert or replace into geocodecache2
+                        (town, location, streetname, latitude, longitude,
+                         formattedaddress, locationtype, lastcheck,
+                         viewport)
+                     values (?,?,?,?,?,?,?,?,?)""", rows)
+            self.db.executemany("""insert or replace into geocodefail
+                        (town, location, streetname, status, failures,
+                         retryafter)
+                     values (?,?,?,?,?,?)""", failrows)
+            self.db.executemany("""delete from geocodefail
+                     where town=? and location=? and streetname=?""", cleared)
+            self.db.commit()
+
+
+def fetchGeocode(location, url=None):
+    """Fetches geocoding information from url (GEOCODE_URL by default).
+
+    Pacing is up to the caller; see geocodeLimiter.
 
     Returns dictionary of formattedaddress, latitude, longitude,
     locationtype, and viewport tuple of (sw_lat, sw_lng, ne_lat, ne_lng).
@@ -56,13 +448,13 @@ def fetchGeocode(location):
 
     sanelocation = urllib.quote(location)
 
-    response = urllib2.urlopen("http://maps.googleapis.com/maps/api/geocode/json?address=%s&sensor=false" % sanelocation)
+    response = urllib2.urlopen("%s?address=%s&sensor=false" % (url or GEOCODE_URL, sanelocation), timeout=GEOCODE_TIMEOUT)
 
     jsondata = response.read()
     jsondict = json.loads(jsondata)
 
     if jsondict['results'] == []:
-        raise Exception("Empty results string: " + jsondict['status'])
+        raise GeocodeError(jsondict['status'])
 
     data = jsondict['results'][0]
     
@@ -76,71 +468,133 @@ def fetchGeocode(location):
                 'locationtype': data['geometry']['location_type'],
                 'viewport': viewport    }
 
-    time.sleep(1)
-
     return outdict
 
 
-def geocode(db, town, location, street):
-    """Geocodes a location, either using the cache or the Google.
+def offlineGeocode(location, url=None):
+    """Stands in for fetchGeocode when the network is off limits: holds
+    off every lookup, so only the cache answers."""
+    raise geoqueue.HeldOff("Offline; not looking up %s" % location)
 
-    Returns dictionary of formattedaddress, latitude, longitude,
-    locationtype, and viewport tuple of (sw_lat, sw_lng, ne_lat, ne_lng).
+
+def geocodeKey(town, location, street):
+    """Normalizes a street for geocoding (see streetnames), so spellings of
+    one street share a cache entry and a lookup.
+
+    Returns tuple of cache key (town, location, street) and query string.
     """
 
-    town = town.lower().strip()
+    town = streetnames.normalize_place(town)
     if location:
-        location = location.lower().strip()
+        location = streetnames.normalize_place(location)
     else:
         location = town
-    street = street.lower().strip()
+    street = streetnames.normalize_street(street)
 
-    # disambiguate lanes
-    if street.endswith(' la'):
-        street += 'ne'
+    return (town, location, street), street + ", " + location + " NY"
 
-    using_cache = False
 
-    # check the db
-    c = db.cursor()
-    c.execute("""select latitude, longitude, formattedaddress, locationtype,
-                        viewport, lastcheck
-                 from geocodecache2
-                 where town=? and location=? and streetname=?
-                 order by lastcheck desc limit 1""",
-              (town, location, street))
-
-    rows = c.fetchall()
-    if rows:
-        (latitude, longitude, formattedaddress, locationtype, viewport_json,
-         lastcheck) = rows[0]
-        if lastcheck < (time.time()+(7*24*60*60)):
-            using_cache = True
-            viewport = tuple(json.loads(viewport_json))
-
-            outdict = { 'formattedaddress': formattedaddress,
-                        'latitude': latitude,
-                        'longitude': longitude,
-                        'locationtype': locationtype,
-                        'viewport': viewport    }
-            return outdict
-
-    if not using_cache:
-        fetchresult = fetchGeocode(street + ", " + location + " NY")
-
-        viewport_json = json.dumps(fetchresult['viewport'])
-
-        c.execute("""insert into geocodecache2
-                        (town, location, streetname, latitude, longitude,
-                         formattedaddress, locationtype, lastcheck,
-                         viewport)
-                     values (?,?,?,?,?,?,?,?,?)""",
-                 (town, location, street, fetchresult['latitude'],
-                  fetchresult['longitude'], fetchresult['formattedaddress'],
-                  fetchresult['locationtype'], time.time(), viewport_json))
-        db.commit()
+def geocode(cache, town, location, street):
+    """Geocodes a location, either using the cache or the Google.
+
+    Addresses the Google recently couldn't find are not asked about again
+    until their backoff runs out.  If the Google fails and the cache has a
+    stale answer, that is used.
+
+    Returns dictionary of formattedaddress, latitude, longitude,
+    locationtype, and viewport tuple of (sw_lat, sw_lng, ne_lat, ne_lng).
+    """
+
+    key, query = geocodeKey(town, location, street)
+    result, error = cache.check(key)
+    if result is None and error is None:
+        try:
+            geocodeLimiter.acquire()
+        except geoqueue.HeldOff, e:
+            error = e
+        else:
+            try:
+                result = fetchGeocode(query)
+                geocodeLimiter.recover()
+            except Exception, e:
+                error = e
+                if not isNegative(e):
+                    geocodeLimiter.backoff()
+        result, error = cache.settle(key, result, error)
+
+    if error is not None:
+        raise error
+    return result
+
+
+def locateStreet(cache, town, street):
+    """Places a street from what is already known about it: the geocode
+    cache, then the local table, but never the Google; safe to call
+    alongside a run (see nearby).
+
+    Returns tuple of (latitude, longitude), or None.
+    """
+
+    key, query = geocodeKey(town, '', street)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0]['latitude'], cached[0]['longitude']
+    if cache.local is not None:
+        result = cache.local.lookup(key[2], key[1], key[0])
+        if result is not None:
+            return result['latitude'], result['longitude']
+    return None
+
+
+def geocodeStream(cache, queue, records, reuse=None):
+    """Geocodes a stream of outagerecords.StreetOutages, as from
+    scrape_rge.iter_outages.
+
+    Cache hits (and recent failures) are passed straight through; misses
+    are handed to queue (a geoqueue.GeocodeQueue), once per street, and
+    come out as their lookups finish.  If reuse is given, each record is
+    first handed to it; if it returns a record instead (one already
+    geocoded, from an earlier run), that is passed straight through, as
+    (that record, None, None).
+
+    Yields tuples of (record, result dictionary as from geocode, or None,
+    and the exception if the lookup failed).
+    """
+
+    waiting = {}
+
+    def finished(lookups):
+        for key, result, error in lookups:
+            result, error = cache.settle(key, result, error)
+            for record in waiting.pop(key):
+                if result is None:
+                    yield record, None, error
+                else:
+                    yield record, dict(result), None
+
+    for record in records:
+        if reuse is not None:
+            old = reuse(record)
+            if old is not None:
+                yield old, None, None
+                continue
+
+        key, query = geocodeKey(record.town, record.location, record.street)
+        if key in waiting:
+            waiting[key].append(record)
+        else:
+            result, error = cache.check(key)
+            if result is None and error is None:
+                waiting[key] = [record]
+                queue.submit(key, query)
+            else:
+                yield record, result, error
 
-        return fetchresult
+        for item in finished(queue.completed()):
+            yield item
+
+    for item in finished(queue.finish()):
+        yield item
 
 
 def distance_on_unit_sphere(lat1, long1, lat2, long2):
@@ -168,56 +622,20 @@ def distance_on_unit_sphere(lat1, long1, lat2, long2):
     
     cos = (math.sin(phi1)*math.sin(phi2)*math.cos(theta1 - theta2) + 
            math.cos(phi1)*math.cos(phi2))
-    arc = math.acos( cos )
+    arc = math.acos( min(1.0, cos) )
 
     # Remember to multiply arc by the radius of the earth 
     # in your favorite set of units to get length.
     return arc
 
 
-def produceMapHeader(apikey, markers, centers, points):
-    """Produces a map header given an API key and a list of produceMarkers"""
-
-    # Determine center of map:
-    # Initialize variables
-    minLat = 44.9
-    maxLat = 42.1
-    minLng = -76.1
-    maxLng = -78.9
-
-    # Iterate through and expand the range, ignoring outliers
-    for i in points:
-        if distance_on_unit_sphere((minLat+maxLat)/2, (minLng+maxLng)/2, i['latitude'], i['longitude'])*3960 < 30:
-            minLat = min(i['latitude'], minLat)
-            maxLat = max(i['latitude'], maxLat)
-            minLng = min(i['longitude'], minLng)
-            maxLng = max(i['longitude'], maxLng)
-
-    # Calculate center
-    centerLat = (minLat + maxLat) / 2
-    centerLng = (minLng + maxLng) / 2
-
-    # Guestimate zoom by finding diagonal distance (in miles)
-    distance = distance_on_unit_sphere(minLat, minLng, maxLat, maxLng) * 3960
-    if distance < 5:
-        zoom = 15
-    elif distance < 8:
-        zoom = 13
-    elif distance < 13:
-        zoom = 12
-    elif distance < 29:
-        zoom = 11
-    elif distance < 35:
-        zoom = 10
-    else:
-        zoom = 9
-
-    return u"""<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
+# The map page, in two parts: the header, with the map and the script
+# that keeps it up to date, and the body, with the boxes laid over it
+MAP_HEADER = template.Template(u"""<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
 <html xmlns="http://www.w3.org/1999/xhtml" xmlns:v="urn:schemas-microsoft-com:vml">
   <head>
     <meta http-equiv="content-type" content="text/html; charset=utf-8"/>
-    <meta http-equiv="refresh" content="900"/>
-    <title>({len_markers}) Rochester, New York Power Outage Map</title>
+    <title>({streets}) Rochester, New York Power Outage Map</title>
     <style type="text/css">
         v\:* {{behavior:url(#default#VML);}}
         html, body {{width: 100%; height: 100%}}
@@ -237,9 +655,18 @@ def produceMapHeader(apikey, markers, centers, points):
 
     </style>
     <script type="text/javascript" src="//maps.googleapis.com/maps/api/js?v=3&key={apikey}&sensor=false"></script>
-    <script type="text/javascript" src="markerclusterer.js"></script>
     <script type="text/javascript">
 
+        var outageMap = null;
+
+        function showTown(lat, lng) {{
+            // Centers the map on a town's outages, from the list of towns.
+            if (outageMap) {{
+                outageMap.setCenter(new google.maps.LatLng(lat, lng));
+                outageMap.setZoom(Math.max(outageMap.getZoom(), {town_zoom}));
+            }}
+        }}
+
         function hide(divID) {{
             var item = document.getElementById(divID);
             if (item) {{
@@ -254,15 +681,56 @@ def produceMapHeader(apikey, markers, centers, points):
             }}
         }}
 
+        function markerColor(firstreport) {{
+            // colors available:
+            // black, brown, green, purple, yellow, grey, orange, white
+            if (firstreport == null || firstreport <= 0) {{
+                return "grey";
+            }}
+            var age = new Date().getTime()/1000 - firstreport;
+            if (age < 15*60) {{
+                return "white";
+            }} else if (age < 25*60) {{
+                return "green";
+            }} else if (age < 35*60) {{
+                return "yellow";
+            }} else if (age < 45*60) {{
+                return "purple";
+            }} else if (age < 65*60) {{
+                return "orange";
+            }} else if (age < 115*60) {{
+                return "brown";
+            }}
+            return "black";
+        }}
+
+        function markerIcon(color) {{
+            return "//www.google.com/mapfiles/marker_" + color + ".png";
+        }}
+
         // aka createMarker
-        function cMkr(map, iw, lat, lng, title, text, color) {{
-            // Returns a Marker object at a given position, with a
+        function cMkr(map, iw, feature) {{
+            // Returns a Marker object for a feed feature, with a
             // descriptive infowindow.
+            var p = feature.properties;
+            var text = "<strong>" + p.title + "</strong>";
+            for (var i = 0; i < p.info.length; i++) {{
+                text += "<br/>" + p.info[i][0] + ": " + p.info[i][1];
+            }}
+            if (p.firstreport) {{
+                text += "<br/>FirstReported: " + new Date(p.firstreport*1000).toString();
+            }}
+            if (p.stale) {{
+                text += "<br/><em>RG&amp;E's page for this street didn't load this time; this is from the last good copy.</em>";
+            }}
             var marker = new google.maps.Marker({{
-                title: title,
-                position: new google.maps.LatLng(lat, lng),
-                icon: "//www.google.com/mapfiles/marker_" + color + ".png"
+                title: p.title,
+                position: new google.maps.LatLng(feature.geometry.coordinates[1],
+                                                 feature.geometry.coordinates[0]),
+                icon: markerIcon(markerColor(p.firstreport))
             }});
+            marker.firstreport = p.firstreport;
+            marker.color = markerColor(p.firstreport);
 
             google.maps.event.addListener(marker, "click", function() {{
                 iw.content = text;
@@ -272,13 +740,209 @@ def produceMapHeader(apikey, markers, centers, points):
             return marker;
         }}
 
-        function setupMarkers(map, iw) {{
-            // Returns a list of currently-active Markers.
-            var b = [];
-            // BEGIN Dynamic Code
-            {all_markers}
-            // END Dynamic Code
-            return b;
+        function getJSON(url, callback) {{
+            var xhr = new XMLHttpRequest();
+            xhr.open("GET", url, true);
+            xhr.setRequestHeader("Cache-Control", "no-cache");
+            xhr.onreadystatechange = function() {{
+                if (xhr.readyState == 4 && xhr.status == 200) {{
+                    callback(JSON.parse(xhr.responseText));
+                }}
+            }};
+            xhr.send(null);
+        }}
+
+        // aka createCluster
+        function cClu(map, c) {{
+            // Returns a Marker object standing for a cluster of outages,
+            // colored by the oldest of them; clicking it zooms in.
+            var color = markerColor(c[5]);
+            var marker = new google.maps.Marker({{
+                title: c[2] + " streets, " + c[3] + " of " + c[4] + " customers without power",
+                position: new google.maps.LatLng(c[0], c[1]),
+                label: {{
+                    text: String(c[2]),
+                    color: (color == "white" || color == "yellow" || color == "grey") ? "black" : "white"
+                }},
+                icon: {{
+                    path: google.maps.SymbolPath.CIRCLE,
+                    scale: 12 + 4 * Math.log(c[2]) / Math.LN10,
+                    fillColor: color,
+                    fillOpacity: 0.85,
+                    strokeColor: "black",
+                    strokeWeight: 1
+                }}
+            }});
+
+            google.maps.event.addListener(marker, "click", function() {{
+                map.setCenter(marker.getPosition());
+                map.setZoom(map.getZoom() + 2);
+            }});
+
+            return marker;
+        }}
+
+        function OutageFeed(map, iw) {{
+            // Keeps the map in step with the feed: loads it whole once,
+            // then applies each run's delta, reloading whole only if a run
+            // was missed.  Up to zoom {cluster_max_zoom}, the clusters worked
+            // out for that zoom are drawn instead of markers.  Either way,
+            // only what is in view gets drawn.
+            var feed = this;
+            this.serial = null;
+            this.features = {{}};
+            this.markers = {{}};
+            this.clusters = {{}};
+            this.clusterMarkers = [];
+            this.pending = {{}};
+
+            this.show = function(summary) {{
+                document.title = "(" + summary.streets + ") Rochester, New York Power Outage Map";
+                document.getElementById("asof").innerHTML = summary.asof;
+                document.getElementById("streets").innerHTML =
+                    summary.streets + " street" + (summary.streets == 1 ? "" : "s");
+                document.getElementById("locales").innerHTML = summary.locales;
+            }};
+
+            this.hide = function(id) {{
+                if (feed.markers[id]) {{
+                    feed.markers[id].setMap(null);
+                    delete feed.markers[id];
+                }}
+            }};
+
+            this.put = function(features) {{
+                for (var i = 0; i < features.length; i++) {{
+                    feed.features[features[i].id] = features[i];
+                    feed.hide(features[i].id);
+                }}
+            }};
+
+            this.recolor = function() {{
+                for (var id in feed.markers) {{
+                    var marker = feed.markers[id];
+                    var color = markerColor(marker.firstreport);
+                    if (color != marker.color) {{
+                        marker.color = color;
+                        marker.setIcon(markerIcon(color));
+                    }}
+                }}
+            }};
+
+            this.fetchClusters = function(zoom) {{
+                if (feed.pending[zoom] == feed.serial) {{
+                    return;
+                }}
+                feed.pending[zoom] = feed.serial;
+                getJSON("{cluster_file}".replace("%d", zoom), function(level) {{
+                    feed.clusters[zoom] = level;
+                    if (level.serial == feed.serial) {{
+                        feed.draw();
+                    }}
+                }});
+            }};
+
+            this.draw = function() {{
+                var bounds = map.getBounds();
+                if (!bounds || feed.serial === null) {{
+                    return;
+                }}
+                var zoom = map.getZoom();
+                var wanted = feed.features;
+                var level = null;
+                if (zoom <= {cluster_max_zoom}) {{
+                    zoom = Math.max(zoom, {cluster_min_zoom});
+                    level = feed.clusters[zoom];
+                    if (!level || level.serial != feed.serial) {{
+                        feed.fetchClusters(zoom);
+                        return;
+                    }}
+                }}
+
+                for (var i = 0; i < feed.clusterMarkers.length; i++) {{
+                    feed.clusterMarkers[i].setMap(null);
+                }}
+                feed.clusterMarkers = [];
+                if (level) {{
+                    wanted = {{}};
+                    for (var i = 0; i < level.clusters.length; i++) {{
+                        var c = level.clusters[i];
+                        if (!bounds.contains({{lat: c[0], lng: c[1]}})) {{
+                            continue;
+                        }}
+                        if (c[6] !== null && feed.features[c[6]]) {{
+                            // a cluster of one: the real marker will do
+                            wanted[c[6]] = true;
+                        }} else {{
+                            var marker = cClu(map, c);
+                            marker.setMap(map);
+                            feed.clusterMarkers.push(marker);
+                        }}
+                    }}
+                }}
+
+                for (var id in feed.markers) {{
+                    if (!(id in wanted) || !bounds.contains(feed.markers[id].getPosition())) {{
+                        feed.hide(id);
+                    }}
+                }}
+                for (var id in wanted) {{
+                    var f = feed.features[id];
+                    if (!feed.markers[id] && bounds.contains({{lat: f.geometry.coordinates[1], lng: f.geometry.coordinates[0]}})) {{
+                        feed.markers[id] = cMkr(map, iw, f);
+                        feed.markers[id].setMap(map);
+                    }}
+                }}
+            }};
+
+            this.load = function() {{
+                getJSON("{feed_file}", function(data) {{
+                    for (var id in feed.markers) {{
+                        feed.hide(id);
+                    }}
+                    feed.features = {{}};
+                    feed.put(data.features);
+                    feed.serial = data.serial;
+                    feed.show(data.summary);
+                    feed.draw();
+                    // a feed kept over from an earlier run has an older
+                    // as-of time than the delta; show the newest at once
+                    getJSON("{delta_file}", function(delta) {{
+                        if (delta.serial == feed.serial) {{
+                            feed.show(delta.summary);
+                        }}
+                    }});
+                }});
+            }};
+
+            this.poll = function() {{
+                getJSON("{delta_file}", function(delta) {{
+                    if (delta.serial == feed.serial) {{
+                        // nothing moved, but the summary may be newer
+                        feed.show(delta.summary);
+                        feed.recolor();
+                        feed.draw();
+                        return;
+                    }}
+                    if (delta.previous != feed.serial) {{
+                        feed.load();
+                        return;
+                    }}
+                    for (var i = 0; i < delta.removed.length; i++) {{
+                        delete feed.features[delta.removed[i]];
+                        feed.hide(delta.removed[i]);
+                    }}
+                    feed.put(delta.added.concat(delta.changed));
+                    feed.serial = delta.serial;
+                    feed.show(delta.summary);
+                    feed.recolor();
+                    feed.draw();
+                }});
+            }};
+
+            google.maps.event.addListener(map, "idle", this.draw);
+            this.load();
+            window.setInterval(this.poll, {feed_poll});
         }}
 
         /* distance: {distance}
@@ -286,8 +950,8 @@ def produceMapHeader(apikey, markers, centers, points):
            maximum corner: {maxLat}, {maxLng} */
 
         function initialize() {{
-            // Creates a map and a master infowindow, as well as a
-            // markerCluster with all active markers.
+            // Creates a map and a master infowindow, and fills the map
+            // from the outage feed.
             var map = new google.maps.Map(
                 document.getElementById("map_canvas"), {{
                     center: new google.maps.LatLng({centerLat}, {centerLng}),
@@ -299,19 +963,96 @@ def produceMapHeader(apikey, markers, centers, points):
                 content: "lorem ipsum"
             }});
 
-            var markerCluster = new MarkerClusterer(map, setupMarkers(map, infowindow), {{
-                maxZoom: 14
-            }});
+            outageMap = map;
+            new OutageFeed(map, infowindow);
         }};
 
         google.maps.event.addDomListener(window, 'load', initialize);
 
     </script>
   </head>
-""".format(
+""")
+
+MAP_BODY = template.Template(u"""
+  <body>
+    <div id="map_canvas" style="width: 100%%; height: 100%%;"></div>
+
+    <div id="infobox" class="unhidden" style="top:25px; left:75px; position:absolute; background-color:white; border:2px solid black; width:50%; opacity:0.8; padding:10px;">
+        <div id="closebutton" style="top:2px; right:2px; position:absolute">
+            <a href="javascript:hide('infobox');"><img src="xbox.png" border=0 alt="X" title="We'll leave the light on for you."></a>
+        </div>
+        <p><b>Rochester, New York Power Outage Map</b> as of <span id="asof">{asof_time}</span> (<span id="streets">{streets} street{s}</span>)</b></p>
+        <p>Automatically generated every 15 minutes, and kept up to date while you watch.  Zoom for more detail.</p>
+        <p style="font-size:small;"><a href="javascript:unhide('faqbox');">More information about this map</a> | 
+              <a href="javascript:unhide('chartbox');">Outage graph</a> |
+              <a href="data.json">JSON</a></p>
+        <p id="locales" style="font-size:xx-small;">{locales}</p>
+    </div>
+
+    <div id="faqbox" class="hidden" style="top:45px; left:95px; position:absolute; background-color:white; border:2px solid black; width:75%; padding:10px;">
+        <div id="closebutton" style="top:2px; right:2px; position:absolute">
+            <a href="javascript:hide('faqbox');"><img src="xbox.png" border=0 alt="X" title="OK, OK, I'll show you the map."></a>
+        </div>
+        <p>This map plots the approximate locations of power outages in Rochester, New York, and is updated every ten minutes.  The source data for this map is published by <A HREF="http://www.rge.com/Outages/outageinformation.html">RG&E</A>, but all map-related blame should go to <a href="http://hoopycat.com/~rtucker/">Ryan Tucker</a> &lt;<a href="mailto:rtucker@gmail.com">rtucker@gmail.com</a>&gt;.  You can find the source code <a href="https://github.com/rtucker/rgeoutages/">on GitHub</a>.</p>
+        <p>Some important tips to keep in mind...</p>
+        <ul>
+            <li><b>RG&E only publishes a list of street names.</b> This map's pointer will end up in the geographic center of the street, which will undoubtedly be wrong for really long streets.  Look for clusters of outages.</li>
+            <li><b>This map doesn't indicate the actual quantity of power outages or people without power.</b> There may be just one house without power on a street, or every house on a street.  There may be multiple unrelated outages on one street, too.  There's no way to know.</li>
+            <li><b>This page may be out of date.</b> If in doubt, check the as-of time.</li>
+        </ul>
+        <p>Also, be sure to check out RG&E's <a href="http://rge.com/Outages/">Outage Central</a> for official information, to report outages, or to check on the status of an outage.</p>
+        <hr>
+        <p><b>IF YOU HAVE A LIFE-THREATENING ELECTRICAL EMERGENCY, CALL RG&E AT 1-800-743-1701 OR CALL 911 IMMEDIATELY.  DO NOT TOUCH DOWNED ELECTRICAL LINES, EVER.  EVEN IF YOUR STREET IS LISTED HERE.</b></p>
+        <p style="font-size:xx-small;"><a href="https://github.com/rtucker/rgeoutages/commit/{git_version}">Software last modified {git_time}</a>.</p>
+    </div>
+
+    <div id="chartbox" class="hidden" style="top:45px; left:95px; position:absolute; background-color:white; border:2px solid black; padding:10px;">
+        <div id="closebutton" style="top:2px; right:2px; position:absolute">
+            <a href="javascript:hide('chartbox');"><img src="xbox.png" border=0 alt="X" title="Hide graph window"></a>
+        </div>
+        <div id="graphimage" style="background:url(http://munin.sodtech.net/hoopycat.com/framboise/rgeoutages-day.png); width:495px; height:271px;"></div>
+    </div>
+    
+  </body>
+</html>""")
+
+
+def writeMapPage(out, apikey, lats, lngs, asof_time, streets, locales,
+                 git_version, git_modtime):
+    """Writes the map page to out (which must take unicode), given an API
+    key, the latitudes and longitudes of the geocoded outages, the as-of
+    time, the number of streets, the locale list (HTML) and the software
+    version.  The markers themselves come from the feed."""
+
+    # Fit the map to the outages, leaving out strays; with none, show the
+    # whole service area
+    summary = spatial.summarize(lats, lngs)
+    if summary is None:
+        minLat, maxLat = 42.1, 44.9
+        minLng, maxLng = -78.9, -76.1
+        zoom = 9
+    else:
+        minLat, maxLat = summary['south'], summary['north']
+        minLng, maxLng = summary['west'], summary['east']
+        zoom = summary['zoom']
+
+    # Calculate center
+    centerLat = (minLat + maxLat) / 2
+    centerLng = (minLng + maxLng) / 2
+
+    # Diagonal distance (in miles), for the record
+    distance = distance_on_unit_sphere(minLat, minLng, maxLat, maxLng) * 3960
+
+    MAP_HEADER.render(out,
              apikey         = apikey,
-             len_markers    = len(markers),
-             all_markers    = '\n'.join(markers),
+             streets        = streets,
+             feed_file      = FEED_FILE,
+             delta_file     = DELTA_FILE,
+             cluster_file   = CLUSTER_FILE,
+             cluster_min_zoom = CLUSTER_MIN_ZOOM,
+             cluster_max_zoom = CLUSTER_MAX_ZOOM,
+             feed_poll      = FEED_POLL*1000,
+             town_zoom      = TOWN_ZOOM,
              distance       = distance,
              minLat         = minLat,
              minLng         = minLng,
@@ -321,189 +1062,655 @@ def produceMapHeader(apikey, markers, centers, points):
              centerLng      = centerLng,
              zoom           = zoom,
           )
+    MAP_BODY.render(out,
+             asof_time      = asof_time,
+             streets        = streets,
+             s              = streets != 1 and 's' or '',
+             locales        = locales,
+             git_version    = git_version.strip(),
+             git_time       = git_modtime,
+          )
 
 
-def produceMarker(lat, lng, text, firstreport=-1, streetinfo={}):
-    """Produces a google maps marker given a latitude, longitude, text, and first report time"""
-    color = 'grey'
-    if firstreport > 0:
-        age = time.time()-firstreport
-        nicetime = time.asctime(time.localtime(firstreport))
-        streetinfo['FirstReported'] = nicetime
-        # colors available:
-        # black, brown, green, purple, yellow, grey, orange, white
-        if age < 15*60:
-            color = 'white'
-        elif age < 25*60:
-            color = 'green'
-        elif age < 35*60:
-            color = 'yellow'
-        elif age < 45*60:
-            color = 'purple'
-        elif age < 65*60:
-            color = 'orange'
-        elif age < 115*60:
-            color = 'brown'
-        else:
-            color = 'black'
+def featureId(town, location, street):
+    """Returns an ID for a street that stays the same from run to run."""
+    return '|'.join(geocodeKey(town, location, street)[0])
 
-    longtext = '<strong>' + text + '</strong><br/>' + '<br/>'.join('%s: %s' % (key, value) for key, value in streetinfo.items())
-    return 'b.push(new cMkr(map, iw, %f, %f, "%s", "%s", "%s"));' % (lat, lng, text, longtext, color)
 
+def jsonText(text):
+    """Returns text as JSON reads it back: unicode, decoded as UTF-8 if it
+    is a byte string.  Anything else is left alone.
 
-def produceMapBody(body):
-    return u"""
-  <body>
-    <div id="map_canvas" style="width: 100%%; height: 100%%;"></div>
-""" + body + """
-  </body>
-</html>"""
+    >>> jsonText('Caf\\xc3\\xa9'), jsonText(3)
+    (u'Caf\\xe9', 3)
+    """
+    if isinstance(text, str):
+        return text.decode('utf-8')
+    return text
+
+
+def produceFeature(id, lat, lng, text, firstreport=-1, streetinfo={}, stale=False):
+    """Produces a GeoJSON point feature for the marker feed given an ID,
+    latitude, longitude, text, first report time, and whether it's from an
+    earlier copy of RG&E's page.  The map colors it by age, or grey if
+    there is no first report time.
+
+    The feature is made of the types JSON reads back (unicode, lists), so
+    it compares equal to the same feature in last run's feed as read from
+    disk."""
+    properties = { 'title': jsonText(text),
+                   'info': [[jsonText(key), jsonText(value)]
+                            for key, value in sorted(streetinfo.items())] }
+    if firstreport > 0:
+        properties['firstreport'] = int(firstreport)
+    if stale:
+        properties['stale'] = True
+    return { 'type': 'Feature',
+             'id': jsonText(id),
+             'geometry': { 'type': 'Point',
+                           'coordinates': [round(lng, 6), round(lat, 6)] },
+             'properties': properties }
+
+
+def produceFeed(features, serial, summary):
+    """Produces the marker feed: a GeoJSON FeatureCollection, plus the run's
+    serial number and the summary shown in the infobox.  Features are put in
+    ID order; of features sharing an ID, the last is kept."""
+    last = dict((feature['id'], feature) for feature in features)
+    features = [feature for feature in features if last[feature['id']] is feature]
+    features.sort(key=lambda feature: feature['id'])
+    return { 'type': 'FeatureCollection',
+             'serial': serial,
+             'summary': summary,
+             'features': features }
+
+
+def feedDelta(old, new):
+    """Compares two marker feeds by feature ID.
+
+    Returns dictionary of serial, previous (the old feed's serial), summary,
+    lists of added and changed features, and list of removed IDs.
+    """
+    oldfeatures = dict((f['id'], f) for f in old['features'])
+    newids = set()
+    added = []
+    changed = []
+    for feature in new['features']:
+        newids.add(feature['id'])
+        previous = oldfeatures.get(feature['id'])
+        if previous is None:
+            added.append(feature)
+        elif previous is not feature and previous != feature:
+            changed.append(feature)
+    return { 'serial': new['serial'],
+             'previous': old['serial'],
+             'summary': new['summary'],
+             'added': added,
+             'changed': changed,
+             'removed': sorted(id for id in oldfeatures if id not in newids) }
+
+
+def produceClusters(feed):
+    """Clusters the marker feed's outages for each zoom level from
+    CLUSTER_MIN_ZOOM to CLUSTER_MAX_ZOOM.
+
+    Returns dictionary of zoom level -> cluster file contents.
+    """
+    points = []
+    for feature in feed['features']:
+        properties = feature['properties']
+        info = dict(properties['info'])
+        lng, lat = feature['geometry']['coordinates']
+        points.append((lat, lng, info.get('CustomersWithoutPower', 0),
+                       info.get('TotalCustomers', 0),
+                       properties.get('firstreport', -1), feature['id']))
+    levels = clusters.cluster_zooms(points, CLUSTER_MIN_ZOOM, CLUSTER_MAX_ZOOM)
+    return dict((zoom, { 'serial': feed['serial'],
+                         'zoom': zoom,
+                         'clusters': level })
+                for zoom, level in levels.items())
+
+
+def nextFeed(oldfeed, olddelta, feed):
+    """Works out the marker feed to publish, and its delta, given last
+    run's.  If no marker changed and the summary is the same but for its
+    as-of time, the old feed is kept, serial and all, so that it and
+    everything made from it stay byte for byte the same; only the delta
+    (and the page) carry the new summary.
+
+    Returns tuple of (feed, delta).
+    """
+    delta = feedDelta(oldfeed, feed)
+    if delta['added'] or delta['changed'] or delta['removed'] or \
+            dict(oldfeed['summary'], asof=None) != dict(feed['summary'], asof=None):
+        return feed, delta
+    if olddelta is None or olddelta.get('serial') != oldfeed['serial']:
+        olddelta = feedDelta(oldfeed, oldfeed)
+    return oldfeed, dict(olddelta, summary=feed['summary'])
 
 
-if __name__ == '__main__':
-    db = initDB()
+def readJSON(filename, default=None):
+    """Returns the contents of a JSON file, or default if it can't be read."""
     try:
-        apikey = secrets.apikey
-    except:
-        apikey = 'FIXME FIXME FIXME'
+        fd = open(filename, 'r')
+        try:
+            return json.load(fd)
+        finally:
+            fd.close()
+    except (IOError, ValueError):
+        return default
+
+
+def canonical(data):
+    """Returns a copy of data with every dictionary refilled in key order.
+
+    A dictionary iterates in an order that depends on how it was filled,
+    so this makes equal data encode the same, without json's sort_keys
+    (which, in Python 2, turns off its C speedups).  Lists are taken to
+    hold either no lists and dictionaries at all, or nothing else.
+
+    >>> canonical({'b': [{'d': 1, 'c': 2}], 'a': [1, 2]})
+    {'a': [1, 2], 'b': [{'c': 2, 'd': 1}]}
+    """
+    kind = type(data)
+    if kind is dict:
+        return dict([(key, canonical(data[key])) for key in sorted(data)])
+    if kind is list:
+        if data and type(data[0]) not in (dict, list):
+            return data
+        return [canonical(item) for item in data]
+    return data
+
+
+def encodeJSON(data):
+    """Returns data as compact JSON, the same every time for the same
+    data (see canonical)."""
+    return json.dumps(canonical(data), separators=(',', ':'))
+
+
+def writeJSON(out, data, chunk=JSON_CHUNK):
+    """Writes data to out exactly as encodeJSON would, but a piece at a
+    time: if data is a dictionary, each of its values separately, and
+    lists chunk items at a time, so a big feed is never all in memory as
+    text at once.  data can also be anything else with keys() that
+    returns dictionaries when looked up, like OutageTable.tree(), which is
+    written as if it were a dictionary.
+
+    >>> data = {'features': range(5), 'serial': 3, 'summary': {'b': 1, 'a': 2}}
+    >>> out = StringIO.StringIO()
+    >>> writeJSON(out, data, chunk=2)
+    >>> out.getvalue() == encodeJSON(data)
+    True
+    """
+    if not hasattr(data, 'keys'):
+        out.write(encodeJSON(data))
+        return
+    out.write('{')
+    # keys in the order canonical leaves them in
+    for i, key in enumerate(dict([(key, None) for key in sorted(data.keys())])):
+        if i:
+            out.write(',')
+        out.write(json.dumps(key) + ':')
+        value = data[key]
+        if type(value) is list:
+            out.write('[')
+            for start in range(0, len(value), chunk):
+                if start:
+                    out.write(',')
+                out.write(encodeJSON(value[start:start + chunk])[1:-1])
+            out.write(']')
+        else:
+            out.write(encodeJSON(value))
+    out.write('}')
+
+
+def publishJSON(publisher, filename, data):
+    """Publishes data as JSON through publisher (a publish.Publisher),
+    written a piece at a time (see writeJSON).
+
+    Returns True if anything was written.
+    """
+    stream = publisher.open(filename)
+    writeJSON(stream, data)
+    return stream.close()
+
+
+class MapState(object):
+    """Everything that outlives one run of generateMap: the database, the
+    geocode and page caches, connections to RG&E (at base_url), the
+    geocoder (fetchGeocode), the snapshot archive (if archive is set and
+    SNAPSHOT_FILE isn't None), outage history, the last marker feed and
+    delta published and the clusters made from the feed, and the last
+    run's outages (an outagerecords.OutageTable, for INCREMENTAL and
+    nearby)."""
+
+    def __init__(self, archive=True):
+        self.base_url = scrape_rge.BASE_URL
+        self.geocoder = fetchGeocode
+        self.db = initDB()
+        if os.path.exists(LOCALGEO_FILE):
+            self.geocache = GeocodeCache(self.db, localgeo.LocalGeocoder(LOCALGEO_FILE))
+        else:
+            self.geocache = GeocodeCache(self.db)
+        self.geocache.preload()
+        self.pagecache = scrape_rge.PageCache()
+        self.fetcher = scrape_rge.Fetcher()
+        self.archive = None
+        if archive and SNAPSHOT_FILE:
+            self.archive = scrape_rge.SnapshotArchive(SNAPSHOT_FILE)
+        self.pagecache.archive = self.archive
+        self.publisher = publish.Publisher()
+        self.history = outagehistory.OutageHistory(self.db)
+        self.feed = self.delta = self.levels = None
+        self.outages = None
+        try:
+            self.apikey = secrets.apikey
+        except:
+            self.apikey = 'FIXME FIXME FIXME'
+        self.git_version = str(scrape_rge.GIT_VERSION)
+        self.git_modtime = scrape_rge.GIT_MODTIME
+        if self.git_modtime != "dev":
+            self.git_modtime = time.asctime(time.localtime(self.git_modtime))
+
+    def close(self):
+        self.geocache.flush()
+        self.pagecache.save()
+        self.fetcher.close()
+        if self.archive is not None:
+            self.archive.close()
+        self.db.close()
+
+
+def generateMap(state, log, debug=False, now=None):
+    """Fetches the outages and publishes the map page and the data files
+    beside it, writing a line or two about how it went to log.  The run
+    is taken to happen at now (by default, the current time).
+
+    Returns the number of outages that opened or closed since last run.
+    """
+    runstart = time.time()
+    if now is None:
+        now = runstart
+    if RUN_REPORT_FILE:
+        report = runreport.RunReport()
+    else:
+        report = runreport.NULL
+    db = state.db
+    publisher = state.publisher
+    publisher.stats = dict.fromkeys(publisher.stats, 0)
+    publishData = report.timed('publish', publishJSON)
+    geocache = state.geocache
+    geocache.stats = dict.fromkeys(geocache.stats, 0)
+    pagecache = state.pagecache
+    pagecache.stats = dict.fromkeys(pagecache.stats, 0)
+    pagecache.report = state.fetcher.report = report
+    if CRAWL_DEADLINE:
+        state.fetcher.deadline = runstart + CRAWL_DEADLINE
+    limiterwaited = geocodeLimiter.waited
+    apikey = state.apikey
+    git_version = state.git_version
+    git_modtime = state.git_modtime
 
     localelist = []
-    markerlist = []
-    citycenterlist = []
-    pointlist = []
+    featurelist = []
 
     stoplist = ['HONEOYE%20FL', 'HONEOYE', 'N%20CHILI']
 
-    git_version = open('.git/refs/heads/master','r').read()
-    git_modtime = time.asctime(time.localtime(os.stat('.git/refs/heads/master').st_mtime))
-
-    try:
-        # open the history file (how long current outages have been there)
-        historyfd = open('history.json','r')
-        historydict = json.load(historyfd)
-        historyfd.close()
-    except IOError:
-        historydict = {}
-    newhistorydict = {}
-    newjsondict = {}
-
-    # fetch the outages
-    outagedata = scrape_rge.crawl_outages()
-
-    for county, countydata in outagedata.items():
-        newjsondict[county] = {}
-        towns = countydata['Towns']
-        for town, towndata in towns.items():
-            newjsondict[county][town] = {}
-            locations = towndata['Locations']
-            count = 0
-            for location, locationdata in locations.items():
-                streets = locationdata['Streets']
-                newjsondict[county][town][location] = {}
-                for street, streetdata in streets.items():
-                    newjsondict[county][town][location][street] = {}
-                    for key, value in streetdata.items():
-                        newjsondict[county][town][location][street][key] = value
-                    try:
-                        streetinfo = geocode(db, town, location, street)
-                        if streetinfo['formattedaddress'] in historydict.keys():
-                            firstreport = historydict[streetinfo['formattedaddress']]
-                        else:
-                            firstreport = time.time()
-                        if streetinfo['locationtype'] == 'APPROXIMATE':
-                            streetinfo['formattedaddress'] = '%s? (%s)' % (street, streetinfo['formattedaddress'])
-                        newjsondict[county][town][location][street]['geo'] = streetinfo
-                        newjsondict[county][town][location][street]['firstreport'] = firstreport
-                        markerlist.append(produceMarker(streetinfo['latitude'], streetinfo['longitude'], streetinfo['formattedaddress'], firstreport, streetdata))
-                        pointlist.append(streetinfo)
-                        newhistorydict[streetinfo['formattedaddress']] = firstreport
-                        count += 1
-                    except Exception, e:
-                        sys.stdout.write("<!-- Geocode fail: %s in %s gave %s -->\n" % (street, town, e.__str__()))
+    # how long current outages have been there
+    history = state.history
+    history.start(now)
+
+    # fetch the outages, revalidating against last run's pages, and
+    # handle each street as soon as its page comes in
+    towns = {}
+    towncounts = {}
+    countycustomers = {}
+    locations = set()
+    outages = outagerecords.OutageTable(towns)
+
+    # streets unchanged since last run are carried forward
+    reuse = None
+    if INCREMENTAL and state.outages is not None:
+        since = now - INCREMENTAL_MAX_AGE
+        reuse = lambda record: state.outages.unchanged(record, since)
+    reused = 0
+
+    geocodequeue = geoqueue.GeocodeQueue(report.timed('geocode', state.geocoder),
+                                         concurrency=GEOCODE_CONCURRENCY,
+                                         limiter=geocodeLimiter,
+                                         transient=lambda e: not (isNegative(e) or isinstance(e, geoqueue.HeldOff)))
+    if state.archive is not None:
+        state.archive.begin(state.base_url, now)
+    records = scrape_rge.iter_outages(state.base_url, fetcher=state.fetcher, cache=pagecache, towns=towns)
+
+    with report.stage('pipeline'):
+        for record, streetinfo, error in geocodeStream(geocache, geocodequeue, records, reuse):
+            county = record.county
+            town = record.town
+            location = record.location
+            street = record.street
+            countycustomers[county] = countycustomers.get(county, 0) + record.out
+            locations.add((county, town, location))
+            if streetinfo is None and error is None:
+                # carried forward from last run, marker and all (if it has one)
+                if record.feature is not None:
+                    outage = record.feature['id']
+                else:
+                    outage = featureId(town, location, street)
+                history.observe(outage, county, town, location, street, record.address, record.out)
+                outages.add(record)
+                reused += 1
+                if record.feature is not None:
+                    featurelist.append(record.feature)
+                    towncounts[(county, town)] = towncounts.get((county, town), 0) + 1
+                continue
+
+            outage = featureId(town, location, street)
+            record.firstreport = history.observe(outage, county, town, location, street, streetinfo and streetinfo['formattedaddress'], record.out)
+            if error is not None:
+                if isNegative(error):
+                    # no use asking again until the address changes
+                    record.checked = now
+                outages.add(record)
+                log.write("Geocode fail: %s in %s gave %s\n" % (street, town, error.__str__()))
+                continue
+
+            record.geocoded(streetinfo)
+            if record.locationtype == 'APPROXIMATE':
+                record.address = '%s? (%s)' % (street, record.address)
+            record.checked = now
+            record.feature = produceFeature(outage, record.latitude, record.longitude, record.address, record.firstreport, record.info(), record.stale)
+            outages.add(record)
+            featurelist.append(record.feature)
+            towncounts[(county, town)] = towncounts.get((county, town), 0) + 1
+
+    # the workers' waits for the rate limiter, added up; there's no
+    # telling how much of the run they overlapped
+    report.add('geocode_wait', 0.0, busy=geocodeLimiter.waited - limiterwaited, calls=0)
+    if state.archive is not None:
+        state.archive.finish()
+        log.write("Snapshot: %(pages)d pages, %(stored)d new (%(storedbytes)d bytes)\n" % state.archive.stats)
+    log.write("Pages: %(parsed)d parsed, %(notmodified)d not modified, %(unchanged)d unchanged, %(stale)d stale, %(missing)d missing\n" % pagecache.stats)
+    log.write("Streets: %d reused from last run, %d recomputed\n" % (reused, len(outages) - reused))
+
+    # every street carried forward, and none gone, so data.json and (unless
+    # the towns changed) the feed come out as they did last run
+    unchanged = (reuse is not None and reused == len(outages) == len(state.outages)
+                 and towns == state.outages.towns)
+
+    # where each town's outages are, for the list of towns
+    geocoded = [outage for outage in outages if outage.latitude is not None]
+    centroids = spatial.town_centroids(['%s|%s' % (outage.county, outage.town) for outage in geocoded],
+                                       outages.latitudes, outages.longitudes)
+
+    for county, countytowns in sorted(towns.items()):
+        for town, towndata in sorted(countytowns.items()):
+            count = towncounts.get((county, town), 0)
 
             if count > 1:
                 s = 's'
             else:
                 s = ''
 
-            citycenter = geocode(db, town, '', '')
-            citycenterlist.append(produceMarker(citycenter['latitude'], citycenter['longitude'], citycenter['formattedaddress'] + ' (%i street%s)' % (count, s)))
-
-            localestring = '<strong>%s</strong>:&nbsp;%i&nbsp;street%s' % (town, count, s)
-            for key, value in towndata.items():
+            name = template.escape(template.unescape(town))
+            centroid = centroids.get('%s|%s' % (county, town))
+            if centroid is not None:
+                name = '<a href="javascript:showTown(%.6f,%.6f);">%s</a>' % (centroid[0], centroid[1], name)
+            localestring = '<strong>%s</strong>:&nbsp;%i&nbsp;street%s' % (name, count, s)
+            for key, value in sorted(towndata.items()):
                 if type(value) is not dict:
                     localestring += ',&nbsp;%s:&nbsp;%s' % (key, value)
             localestring += '&nbsp;(%.2f%%&nbsp;affected)' % (float(towndata['CustomersWithoutPower']) / float(towndata['TotalCustomers']) * 100.0)
             localelist.append(localestring)
 
-    # Save json history file
-    newhistoryfd = open('history.json','w')
-    json.dump(newhistorydict, newhistoryfd)
-    newhistoryfd.close()
+    with report.stage('geocode_flush'):
+        geocache.flush()
+    log.write("Geocode: %(hits)d cached, %(local)d local, %(fetched)d fetched, %(failed)d failed, %(stale)d stale, %(suppressed)d suppressed\n" % geocache.stats)
+
+    # Record what opened and closed since last run
+    with report.stage('history'):
+        opened, closed = history.finish()
+    log.write("History: %d opened, %d closed\n" % (opened, closed))
 
     # Save json dump file
-    newjsonfd = open('data.new.json','w')
-    json.dump(newjsondict, newjsonfd)
-    newjsonfd.close()
-    os.rename('data.new.json', 'data.json')
+    if not unchanged:
+        publishData(publisher, DATA_FILE, outages.tree())
 
     # XXX: DEBUG CODE
-    if len(sys.argv) > 1 and sys.argv[1] == 'debug':
+    if debug:
         c = db.cursor()
         c.execute('select latitude,longitude,formattedaddress,locationtype,viewport,lastcheck from geocodecache2 where town=? order by lastcheck desc', ("rochester",))
 
         for i, r in enumerate(c.fetchall()):
-            markerlist.append(produceMarker(r[0], r[1], r[2], i, {'debug': "num %d" % i}))
+            featurelist.append(produceFeature('debug|%d' % i, r[0], r[1], r[2], i, {'debug': "num %d" % i}))
     # XXX: END DEBUG
 
-    if len(markerlist) == 1:
-        s = ''
+    streetcount = len(outages.latitudes)
+    locales = '<br/>'.join(localelist)
+
+    # Save the marker feed, and what changed since the last one
+    with report.stage('feed'):
+        feed = produceFeed(featurelist, int(now),
+                           { 'asof': jsonText(datetime.fromtimestamp(now).strftime("%A, %d %B %Y at %r")),
+                             'streets': streetcount,
+                             'locales': jsonText(locales) })
+        if state.feed is None:
+            state.feed = readJSON(FEED_FILE, produceFeed([], None, {}))
+            state.delta = readJSON(DELTA_FILE)
+        oldfeed = state.feed
+        feed, delta = nextFeed(oldfeed, state.delta, feed)
+        state.feed, state.delta = feed, delta
+        # if so, the feed and clusters this process published last run are
+        # still there, just as they would be written again
+        carried = unchanged and feed is oldfeed and state.levels is not None
+        if carried:
+            levels = state.levels
+        else:
+            state.levels = None
+            levels = produceClusters(feed)
+    if not carried:
+        for zoom, level in levels.items():
+            publishData(publisher, CLUSTER_FILE % zoom, level)
+        publishData(publisher, FEED_FILE, feed)
+        state.levels = levels
+    publishData(publisher, DELTA_FILE, delta)
+    if feed is oldfeed:
+        log.write("Feed: %d markers; unchanged; %d clusters at zoom %d\n" % (len(feed['features']), len(levels[CLUSTER_MIN_ZOOM]['clusters']), CLUSTER_MIN_ZOOM))
+    else:
+        log.write("Feed: %d markers; %d added, %d changed, %d removed; %d clusters at zoom %d\n" % (len(feed['features']), len(delta['added']), len(delta['changed']), len(delta['removed']), len(levels[CLUSTER_MIN_ZOOM]['clusters']), CLUSTER_MIN_ZOOM))
+
+    # The page shows this run's as-of time, like the delta, even when the
+    # feed was kept over from an earlier run
+    asof_time = delta['summary']['asof']
+    with report.stage('render'):
+        page = publisher.open(HTML_FILE)
+        out = codecs.getwriter("utf-8")(page)
+        writeMapPage(out, apikey, outages.latitudes, outages.longitudes,
+                     asof_time, streetcount, locales,
+                     git_version, git_modtime)
+        if RUN_REPORT_FILE and RUN_REPORT_IN_PAGE:
+            # (a JSON string can hold "--"; a comment can't)
+            out.write(u"<!-- run report: %s -->\n" % encodeJSON(report.report()).replace('--', '-\\u002d'))
+        page.close()
+
+    # Save metrics for monitoring
+    runmetrics = { 'customers': sum(countycustomers.values()),
+                   'streets': streetcount,
+                   'reported': len(outages),
+                   'towns': sum(len(countytowns) for countytowns in towns.values()),
+                   'counties': countycustomers,
+                   'runtime': time.time() - runstart,
+                   'time': time.time(),
+                   'geocode': geocache.stats,
+                   'pages': pagecache.stats,
+                   'publish': publisher.stats }
+    log.write("Published: %(written)d files written (%(writtenbytes)d bytes), %(skipped)d unchanged (%(skippedbytes)d bytes)\n" % publisher.stats)
+    if METRICS_FILE:
+        publisher.publish(METRICS_FILE, metrics.prometheus(runmetrics), compress=False)
+    publisher.publish(MUNIN_CONFIG_FILE, metrics.munin_config(runmetrics), compress=False)
+    publisher.publish(MUNIN_FILE, metrics.munin_values(runmetrics), compress=False)
+
+    # Save the run report
+    if RUN_REPORT_FILE:
+        report.note('geocode', geocache.stats)
+        report.note('pages', pagecache.stats)
+        report.note('publish', publisher.stats)
+        report.note('records', { 'counties': len(towns),
+                                 'towns': runmetrics['towns'],
+                                 'locations': len(locations),
+                                 'streets': len(outages),
+                                 'geocoded': streetcount,
+                                 'markers': len(feed['features']),
+                                 'reused': reused,
+                                 'recomputed': len(outages) - reused })
+        log.write("Stages: %s\n" % report.summary())
+        publisher.publish(RUN_REPORT_FILE, encodeJSON(report.report()), compress=False)
+
+    state.outages = outages
+    return opened + closed
+
+
+def nextInterval(interval, changes):
+    """Picks how long to wait before the next run, given the last wait and
+    how many outages opened or closed since.  Every ten changes cuts the
+    wait by as much again; a run with none stretches it by half.  Kept
+    between DAEMON_MIN_INTERVAL and DAEMON_MAX_INTERVAL.
+
+    >>> nextInterval(600, 0), nextInterval(600, 10), nextInterval(600, 500)
+    (900, 300, 120)
+    >>> nextInterval(900, 0)
+    900
+    """
+    if changes:
+        interval = interval / (1 + changes / 10.0)
     else:
-        s = 's'
+        interval = interval * 1.5
+    return int(min(max(interval, DAEMON_MIN_INTERVAL), DAEMON_MAX_INTERVAL))
 
-    sys.stdout.write(produceMapHeader(apikey, markerlist, citycenterlist, pointlist).encode("utf-8"))
 
-    bodytext = u"""
-    <div id="infobox" class="unhidden" style="top:25px; left:75px; position:absolute; background-color:white; border:2px solid black; width:50%; opacity:0.8; padding:10px;">
-        <div id="closebutton" style="top:2px; right:2px; position:absolute">
-            <a href="javascript:hide('infobox');"><img src="xbox.png" border=0 alt="X" title="We'll leave the light on for you."></a>
-        </div>
-        <p><b>Rochester, New York Power Outage Map</b> as of {asof_time} ({streets} street{s})</b></p>
-        <p>Automatically generated every 15 minutes.  Zoom for more detail.</p>
-        <p style="font-size:small;"><a href="javascript:unhide('faqbox');">More information about this map</a> | 
-              <a href="javascript:unhide('chartbox');">Outage graph</a> |
-              <a href="data.json">JSON</a></p>
-        <p style="font-size:xx-small;">{locales}</p>
-    </div>
+def replayRuns(state, archive, runs, log):
+    """Feeds archived crawls (see scrape_rge.SnapshotArchive) through
+    generateMap, in order, each as if it were happening when it was
+    archived.  Pages come from the archive, so RG&E isn't asked for
+    anything; set state.geocoder to offlineGeocode to leave the Google
+    alone too.  A line per run goes to log.
 
-    <div id="faqbox" class="hidden" style="top:45px; left:95px; position:absolute; background-color:white; border:2px solid black; width:75%; padding:10px;">
-        <div id="closebutton" style="top:2px; right:2px; position:absolute">
-            <a href="javascript:hide('faqbox');"><img src="xbox.png" border=0 alt="X" title="OK, OK, I'll show you the map."></a>
-        </div>
-        <p>This map plots the approximate locations of power outages in Rochester, New York, and is updated every ten minutes.  The source data for this map is published by <A HREF="http://www.rge.com/Outages/outageinformation.html">RG&E</A>, but all map-related blame should go to <a href="http://hoopycat.com/~rtucker/">Ryan Tucker</a> &lt;<a href="mailto:rtucker@gmail.com">rtucker@gmail.com</a>&gt;.  You can find the source code <a href="https://github.com/rtucker/rgeoutages/">on GitHub</a>.</p>
-        <p>Some important tips to keep in mind...</p>
-        <ul>
-            <li><b>RG&E only publishes a list of street names.</b> This map's pointer will end up in the geographic center of the street, which will undoubtedly be wrong for really long streets.  Look for clusters of outages.</li>
-            <li><b>This map doesn't indicate the actual quantity of power outages or people without power.</b> There may be just one house without power on a street, or every house on a street.  There may be multiple unrelated outages on one street, too.  There's no way to know.</li>
-            <li><b>This page may be out of date.</b> If in doubt, check the as-of time.</li>
-        </ul>
-        <p>Also, be sure to check out RG&E's <a href="http://rge.com/Outages/">Outage Central</a> for official information, to report outages, or to check on the status of an outage.</p>
-        <hr>
-        <p><b>IF YOU HAVE A LIFE-THREATENING ELECTRICAL EMERGENCY, CALL RG&E AT 1-800-743-1701 OR CALL 911 IMMEDIATELY.  DO NOT TOUCH DOWNED ELECTRICAL LINES, EVER.  EVEN IF YOUR STREET IS LISTED HERE.</b></p>
-        <p style="font-size:xx-small;"><a href="https://github.com/rtucker/rgeoutages/commit/{git_version}">Software last modified {git_time}</a>.</p>
-    </div>
+    runs is a list of (run ID, time, base URL) from archive.runs().
+    """
+    state.fetcher.close()
+    for run, runtime, base_url in runs:
+        runstart = time.time()
+        state.fetcher = scrape_rge.ArchiveFetcher(archive, run)
+        state.base_url = base_url
+        changes = generateMap(state, StringIO.StringIO(), now=runtime)
+        log.write("%s: run %d, %d changes, replayed in %.2fs\n" % (time.strftime("%Y-%m-%d %H:%M", time.localtime(runtime)), run, changes, time.time() - runstart))
 
-    <div id="chartbox" class="hidden" style="top:45px; left:95px; position:absolute; background-color:white; border:2px solid black; padding:10px;">
-        <div id="closebutton" style="top:2px; right:2px; position:absolute">
-            <a href="javascript:hide('chartbox');"><img src="xbox.png" border=0 alt="X" title="Hide graph window"></a>
-        </div>
-        <div id="graphimage" style="background:url(http://munin.sodtech.net/hoopycat.com/framboise/rgeoutages-day.png); width:495px; height:271px;"></div>
-    </div>
-    """.format(asof_time = datetime.now().strftime("%A, %d %B %Y at %r"),
-               streets = len(markerlist),
-               s = s,
-               locales = '<br/>'.join(localelist),
-               git_version = git_version.strip(),
-               git_time = git_modtime)
-
-    sys.stdout.write(produceMapBody(bodytext))
+
+def parseWhen(text):
+    """Returns the Unix time of a local date (YYYY-MM-DD) or date and time
+    (YYYY-MM-DDTHH:MM).
+
+    >>> parseWhen('2011-03-01T12:30') - parseWhen('2011-03-01')
+    45000.0
+    """
+    for format in ('%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(text, format))
+        except ValueError:
+            pass
+    raise ValueError("%s is not YYYY-MM-DD or YYYY-MM-DDTHH:MM" % text)
+
+
+def lockOrExit():
+    """Takes LOCK_FILE, so that runs never overlap, or exits if another
+    run has it.  The lock lasts until the process exits.
+
+    Returns the lock file object.
+    """
+    lockfd = open(LOCK_FILE, 'a')
+    try:
+        fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        sys.stderr.write("%s is locked; another run is going.\n" % LOCK_FILE)
+        sys.exit(1)
+    return lockfd
+
+
+def runDaemon(state):
+    """Regenerates the map at intervals set by
+    nextInterval, until SIGTERM or SIGINT; a run under way is finished
+    first.  SIGHUP reloads the geocode cache from the database, so every
+    street is looked up afresh, and runs at once.
+
+    If QUERY_PORT is set, answers queries about each run's outages (see
+    nearby) in the meantime.
+    """
+    wake = threading.Event()
+    server = None
+    if QUERY_PORT:
+        server = nearby.QueryServer(QUERY_PORT, QUERY_HOST,
+                                    lambda street, town: locateStreet(state.geocache, town, street))
+        server.start()
+        sys.stderr.write("%s: answering queries on %s\n" % (time.asctime(), server.url))
+
+    flags = { 'stop': False, 'reload': False }
+
+    def stop(signum, frame):
+        flags['stop'] = True
+        wake.set()
+
+    def reload(signum, frame):
+        flags['reload'] = True
+        wake.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+    interval = DAEMON_MIN_INTERVAL
+    while not flags['stop']:
+        if flags['reload']:
+            flags['reload'] = False
+            state.geocache.flush()
+            state.geocache.preload()
+            state.outages = None
+
+        runstart = time.time()
+        try:
+            changes = generateMap(state, sys.stderr)
+        except Exception, e:
+            sys.stderr.write("%s: run failed: %s\n" % (time.asctime(), e))
+        else:
+            if server is not None and state.outages is not None:
+                server.index = nearby.OutageIndex(state.outages)
+            interval = nextInterval(interval, changes)
+            sys.stderr.write("%s: %d changes in %.1fs; next run in %ds\n" % (time.asctime(), changes, time.time() - runstart, interval))
+
+        wake.wait(max(0, interval - (time.time() - runstart)))
+        wake.clear()
+
+    if server is not None:
+        server.stop()
+
+
+if __name__ == '__main__':
+    # generate_map.py [debug | daemon | replay ARCHIVE [SINCE [UNTIL]]]
+    args = sys.argv[1:]
+    lockfd = lockOrExit()
+    state = MapState(archive=args[:1] != ['replay'])
+    try:
+        if args[:1] == ['daemon']:
+            runDaemon(state)
+        elif args[:1] == ['replay'] and len(args) > 1:
+            # best done in a scratch directory, with a copy of the
+            # database for the geocode cache
+            archive = scrape_rge.SnapshotArchive(args[1])
+            since = len(args) > 2 and parseWhen(args[2]) or None
+            until = len(args) > 3 and parseWhen(args[3]) or None
+            state.geocoder = offlineGeocode
+            replayRuns(state, archive, archive.runs(since, until), sys.stderr)
+            archive.close()
+        else:
+            generateMap(state, sys.stdout, args[:1] == ['debug'])
+    finally:
+        state.close()
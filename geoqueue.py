@@ -0,0 +1,172 @@
+#!/usr/bin/python
+
+# Rate-limited, concurrent geocoding queue.
+#
+# Lookups are submitted as they turn up, de-duplicated by key, and run by a
+# few worker threads that share a token bucket, so the geocoder sees at most
+# `rate` requests per second (with bursts of up to `burst`) and at most
+# `concurrency` requests in flight.  Results come back as they finish.
+# Failures the caller calls transient make everyone back off for a while,
+# doubling each time until something succeeds; lookups that come due in the
+# meantime fail at once with HeldOff rather than waiting.
+
+import Queue
+import threading
+import time
+
+
+# Bounds, in seconds, of the pause after a transient failure
+BACKOFF_MIN = 5
+BACKOFF_MAX = 15*60
+
+
+class HeldOff(Exception):
+    """Raised instead of waiting out a backoff."""
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket: rate tokens per second, holding at most
+    burst tokens.
+
+    backoff() stops handing out tokens for a while, twice as long each time
+    until recover() is called.  waited adds up the seconds spent sleeping
+    for tokens.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.stamp = time.time()
+        self.held_until = 0
+        self.pause = 0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, sleeping until one is available.
+
+        Raises HeldOff if backing off.
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                if now < self.held_until:
+                    raise HeldOff("Backing off until %s"
+                                  % time.asctime(time.localtime(self.held_until)))
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - max(self.stamp, self.held_until)) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            start = time.time()
+            time.sleep(wait)
+            with self.lock:
+                self.waited += time.time() - start
+
+    def backoff(self):
+        """Holds off all requests after a transient failure.
+
+        Returns the length of the pause.
+        """
+        with self.lock:
+            self.pause = min(BACKOFF_MAX, max(BACKOFF_MIN, self.pause * 2))
+            self.held_until = max(self.held_until, time.time() + self.pause)
+            self.tokens = 0
+            return self.pause
+
+    def recover(self):
+        """Resets the backoff after a success."""
+        with self.lock:
+            self.pause = 0
+
+
+class GeocodeQueue(object):
+    """Runs geocoding lookups in the background.
+
+    backend is a callable taking a query string and returning a result (as
+    generate_map.fetchGeocode does); it may raise.  limiter is a shared
+    TokenBucket, or one is made from rate and burst.  transient is a
+    callable telling whether an exception should make the limiter back off
+    (by default, all do).
+
+    submit() queues a lookup; completed() returns what has finished so far
+    without waiting, and finish() waits for the rest.  Both give tuples of
+    (key, result, exception), exactly one of result and exception set.
+    """
+
+    def __init__(self, backend, rate=1.0, burst=1, concurrency=4,
+                 limiter=None, transient=None):
+        self.backend = backend
+        self.transient = transient or (lambda e: True)
+        self.limiter = limiter or TokenBucket(rate, burst)
+        self.concurrency = max(1, concurrency)
+        self.todo = Queue.Queue()
+        self.done = Queue.Queue()
+        self.seen = set()
+        self.outstanding = 0
+        self.threads = []
+
+    def _worker(self):
+        while True:
+            item = self.todo.get()
+            if item is None:
+                return
+            key, query = item
+            try:
+                self.limiter.acquire()
+            except HeldOff, e:
+                self.done.put((key, None, e))
+                continue
+            try:
+                result = self.backend(query)
+            except Exception, e:
+                if self.transient(e):
+                    self.limiter.backoff()
+                self.done.put((key, None, e))
+            else:
+                self.limiter.recover()
+                self.done.put((key, result, None))
+
+    def submit(self, key, query):
+        """Queues a lookup, unless one for key is already pending.
+
+        Returns True if the lookup was queued.
+        """
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        if len(self.threads) < self.concurrency:
+            t = threading.Thread(target=self._worker)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+        self.outstanding += 1
+        self.todo.put((key, query))
+        return True
+
+    def completed(self):
+        """Returns list of lookups finished since the last call."""
+        out = []
+        while True:
+            try:
+                out.append(self.done.get_nowait())
+            except Queue.Empty:
+                break
+            self.seen.discard(out[-1][0])
+        self.outstanding -= len(out)
+        return out
+
+    def finish(self):
+        """Yields each remaining lookup as it finishes, then stops the
+        workers."""
+        while self.outstanding > 0:
+            item = self.done.get()
+            self.seen.discard(item[0])
+            self.outstanding -= 1
+            yield item
+        for t in self.threads:
+            self.todo.put(None)
+        self.threads = []
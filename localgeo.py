@@ -0,0 +1,233 @@
+#!/usr/bin/python
+
+# Offline geocoding from a local table of street centroids.
+#
+# The table lives in its own SQLite file, keyed by normalized town and
+# street name (see streetnames), and is read into memory whole, so a lookup
+# is a dictionary probe.  Places themselves are stored with an empty street
+# name.  It is filled from files on disk:
+#
+#   localgeo.py import [--db streets.sqlite3] extract.osm points.csv ...
+#
+# .osm files are OpenStreetMap XML extracts: every named highway becomes a
+# street, and place=* nodes become places.  A street's town is its
+# addr:city or is_in:city tag, or else the nearest place node.
+#
+# .csv files have a header row naming street, town, and lat/lon (or y/x)
+# columns, one point per row; ogr2ogr can write these from TIGER/Line
+# shapefiles with -lco GEOMETRY=AS_XY.  All the points for one street in
+# one town, from every file given, are averaged.
+
+import csv
+import itertools
+import math
+import sqlite3
+import sys
+import time
+
+from xml.etree import cElementTree
+
+import streetnames
+
+DEFAULT_FILE = "streets.sqlite3"
+
+PLACE_TYPES = ('city', 'town', 'village', 'hamlet', 'suburb')
+
+
+def initDB(filename=DEFAULT_FILE):
+    """Connect to and initialize a street centroid database.
+
+    Returns: db object
+    """
+
+    db = sqlite3.connect(filename)
+    db.execute("""create table if not exists streetcentroid
+        (town text, street text, name text, latitude real, longitude real,
+         sw_lat real, sw_lng real, ne_lat real, ne_lng real, points integer,
+         primary key (town, street))""")
+    db.commit()
+    return db
+
+
+class LocalGeocoder(object):
+    """Answers (town, street) lookups from a street centroid database."""
+
+    def __init__(self, filename=DEFAULT_FILE):
+        db = initDB(filename)
+        self.entries = {}
+        for row in db.execute("""select town, street, name, latitude,
+                                        longitude, sw_lat, sw_lng, ne_lat,
+                                        ne_lng
+                                 from streetcentroid"""):
+            self.entries[(row[0], row[1])] = row[2:]
+        db.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, street, *towns):
+        """Looks a street up in each of towns in turn; names are normalized
+        as by streetnames.
+
+        Returns dictionary like generate_map.fetchGeocode's, or None.
+        """
+        for town in towns:
+            row = self.entries.get((town, street))
+            if row is not None:
+                name, latitude, longitude = row[:3]
+                return { 'formattedaddress': name,
+                         'latitude': latitude,
+                         'longitude': longitude,
+                         'locationtype': street and 'GEOMETRIC_CENTER' or 'APPROXIMATE',
+                         'viewport': tuple(row[3:]) }
+        return None
+
+
+def store(db, points):
+    """Adds points to the database, averaging each (town, street).
+
+    points is an iterable of (town, street, latitude, longitude) with names
+    as they should be displayed; to average a street over several files,
+    pass all their points in one call.  Streets already in the database
+    are replaced.
+
+    Returns the number of streets stored.
+    """
+
+    streets = {}
+    for town, street, latitude, longitude in points:
+        key = (streetnames.normalize_place(town),
+               street and streetnames.normalize_street(street) or '')
+        s = streets.get(key)
+        if s is None:
+            name = street and '%s, %s, NY' % (street, town) or '%s, NY' % town
+            s = streets[key] = [name, 0.0, 0.0, 90.0, 180.0, -90.0, -180.0, 0]
+        s[1] += latitude
+        s[2] += longitude
+        s[3] = min(s[3], latitude)
+        s[4] = min(s[4], longitude)
+        s[5] = max(s[5], latitude)
+        s[6] = max(s[6], longitude)
+        s[7] += 1
+
+    db.executemany("""insert or replace into streetcentroid
+                        (town, street, name, latitude, longitude, sw_lat,
+                         sw_lng, ne_lat, ne_lng, points)
+                      values (?,?,?,?,?,?,?,?,?,?)""",
+                   [key + (s[0], s[1] / s[7], s[2] / s[7]) + tuple(s[3:])
+                    for key, s in streets.items()])
+    db.commit()
+    return len(streets)
+
+
+def read_csv(filename):
+    """Yields (town, street, latitude, longitude) from a CSV file."""
+
+    fd = open(filename, 'rb')
+    reader = csv.reader(fd)
+    header = [h.strip().lower() for h in reader.next()]
+
+    def column(*names):
+        for name in names:
+            if name in header:
+                return header.index(name)
+        raise ValueError("%s: no %s column" % (filename, '/'.join(names)))
+
+    streetcol = column('street', 'name', 'fullname')
+    towncol = column('town', 'city', 'place')
+    latcol = column('lat', 'latitude', 'y')
+    loncol = column('lon', 'lng', 'longitude', 'x')
+    for row in reader:
+        if row[streetcol] and row[towncol]:
+            yield (row[towncol], row[streetcol], float(row[latcol]),
+                   float(row[loncol]))
+    fd.close()
+
+
+def _osm_elements(filename):
+    # Yields each node, way and relation of an OSM XML extract as it ends,
+    # then drops it from the tree, so memory doesn't grow with the file.
+    context = cElementTree.iterparse(filename, events=('start', 'end'))
+    event, root = context.next()
+    for event, elem in context:
+        if event == 'end' and elem.tag in ('node', 'way', 'relation'):
+            yield elem
+            root.clear()
+
+
+def read_osm(filename):
+    """Yields (town, street, latitude, longitude) from an OSM XML extract.
+
+    Reads the file twice, so that only the nodes of named highways are held
+    in memory.
+    """
+
+    # first pass: which nodes the named highways need, and the places
+    ways = []
+    wanted = set()
+    places = []
+    for elem in _osm_elements(filename):
+        if elem.tag == 'node':
+            tags = dict((t.get('k'), t.get('v')) for t in elem.findall('tag'))
+            if tags.get('place') in PLACE_TYPES and tags.get('name'):
+                places.append((tags['name'], float(elem.get('lat')),
+                               float(elem.get('lon'))))
+        elif elem.tag == 'way':
+            tags = dict((t.get('k'), t.get('v')) for t in elem.findall('tag'))
+            if 'highway' in tags and tags.get('name'):
+                refs = [nd.get('ref') for nd in elem.findall('nd')]
+                wanted.update(refs)
+                ways.append((tags['name'],
+                             tags.get('addr:city') or tags.get('is_in:city'),
+                             refs))
+
+    # second pass: where those nodes are
+    nodes = {}
+    for elem in _osm_elements(filename):
+        if elem.tag == 'node' and elem.get('id') in wanted:
+            nodes[elem.get('id')] = (float(elem.get('lat')),
+                                     float(elem.get('lon')))
+
+    for name, latitude, longitude in places:
+        yield (name, '', latitude, longitude)
+
+    for street, town, refs in ways:
+        points = [nodes[ref] for ref in refs if ref in nodes]
+        if not points:
+            continue
+        if not town:
+            if not places:
+                continue
+            lat = sum(p[0] for p in points) / len(points)
+            lng = sum(p[1] for p in points) / len(points)
+            coslat = math.cos(math.radians(lat))
+            town = min(places, key=lambda p: (p[1] - lat)**2 +
+                                             ((p[2] - lng) * coslat)**2)[0]
+        for latitude, longitude in points:
+            yield (town, street, latitude, longitude)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    filename = DEFAULT_FILE
+    if args[:1] == ['--db']:
+        filename = args[1]
+        args = args[2:]
+
+    if args[:1] == ['import'] and len(args) > 1:
+        db = initDB(filename)
+        start = time.time()
+        sources = [source.lower().endswith('.osm') and read_osm(source)
+                   or read_csv(source) for source in args[1:]]
+        count = store(db, itertools.chain(*sources))
+        sys.stderr.write("%d files: %d streets in %.1fs\n"
+                         % (len(sources), count, time.time() - start))
+    elif args[:1] == ['lookup'] and len(args) == 3:
+        geocoder = LocalGeocoder(filename)
+        print geocoder.lookup(streetnames.normalize_street(args[2]),
+                              streetnames.normalize_place(args[1]))
+    else:
+        sys.stderr.write("Usage: %s [--db file] import file.osm|file.csv ...\n"
+                         "       %s [--db file] lookup town street\n"
+                         % (sys.argv[0], sys.argv[0]))
+        sys.exit(1)
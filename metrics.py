@@ -0,0 +1,176 @@
+#!/usr/bin/python
+
+# Per-run metrics, formatted for munin (see rgeoutages_munin.sh, which
+# just cats them) and in the Prometheus text format (for node_exporter's
+# textfile collector and the like).
+#
+# Metrics are a dictionary of:
+#   customers   customers without power, over all streets
+#   streets     streets with outages on the map (geocoded), as the munin
+#               graph has always counted them
+#   reported    streets with outages, as RG&E reports them, on the map
+#               or not
+#   towns       towns with outages
+#   counties    dictionary of county -> customers without power
+#   runtime     seconds the run took
+#   time        when the run finished
+#   geocode     dictionary of geocode cache stats (see GeocodeCache)
+#   pages       dictionary of page cache stats (see scrape_rge.PageCache)
+#   publish     dictionary of files and bytes written and skipped (see
+#               publish.Publisher)
+
+import re
+
+PREFIX = 'rgeoutages'
+
+
+def _fieldname(name):
+    return re.sub('[^a-z0-9_]', '_', name.lower())
+
+
+def munin_config(metrics):
+    """Returns munin plugin config output for metrics (multigraph)."""
+    lines = ["multigraph %s" % PREFIX,
+             "graph_title RG&E Power Outage Summary",
+             "graph_args --base 1000 -l 0",
+             "graph_vlabel outages",
+             "graph_category Climate",
+             "customers.draw AREA",
+             "customers.label customers without power",
+             "outages.draw LINE",
+             "outages.label streets affected",
+             "reported.draw LINE",
+             "reported.label streets reported",
+             "towns.draw LINE",
+             "towns.label towns affected",
+             "multigraph %s_counties" % PREFIX,
+             "graph_title RG&E Customers Without Power by County",
+             "graph_args --base 1000 -l 0",
+             "graph_vlabel customers",
+             "graph_category Climate"]
+    for county in sorted(metrics['counties']):
+        lines.append("county_%s.label %s" % (_fieldname(county), county))
+    lines += ["multigraph %s_run" % PREFIX,
+              "graph_title RG&E Outage Map Run",
+              "graph_args --base 1000 -l 0",
+              "graph_vlabel seconds / lookups",
+              "graph_category Climate",
+              "runtime.label run time (seconds)"]
+    for key in sorted(metrics['geocode']):
+        lines.append("geocode_%s.label geocode %s" % (key, key))
+    for key in sorted(metrics['pages']):
+        lines.append("pages_%s.label pages %s" % (key, key))
+    for key in sorted(metrics['publish']):
+        lines.append("publish_%s.label publish %s" % (key, key))
+    return '\n'.join(lines) + '\n'
+
+
+def munin_values(metrics):
+    """Returns munin plugin fetch output for metrics (multigraph)."""
+    lines = ["multigraph %s" % PREFIX,
+             "customers.value %d" % metrics['customers'],
+             "outages.value %d" % metrics['streets'],
+             "reported.value %d" % metrics['reported'],
+             "towns.value %d" % metrics['towns'],
+             "multigraph %s_counties" % PREFIX]
+    for county, customers in sorted(metrics['counties'].items()):
+        lines.append("county_%s.value %d" % (_fieldname(county), customers))
+    lines += ["multigraph %s_run" % PREFIX,
+              "runtime.value %.1f" % metrics['runtime']]
+    for key, value in sorted(metrics['geocode'].items()):
+        lines.append("geocode_%s.value %d" % (key, value))
+    for key, value in sorted(metrics['pages'].items()):
+        lines.append("pages_%s.value %d" % (key, value))
+    for key, value in sorted(metrics['publish'].items()):
+        lines.append("publish_%s.value %d" % (key, value))
+    return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus(metrics):
+    """Returns metrics in the Prometheus text exposition format.
+
+    >>> print prometheus({'customers': 12, 'streets': 2, 'reported': 3, 'towns': 1,
+    ...                   'counties': {'Monroe': 12}, 'runtime': 3.25,
+    ...                   'time': 1300000000, 'geocode': {'hits': 2},
+    ...                   'pages': {}, 'publish': {'written': 3,
+    ...                   'skipped': 1, 'writtenbytes': 900,
+    ...                   'skippedbytes': 300}}),
+    # HELP rgeoutages_customers_without_power Customers without power.
+    # TYPE rgeoutages_customers_without_power gauge
+    rgeoutages_customers_without_power 12
+    # HELP rgeoutages_streets Streets with outages on the map.
+    # TYPE rgeoutages_streets gauge
+    rgeoutages_streets 2
+    # HELP rgeoutages_streets_reported Streets with outages, on the map or not.
+    # TYPE rgeoutages_streets_reported gauge
+    rgeoutages_streets_reported 3
+    # HELP rgeoutages_towns Towns with outages.
+    # TYPE rgeoutages_towns gauge
+    rgeoutages_towns 1
+    # HELP rgeoutages_county_customers_without_power Customers without power, by county.
+    # TYPE rgeoutages_county_customers_without_power gauge
+    rgeoutages_county_customers_without_power{county="Monroe"} 12
+    # HELP rgeoutages_run_seconds How long the last run took.
+    # TYPE rgeoutages_run_seconds gauge
+    rgeoutages_run_seconds 3.25
+    # HELP rgeoutages_last_run_timestamp_seconds When the last run finished.
+    # TYPE rgeoutages_last_run_timestamp_seconds gauge
+    rgeoutages_last_run_timestamp_seconds 1300000000
+    # HELP rgeoutages_geocode_lookups Geocode lookups in the last run, by outcome.
+    # TYPE rgeoutages_geocode_lookups gauge
+    rgeoutages_geocode_lookups{result="hits"} 2
+    # HELP rgeoutages_pages Outage pages in the last run, by outcome.
+    # TYPE rgeoutages_pages gauge
+    # HELP rgeoutages_published_files Files published in the last run, by outcome.
+    # TYPE rgeoutages_published_files gauge
+    rgeoutages_published_files{result="skipped"} 1
+    rgeoutages_published_files{result="written"} 3
+    # HELP rgeoutages_published_bytes Bytes published in the last run, by outcome.
+    # TYPE rgeoutages_published_bytes gauge
+    rgeoutages_published_bytes{result="skipped"} 300
+    rgeoutages_published_bytes{result="written"} 900
+    """
+    lines = []
+
+    def gauge(name, help, samples):
+        lines.append("# HELP %s_%s %s" % (PREFIX, name, help))
+        lines.append("# TYPE %s_%s gauge" % (PREFIX, name))
+        for labels, value in samples:
+            if labels:
+                labels = '{%s}' % ','.join('%s="%s"' % (k, _label(v))
+                                           for k, v in labels)
+            lines.append("%s_%s%s %s" % (PREFIX, name, labels, value))
+
+    gauge('customers_without_power', "Customers without power.",
+          [('', metrics['customers'])])
+    gauge('streets', "Streets with outages on the map.",
+          [('', metrics['streets'])])
+    gauge('streets_reported', "Streets with outages, on the map or not.",
+          [('', metrics['reported'])])
+    gauge('towns', "Towns with outages.", [('', metrics['towns'])])
+    gauge('county_customers_without_power',
+          "Customers without power, by county.",
+          [((('county', county),), customers)
+           for county, customers in sorted(metrics['counties'].items())])
+    gauge('run_seconds', "How long the last run took.",
+          [('', '%g' % metrics['runtime'])])
+    gauge('last_run_timestamp_seconds', "When the last run finished.",
+          [('', int(metrics['time']))])
+    gauge('geocode_lookups', "Geocode lookups in the last run, by outcome.",
+          [((('result', key),), value)
+           for key, value in sorted(metrics['geocode'].items())])
+    gauge('pages', "Outage pages in the last run, by outcome.",
+          [((('result', key),), value)
+           for key, value in sorted(metrics['pages'].items())])
+    publish = metrics['publish']
+    gauge('published_files', "Files published in the last run, by outcome.",
+          [((('result', 'skipped'),), publish['skipped']),
+           ((('result', 'written'),), publish['written'])])
+    gauge('published_bytes', "Bytes published in the last run, by outcome.",
+          [((('result', 'skipped'),), publish['skippedbytes']),
+           ((('result', 'written'),), publish['writtenbytes'])])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,393 @@
+#!/usr/bin/python
+
+# "Outages near me": answers questions about the current outages over
+# HTTP, from an index kept in memory.
+#
+#   /near?lat=43.12&lng=-77.59
+#       streets out within radius km (default RADIUS) of a point, nearest
+#       first
+#   /near?street=Elmwood Ave&town=Brighton
+#       streets out within radius km (default RADIUS) of a street, nearest
+#       first
+#   /box?south=43.1&west=-77.6&north=43.2&east=-77.5
+#       streets out in a box
+#   /town?town=Brighton
+#       every street out in a town
+#   /street?street=Elmwood Ave[&town=Brighton]
+#       a street, wherever it's out (or in the one town)
+#
+# /near and /box take limit (default LIMIT) as well.  Names are matched
+# as normalized by streetnames, so "Elmwood Av" finds "ELMWOOD AVE".
+# Answers are JSON: count, and outages, each with its county, town,
+# location and street, TotalCustomers, CustomersWithoutPower,
+# EstimatedRestoration, address, latitude, longitude, firstreport and
+# stale, and for /near its distance in km; and indexed, when the index
+# was built.
+#
+# An OutageIndex is built from one run's outages (see outagerecords) and
+# never changes after; the next run's replaces it in a single assignment,
+# so a query sees one run or the other, never some of each.  Geocoded
+# streets go in a grid of CELL_SIZE degree cells, and a radius or box
+# query only looks in the cells it overlaps.
+#
+# generate_map.py daemon serves it on QUERY_PORT, if that is set,
+# rebuilding the index after every run.  Run on its own,
+#
+#   nearby.py [port]
+#
+# it serves data.json from the current directory, rebuilding when that
+# changes.  Either way, a street given to /near is placed from the
+# outages themselves or from what the geocoder already knows; queries
+# never go out to the Google.
+
+import BaseHTTPServer
+import math
+import os
+import SocketServer
+import sys
+import threading
+import time
+import urlparse
+
+try:
+    import json
+except:
+    import simplejson as json
+
+import outagerecords
+import streetnames
+
+PORT = 8081
+HOST = '127.0.0.1'
+
+# Grid cell size, in degrees (about a kilometer north to south)
+CELL_SIZE = 0.01
+
+# Default and largest radius for /near, in km, and default and largest
+# number of streets /near and /box answer with
+RADIUS = 1.0
+MAX_RADIUS = 50.0
+LIMIT = 50
+MAX_LIMIT = 1000
+
+# Standalone: the file to serve, and how often to look for a new one
+DATA_FILE = 'data.json'
+RELOAD_INTERVAL = 10
+
+EARTH_RADIUS = 6371.0
+
+
+def distance(lat1, lng1, lat2, lng2):
+    """Returns the great circle distance between two points, in km.
+
+    >>> round(distance(43.1566, -77.6088, 43.0481, -76.1474), 1)
+    119.3
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def describe(outage):
+    """Returns dictionary describing a StreetOutage, for answers."""
+    answer = outage.info()
+    answer.update({ 'county': outage.county,
+                    'town': outage.town,
+                    'location': outage.location,
+                    'street': outage.street,
+                    'address': outage.address,
+                    'latitude': outage.latitude,
+                    'longitude': outage.longitude,
+                    'firstreport': outage.firstreport,
+                    'stale': outage.stale })
+    return answer
+
+
+def _cell(lat, lng):
+    return (int(math.floor(lat / CELL_SIZE)), int(math.floor(lng / CELL_SIZE)))
+
+
+class OutageIndex(object):
+    """The outages of one run, indexed by place and by name.  Never
+    changed once built, so safe to query from any thread.
+
+    >>> index = OutageIndex(_example())
+    >>> [(o.street, round(km, 2)) for km, o in index.near(43.1230, -77.5900, 1.0)]
+    [('ELMWOOD AVE', 0.03), ('MONROE AVE', 0.88)]
+    >>> [o.street for o in index.box(43.0, -77.7, 43.125, -77.58)]
+    ['ELMWOOD AVE']
+    >>> [o.street for o in index.street('Elmwood Av', 'brighton')]
+    ['ELMWOOD AVE']
+    >>> len(index.town('PITTSFORD')), index.town('Perinton')
+    (1, [])
+    """
+
+    def __init__(self, outages):
+        self.cells = {}
+        self.towns = {}
+        self.streets = {}
+        self.count = 0
+        for outage in outages:
+            self.count += 1
+            town = streetnames.normalize_place(outage.town)
+            self.towns.setdefault(town, []).append(outage)
+            self.streets.setdefault(streetnames.normalize_street(outage.street),
+                                    []).append((town, outage))
+            if outage.latitude is not None:
+                self.cells.setdefault(_cell(outage.latitude, outage.longitude),
+                                      []).append(outage)
+        self.built = time.time()
+
+    def _cells(self, south, west, north, east):
+        # The cells overlapping a box that have anything in them
+        (i0, j0), (i1, j1) = _cell(south, west), _cell(north, east)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            return [outages for (i, j), outages in self.cells.items()
+                    if i0 <= i <= i1 and j0 <= j <= j1]
+        cells = self.cells
+        return [cells[i, j] for i in xrange(i0, i1 + 1)
+                            for j in xrange(j0, j1 + 1) if (i, j) in cells]
+
+    def near(self, lat, lng, radius=RADIUS, limit=LIMIT):
+        """Returns list of (distance in km, StreetOutage) for the geocoded
+        outages within radius km of a point, nearest first, up to limit."""
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        dlng = dlat / max(math.cos(math.radians(lat)), 0.01)
+        found = []
+        for outages in self._cells(lat - dlat, lng - dlng, lat + dlat, lng + dlng):
+            for outage in outages:
+                km = distance(lat, lng, outage.latitude, outage.longitude)
+                if km <= radius:
+                    found.append((km, outage))
+        found.sort(key=lambda item: item[0])
+        return found[:limit]
+
+    def box(self, south, west, north, east, limit=LIMIT):
+        """Returns list of the geocoded outages in a box, up to limit."""
+        found = []
+        for outages in self._cells(south, west, north, east):
+            for outage in outages:
+                if (south <= outage.latitude <= north and
+                        west <= outage.longitude <= east):
+                    found.append(outage)
+        found.sort(key=lambda outage: (outage.latitude, outage.longitude))
+        return found[:limit]
+
+    def town(self, town):
+        """Returns list of the outages in a town."""
+        return list(self.towns.get(streetnames.normalize_place(town), []))
+
+    def street(self, street, town=None):
+        """Returns list of the outages on a street, in any town or in
+        town."""
+        if town is not None:
+            town = streetnames.normalize_place(town)
+        return [outage for outagetown, outage in
+                self.streets.get(streetnames.normalize_street(street), [])
+                if town is None or outagetown == town]
+
+
+class QueryError(Exception):
+    """A query that can't be answered; status is the HTTP status."""
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+def _number(query, name, default=None, low=None, high=None):
+    value = query.get(name, [default])[0]
+    if value is None:
+        raise QueryError(400, "%s is needed" % name)
+    try:
+        value = float(value)
+    except ValueError:
+        raise QueryError(400, "%s isn't a number" % name)
+    if math.isnan(value) or (low is not None and not low <= value <= high):
+        raise QueryError(400, "%s should be between %s and %s" % (name, low, high))
+    return value
+
+
+def _text(query, name, required=True):
+    value = query.get(name, [None])[0]
+    if required and not value:
+        raise QueryError(400, "%s is needed" % name)
+    return value
+
+
+def answer(index, path, query, locate=None):
+    """Answers a query against index (an OutageIndex): path is one of
+    /near, /box, /town or /street and query its parameters, as from
+    urlparse.parse_qs.  locate, if given, is called with (street, town)
+    to place a street given to /near that isn't out itself; it returns
+    (latitude, longitude) or None.
+
+    Returns dictionary to send back as JSON.  Raises QueryError.
+
+    >>> index = OutageIndex(_example())
+    >>> answer(index, '/near', {'street': ['Monroe Ave'], 'town': ['Brighton']})['count']
+    2
+    >>> answer(index, '/near', {'street': ['Nowhere Ln'], 'town': ['Brighton']})
+    Traceback (most recent call last):
+    QueryError: Don't know where Nowhere Ln in Brighton is
+    """
+    if index is None:
+        raise QueryError(503, "No outages loaded yet")
+
+    if path == '/near':
+        radius = _number(query, 'radius', RADIUS, 0, MAX_RADIUS)
+        limit = int(_number(query, 'limit', LIMIT, 1, MAX_LIMIT))
+        if 'street' in query:
+            street = _text(query, 'street')
+            town = _text(query, 'town')
+            place = None
+            for outage in index.street(street, town):
+                if outage.latitude is not None:
+                    place = (outage.latitude, outage.longitude)
+                    break
+            if place is None and locate is not None:
+                place = locate(street, town)
+            if place is None:
+                raise QueryError(404, "Don't know where %s in %s is" % (street, town))
+            lat, lng = place
+        else:
+            lat = _number(query, 'lat', None, -90, 90)
+            lng = _number(query, 'lng', None, -180, 180)
+        found = index.near(lat, lng, radius, limit)
+        outages = []
+        for km, outage in found:
+            outage = describe(outage)
+            outage['distance'] = round(km, 3)
+            outages.append(outage)
+        return { 'latitude': lat, 'longitude': lng, 'radius': radius,
+                 'count': len(outages), 'outages': outages }
+
+    if path == '/box':
+        south = _number(query, 'south', None, -90, 90)
+        north = _number(query, 'north', None, south, 90)
+        west = _number(query, 'west', None, -180, 180)
+        east = _number(query, 'east', None, west, 180)
+        limit = int(_number(query, 'limit', LIMIT, 1, MAX_LIMIT))
+        found = index.box(south, west, north, east, limit)
+    elif path == '/town':
+        found = index.town(_text(query, 'town'))
+    elif path == '/street':
+        found = index.street(_text(query, 'street'),
+                             _text(query, 'town', required=False))
+    else:
+        raise QueryError(404, "No such query; try /near, /box, /town or /street")
+    return { 'count': len(found), 'outages': [describe(o) for o in found] }
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse.urlsplit(self.path)
+        try:
+            status = 200
+            body = answer(server.index, url.path, urlparse.parse_qs(url.query),
+                          server.locate)
+        except QueryError, e:
+            status = e.status
+            body = { 'error': str(e) }
+        if server.index is not None:
+            body['indexed'] = int(server.index.built)
+        body = json.dumps(body, separators=(',', ':'))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class QueryServer(object):
+    """Serves queries in a background thread.  Set index to a new
+    OutageIndex to change what it answers from; locate is as for
+    answer()."""
+
+    def __init__(self, port=PORT, host=HOST, locate=None):
+        self.httpd = _ThreadingServer((host, port), _Handler)
+        self.httpd.index = None
+        self.httpd.locate = locate
+        self.thread = None
+
+    def _getindex(self):
+        return self.httpd.index
+
+    def _setindex(self, index):
+        self.httpd.index = index
+
+    index = property(_getindex, _setindex)
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % self.httpd.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def read_index(filename=DATA_FILE):
+    """Builds an OutageIndex from a data.json file."""
+    fd = open(filename, 'r')
+    try:
+        tree = json.load(fd)
+    finally:
+        fd.close()
+    return OutageIndex(outagerecords.from_tree(tree))
+
+
+def _example():
+    # A few outages, for the doctests
+    outages = []
+    for town, street, lat, lng in (('Brighton', 'ELMWOOD AVE', 43.1232, -77.5897),
+                                   ('Brighton', 'MONROE AVE', 43.1300, -77.5950),
+                                   ('Pittsford', 'MAIN ST', 43.0906, -77.5150)):
+        outage = outagerecords.StreetOutage('Monroe', town, '', street,
+                                            100, 10, 'Assessing')
+        outage.geocoded({ 'formattedaddress': street, 'latitude': lat,
+                          'longitude': lng, 'locationtype': 'GEOMETRIC_CENTER',
+                          'viewport': (lat, lng, lat, lng) })
+        outages.append(outage)
+    return outages
+
+
+if __name__ == '__main__':
+    port = len(sys.argv) > 1 and int(sys.argv[1]) or PORT
+    server = QueryServer(port).start()
+    sys.stderr.write("Answering on %s\n" % server.url)
+    modified = None
+    try:
+        while True:
+            try:
+                mtime = os.stat(DATA_FILE).st_mtime
+                if mtime != modified:
+                    server.index = read_index(DATA_FILE)
+                    modified = mtime
+                    sys.stderr.write("Loaded %d outages from %s\n"
+                                     % (server.index.count, DATA_FILE))
+            except (IOError, OSError, ValueError), e:
+                sys.stderr.write("Couldn't load %s: %s\n" % (DATA_FILE, e))
+            time.sleep(RELOAD_INTERVAL)
+    except KeyboardInterrupt:
+        server.stop()
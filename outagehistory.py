@@ -0,0 +1,190 @@
+#!/usr/bin/python
+
+# Outage history: when each outage was first reported and when it went
+# away, kept in the same SQLite database as the geocode cache.
+#
+# outageevent is append-only: an 'open' row when an outage first shows up
+# on RG&E's pages and a 'close' row (pointing back at its open row) when
+# it is gone.  openoutage holds the outages open right now, so a run only
+# has to compare against that, and only writes what changed.  Outages are
+# keyed by generate_map.featureId, the same ID the marker feed uses.
+#
+#   outagehistory.py open
+#   outagehistory.py durations [days]
+
+import sqlite3
+import sys
+import time
+
+try:
+    import json
+except:
+    import simplejson as json
+
+DEFAULT_FILE = "rgeoutages.sqlite3"
+
+
+def create_tables(db):
+    db.execute("""create table if not exists outageevent
+        (id integer primary key, outage text, event text, time integer,
+         county text, town text, location text, street text,
+         formattedaddress text, customers integer, opened integer)""")
+    db.execute("""create index if not exists outageevent_outage
+                  on outageevent (outage)""")
+    db.execute("""create index if not exists outageevent_time
+                  on outageevent (time)""")
+    db.execute("""create table if not exists openoutage
+        (outage text primary key, opened integer, firstreport integer,
+         county text, town text, location text, street text,
+         formattedaddress text)""")
+    db.execute("""create table if not exists legacyhistory
+        (formattedaddress text primary key, firstreport integer)""")
+    db.commit()
+
+
+def import_json(db, filename):
+    """Takes first report times from an old history.json (formatted address
+    -> time).  OutageHistory uses them for outages still open on its first
+    run, then forgets them.
+
+    Returns the number of addresses imported.
+    """
+    fd = open(filename, 'r')
+    history = json.load(fd)
+    fd.close()
+    db.executemany("""insert or replace into legacyhistory
+                      (formattedaddress, firstreport) values (?,?)""",
+                   [(address, int(firstreport))
+                    for address, firstreport in history.items()])
+    db.commit()
+    return len(history)
+
+
+class OutageHistory(object):
+    """The outage history, as seen by a run.
+
+    observe() each outage seen this run; finish() then writes open events
+    for the new ones and close events for those not seen, in a single
+    transaction.  To use the same OutageHistory for another run, start()
+    it again.
+    """
+
+    def __init__(self, db, now=None):
+        self.db = db
+        self.open = dict(db.execute(
+                "select outage, firstreport from openoutage"))
+        self.legacy = dict(db.execute(
+                "select formattedaddress, firstreport from legacyhistory"))
+        self.start(now)
+
+    def start(self, now=None):
+        """Begins a run at now (by default, the current time)."""
+        if now is None:
+            now = time.time()
+        self.now = int(now)
+        self.seen = {}
+        self.new = {}
+
+    def observe(self, outage, county, town, location, street,
+                formattedaddress=None, customers=None):
+        """Notes an outage as still open.
+
+        Returns its first report time.
+        """
+        if outage in self.seen:
+            return self.seen[outage]
+        if outage in self.open:
+            firstreport = self.open[outage]
+        else:
+            firstreport = self.legacy.get(formattedaddress, self.now)
+            self.new[outage] = (firstreport, county, town, location, street,
+                                formattedaddress, customers)
+        self.seen[outage] = firstreport
+        return firstreport
+
+    def finish(self):
+        """Records what opened and closed since the last run.
+
+        Returns tuple of (number opened, number closed).
+        """
+        c = self.db.cursor()
+        for outage, (firstreport, county, town, location, street,
+                     formattedaddress, customers) in self.new.items():
+            c.execute("""insert into outageevent
+                         (outage, event, time, county, town, location, street,
+                          formattedaddress, customers)
+                         values (?,'open',?,?,?,?,?,?,?)""",
+                      (outage, firstreport, county, town, location, street,
+                       formattedaddress, customers))
+            c.execute("""insert or replace into openoutage
+                         (outage, opened, firstreport, county, town, location,
+                          street, formattedaddress)
+                         values (?,?,?,?,?,?,?,?)""",
+                      (outage, c.lastrowid, firstreport, county, town,
+                       location, street, formattedaddress))
+
+        closed = [outage for outage in self.open if outage not in self.seen]
+        c.executemany("""insert into outageevent
+                         (outage, event, time, county, town, location, street,
+                          formattedaddress, opened)
+                         select outage, 'close', ?, county, town, location,
+                                street, formattedaddress, opened
+                         from openoutage where outage=?""",
+                      [(self.now, outage) for outage in closed])
+        c.executemany("delete from openoutage where outage=?",
+                      [(outage,) for outage in closed])
+        if self.legacy:
+            c.execute("delete from legacyhistory")
+        self.db.commit()
+
+        for outage in closed:
+            del self.open[outage]
+        for outage, new in self.new.items():
+            self.open[outage] = new[0]
+        self.legacy = {}
+        return len(self.new), len(closed)
+
+
+def open_outages(db):
+    """Returns list of (outage, firstreport, county, town, location, street,
+    formattedaddress) for the outages open now, oldest first."""
+    return db.execute("""select outage, firstreport, county, town, location,
+                                street, formattedaddress
+                         from openoutage
+                         order by firstreport""").fetchall()
+
+
+def durations_by_town(db, days, now=None):
+    """Returns list of (county, town, outages closed, mean duration, longest
+    duration) for outages closed over the last days days, durations in
+    seconds, most outages first."""
+    if now is None:
+        now = time.time()
+    return db.execute("""select c.county, c.town, count(*),
+                                avg(c.time - o.time), max(c.time - o.time)
+                         from outageevent c
+                         join outageevent o on o.id = c.opened
+                         where c.event = 'close' and c.time >= ?
+                         group by c.county, c.town
+                         order by count(*) desc""",
+                      (int(now - days*24*60*60),)).fetchall()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    db = sqlite3.connect(DEFAULT_FILE)
+    create_tables(db)
+    if args[:1] == ['open']:
+        for row in open_outages(db):
+            print "%s  %s, %s, %s" % (time.strftime('%Y-%m-%d %H:%M', time.localtime(row[1])),
+                                      row[5], row[4], row[3])
+    elif args[:1] == ['durations']:
+        days = len(args) > 1 and float(args[1]) or 7
+        for county, town, count, mean, longest in durations_by_town(db, days):
+            print "%-20s %-20s %5d closed  mean %5.1fh  longest %5.1fh" % (
+                county, town, count, mean / 3600.0, longest / 3600.0)
+    else:
+        sys.stderr.write("Usage: %s open\n"
+                         "       %s durations [days]\n"
+                         % (sys.argv[0], sys.argv[0]))
+        sys.exit(1)
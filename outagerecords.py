@@ -0,0 +1,251 @@
+#!/usr/bin/python
+
+# The street outages of one run, kept compactly.
+#
+# A storm can put tens of thousands of streets out, and each used to be a
+# handful of dictionaries: the crawl's record, a copy for data.json, its
+# geocode result, and another copy of that for fitting the map.  Now each
+# is one StreetOutage, a slotted object with no dictionary of its own.
+# Names are interned, so every street in a town shares one copy of the
+# town's name, and the geocode result is kept as plain fields.
+#
+# An OutageTable holds a run's outages and hands out what the output files
+# need without copying them: the data.json tree, built a county at a time
+# as it is written, and the coordinates of the geocoded streets as arrays
+# of floats, filled in as they are added.
+#
+# A run can also pick up where the last one left off: a street that hasn't
+# changed since then (see OutageTable.unchanged) can keep its geocode
+# result and marker rather than having them worked out again.
+
+from array import array
+
+# Every name seen so far -> its one copy.  There are only so many streets.
+_names = {}
+
+
+def intern_name(name):
+    """Returns the shared copy of name (str or unicode).
+
+    >>> a = intern_name(''.join(['Brighton']))
+    >>> a is intern_name(''.join(['Brighton']))
+    True
+    """
+    return _names.setdefault(name, name)
+
+
+class StreetOutage(object):
+    """One street with customers out: where it is (county, town, location,
+    street), how many customers it has and how many are out (total, out),
+    and when power is due back (restoration).  stale is set if it comes
+    from an earlier copy of its page, RG&E's not having come through.
+
+    Once geocoded (see geocoded), address, latitude, longitude,
+    locationtype and viewport say where it is on the map.  firstreport is
+    when it was first seen out, or -1.  feature is its marker, once made,
+    and checked when it was geocoded, if the answer (a marker, or no such
+    address) can be carried forward to later runs.
+
+    >>> s = StreetOutage('Monroe', 'Brighton', '', 'ELMWOOD AVE', 40, 12, 'Assessing')
+    >>> sorted(s.data().items())
+    [('CustomersWithoutPower', 12), ('EstimatedRestoration', 'Assessing'), ('TotalCustomers', 40)]
+    >>> s.geocoded({'formattedaddress': 'Elmwood Ave, Brighton, NY', 'latitude': 43.12,
+    ...             'longitude': -77.59, 'locationtype': 'GEOMETRIC_CENTER',
+    ...             'viewport': (43.11, -77.6, 43.13, -77.58)})
+    >>> s.data()['geo']['formattedaddress']
+    'Elmwood Ave, Brighton, NY'
+    """
+
+    __slots__ = ('county', 'town', 'location', 'street', 'total', 'out',
+                 'restoration', 'stale', 'address', 'latitude', 'longitude',
+                 'locationtype', 'viewport', 'firstreport', 'feature',
+                 'checked')
+
+    def __init__(self, county, town, location, street, total, out,
+                 restoration):
+        name = _names.setdefault
+        self.county = name(county, county)
+        self.town = name(town, town)
+        self.location = name(location, location)
+        self.street = name(street, street)
+        self.total = total
+        self.out = out
+        self.restoration = name(restoration, restoration)
+        self.stale = False
+        self.address = self.latitude = self.longitude = None
+        self.locationtype = self.viewport = None
+        self.firstreport = -1
+        self.feature = self.checked = None
+
+    def geocoded(self, result):
+        """Notes down where the street is, given a geocode result
+        dictionary (formattedaddress, latitude, longitude, locationtype
+        and viewport)."""
+        self.address = result['formattedaddress']
+        self.latitude = result['latitude']
+        self.longitude = result['longitude']
+        self.locationtype = _names.setdefault(result['locationtype'],
+                                              result['locationtype'])
+        self.viewport = result['viewport']
+
+    def info(self):
+        """Returns dictionary of TotalCustomers, CustomersWithoutPower and
+        EstimatedRestoration."""
+        return { 'TotalCustomers': self.total,
+                 'CustomersWithoutPower': self.out,
+                 'EstimatedRestoration': self.restoration }
+
+    def data(self):
+        """Returns the street as data.json has it: info, plus geo (as the
+        geocode result, with the address shown) and firstreport if it was
+        geocoded, and stale if it's stale."""
+        data = self.info()
+        if self.stale:
+            data['stale'] = True
+        if self.latitude is not None:
+            data['geo'] = { 'formattedaddress': self.address,
+                            'latitude': self.latitude,
+                            'longitude': self.longitude,
+                            'locationtype': self.locationtype,
+                            'viewport': self.viewport }
+            data['firstreport'] = self.firstreport
+        return data
+
+
+class OutageTable(object):
+    """A run's street outages, in the order they were added, and the towns
+    they are in (county -> town -> town totals, as filled in by
+    scrape_rge.iter_outages).
+
+    latitudes and longitudes hold the coordinates of the geocoded outages,
+    in order.
+    """
+
+    def __init__(self, towns=None):
+        self.outages = []
+        self.counties = {}
+        if towns is None:
+            towns = {}
+        self.towns = towns
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.bykey = None
+
+    def __len__(self):
+        return len(self.outages)
+
+    def __iter__(self):
+        return iter(self.outages)
+
+    def add(self, outage):
+        """Adds a StreetOutage, geocoded or not."""
+        self.outages.append(outage)
+        self.counties.setdefault(outage.county, []).append(outage)
+        if self.bykey is not None:
+            self.bykey[outage.county, outage.town, outage.location,
+                       outage.street] = outage
+        if outage.latitude is not None:
+            self.latitudes.append(outage.latitude)
+            self.longitudes.append(outage.longitude)
+
+    def unchanged(self, outage, since):
+        """Looks up outage's street (by county, town, location and street
+        name) in this table.
+
+        Returns the StreetOutage here if it has the same counts,
+        restoration estimate and staleness, and was checked (see
+        StreetOutage) at since or later; otherwise None.
+
+        >>> table = OutageTable()
+        >>> old = StreetOutage('Monroe', 'Brighton', '', 'ELMWOOD AVE', 40, 12, 'Assessing')
+        >>> old.feature, old.checked = {'id': 'brighton|brighton|elmwood ave'}, 1000
+        >>> table.add(old)
+        >>> new = StreetOutage('Monroe', 'Brighton', '', 'ELMWOOD AVE', 40, 12, 'Assessing')
+        >>> table.unchanged(new, 900) is old, table.unchanged(new, 1100)
+        (True, None)
+        >>> new.stale = True
+        >>> table.unchanged(new, 900)
+        """
+        if self.bykey is None:
+            self.bykey = dict(((o.county, o.town, o.location, o.street), o)
+                              for o in self.outages)
+        old = self.bykey.get((outage.county, outage.town, outage.location,
+                              outage.street))
+        if (old is None or old.checked is None or old.checked < since
+                or old.out != outage.out or old.total != outage.total
+                or old.restoration != outage.restoration
+                or old.stale != outage.stale):
+            return None
+        return old
+
+    def tree(self):
+        """Returns the outages as data.json has them, county -> town ->
+        location -> street -> StreetOutage.data(), with every town in
+        towns.  Each county's part is only built when it is looked up.
+
+        >>> table = OutageTable({'Monroe': {'Pittsford': {}}})
+        >>> table.add(StreetOutage('Monroe', 'Brighton', '', 'ELMWOOD AVE', 40, 12, 'Assessing'))
+        >>> tree = table.tree()
+        >>> tree.keys()
+        ['Monroe']
+        >>> sorted(tree['Monroe'])
+        ['Brighton', 'Pittsford']
+        """
+        return _TreeView(self)
+
+
+def from_tree(tree):
+    """Reads outages back from a data.json tree (see OutageTable.tree).
+
+    Returns an OutageTable.
+
+    >>> table = OutageTable({'Monroe': {'Pittsford': {}}})
+    >>> table.add(StreetOutage('Monroe', 'Brighton', '', 'ELMWOOD AVE', 40, 12, 'Assessing'))
+    >>> again = from_tree(table.tree())
+    >>> [(o.town, o.street, o.out) for o in again], sorted(again.towns['Monroe'])
+    ([('Brighton', 'ELMWOOD AVE', 12)], ['Brighton', 'Pittsford'])
+    """
+    table = OutageTable()
+    for county in sorted(tree.keys()):
+        countytree = tree[county]
+        for town, towntree in sorted(countytree.items()):
+            table.towns.setdefault(county, {})[town] = {}
+            for location, streets in sorted(towntree.items()):
+                for street, data in sorted(streets.items()):
+                    outage = StreetOutage(county, town, location, street,
+                                          data['TotalCustomers'],
+                                          data['CustomersWithoutPower'],
+                                          data['EstimatedRestoration'])
+                    outage.stale = data.get('stale', False)
+                    if 'geo' in data:
+                        outage.geocoded(data['geo'])
+                        outage.firstreport = data['firstreport']
+                    table.add(outage)
+    return table
+
+
+class _TreeView(object):
+    # A read-only mapping of county -> that county's part of the tree, built
+    # when asked for.  Enough of a dictionary for generate_map.writeJSON.
+
+    def __init__(self, table):
+        self.table = table
+
+    def keys(self):
+        return list(set(self.table.counties) | set(self.table.towns))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, county):
+        if county not in self.table.towns and county not in self.table.counties:
+            raise KeyError(county)
+        tree = dict((town, {}) for town in self.table.towns.get(county, {}))
+        for outage in self.table.counties.get(county, []):
+            # the last of any repeats wins
+            tree.setdefault(outage.town, {}).setdefault(
+                outage.location, {})[outage.street] = outage.data()
+        return tree
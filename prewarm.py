@@ -0,0 +1,148 @@
+#!/usr/bin/python
+
+# Fills and refreshes the geocode cache ahead of time, so that storm-time
+# runs of generate_map.py find nearly everything already cached.
+#
+# Usage: prewarm.py [--budget N] [--horizon DAYS] [source ...]
+#
+# Sources are street lists (one "town|location|street" per line; location
+# may be empty) or data.json files saved from earlier runs.  Every street
+# already in the cache is a candidate too.  Streets never geocoded go
+# first, then cached ones by age, oldest (closest to expiry) first; cached
+# streets with more than --horizon days left are skipped, as are streets
+# whose last lookup came back empty and is still backing off, and streets
+# the local street table (see localgeo) already answers.  Town centers
+# aren't looked up; runs don't use them.  At most --budget requests are
+# made, paced like generate_map's own.
+#
+# Takes generate_map's lock (LOCK_FILE) while it works, so it never writes
+# the cache at the same time as a run; it exits if a run, or the daemon,
+# has it.
+
+import os
+import sys
+import time
+
+import generate_map
+import geoqueue
+import localgeo
+
+from generate_map import json
+
+DEFAULT_BUDGET = 1000
+DEFAULT_HORIZON = 2
+
+
+def read_streets(filename):
+    """Yields (town, location, street) from a street list or data.json."""
+
+    fd = open(filename, 'r')
+    if filename.endswith('.json'):
+        data = json.load(fd)
+        for county in data.values():
+            for town, locations in county.items():
+                for location, streets in locations.items():
+                    for street in streets:
+                        yield (town, location, street)
+    else:
+        for line in fd:
+            fields = line.rstrip('\r\n').split('|')
+            if len(fields) == 3 and fields[0] and not line.startswith('#'):
+                yield tuple(fields)
+    fd.close()
+
+
+def candidates(cache, streets, horizon=DEFAULT_HORIZON, now=None):
+    """Picks the streets worth a lookup, in the order they should get one.
+
+    streets is an iterable of (town, location, street) as RG&E names them.
+    Town centers (no street), from there or the cache, are left out.
+
+    Returns list of (cache key, query).
+    """
+
+    if now is None:
+        now = time.time()
+    cutoff = now - generate_map.GEOCODE_TTL + horizon*24*60*60
+
+    queries = {}
+    for town, location, street in streets:
+        key, query = generate_map.geocodeKey(town, location, street)
+        queries[key] = query
+    for key in cache.entries:
+        if key not in queries:
+            queries[key] = generate_map.geocodeKey(*key)[1]
+
+    due = []
+    for key, query in queries.items():
+        if not key[2]:
+            continue
+        if cache.local is not None and cache.local.lookup(key[2], key[1], key[0]):
+            continue
+        failure = cache.getFailure(key)
+        if failure and failure[2] > now:
+            continue
+        cached = cache.get(key)
+        if cached is None:
+            due.append((0, key, query))
+        elif cached[1] < cutoff:
+            due.append((cached[1], key, query))
+    due.sort()
+    return [(key, query) for lastcheck, key, query in due]
+
+
+def prewarm(cache, todo, budget=DEFAULT_BUDGET):
+    """Looks up streets from candidates() through a GeocodeQueue, up to
+    budget requests, settling each answer into cache.
+
+    Returns number of streets refreshed.
+    """
+
+    queue = geoqueue.GeocodeQueue(generate_map.fetchGeocode,
+                                  concurrency=generate_map.GEOCODE_CONCURRENCY,
+                                  limiter=generate_map.geocodeLimiter,
+                                  transient=lambda e: not generate_map.isNegative(e))
+    for key, query in todo[:budget]:
+        queue.submit(key, query)
+
+    refreshed = 0
+    for key, result, error in queue.finish():
+        result, error = cache.settle(key, result, error)
+        if error is None:
+            refreshed += 1
+    cache.flush()
+    return refreshed
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    budget = DEFAULT_BUDGET
+    horizon = DEFAULT_HORIZON
+    while args[:1] in (['--budget'], ['--horizon']):
+        if args[0] == '--budget':
+            budget = int(args[1])
+        else:
+            horizon = float(args[1])
+        args = args[2:]
+
+    streets = []
+    for filename in args:
+        streets.extend(read_streets(filename))
+
+    lockfd = generate_map.lockOrExit()
+    db = generate_map.initDB()
+    if os.path.exists(generate_map.LOCALGEO_FILE):
+        cache = generate_map.GeocodeCache(db, localgeo.LocalGeocoder(
+                                                  generate_map.LOCALGEO_FILE))
+    else:
+        cache = generate_map.GeocodeCache(db)
+    cache.preload()
+
+    todo = candidates(cache, streets, horizon)
+    start = time.time()
+    refreshed = prewarm(cache, todo, budget)
+    sys.stderr.write("%d due, %d looked up, %d refreshed, %d failed, "
+                     "%d held off in %.1fs\n"
+                     % (len(todo), min(len(todo), budget), refreshed,
+                        cache.stats['failed'], cache.stats['suppressed'],
+                        time.time() - start))
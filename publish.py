@@ -0,0 +1,153 @@
+#!/usr/bin/python
+
+# Publishing of the files the web server hands out.
+#
+# Each file is written to a temporary name and renamed into place, so
+# nobody ever sees half of one.  A file whose content hasn't changed is
+# left alone, so its mtime (and the ETag the web server makes from it)
+# stays put and caches stay warm.  Alongside each file go .gz and, if the
+# brotli module is installed, .br copies for a web server to send as they
+# are (nginx's gzip_static and brotli_static, say).
+#
+# Big files can be written a piece at a time through Publisher.open(), so
+# they never have to be held in memory whole.
+
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Size of the pieces files are read in
+CHUNK_SIZE = 256*1024
+
+
+def _gzip(src, dst):
+    # gzips file src to file dst, with no name or timestamp in the header,
+    # so the same content always gzips the same
+    fd = gzip.GzipFile(filename='', mode='wb', fileobj=dst, compresslevel=9,
+                       mtime=0)
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), ''):
+        fd.write(chunk)
+    fd.close()
+
+
+def _brotli(src, dst):
+    dst.write(brotli.compress(src.read()))
+
+
+def _compress(filename, suffix, compressor):
+    # Writes a compressed copy of filename to filename + suffix.  Returns
+    # its size.
+    src = open(filename, 'rb')
+    dst = open(filename + suffix + '.new', 'wb')
+    try:
+        compressor(src, dst)
+    finally:
+        src.close()
+        dst.close()
+    os.rename(filename + suffix + '.new', filename + suffix)
+    return os.path.getsize(filename + suffix)
+
+
+class PublishStream(object):
+    """A file being published, written a piece at a time (see
+    Publisher.open)."""
+
+    def __init__(self, publisher, filename, compress):
+        self.publisher = publisher
+        self.filename = filename
+        self.compress = compress
+        self.fd = open(filename + '.new', 'wb')
+        self.sha = hashlib.sha1()
+        self.length = 0
+
+    def write(self, data):
+        self.fd.write(data)
+        self.sha.update(data)
+        self.length += len(data)
+
+    def close(self):
+        """Puts the file in place if it changed.  Returns True if anything
+        was written."""
+        self.fd.close()
+        return self.publisher._finish(self.filename, self.sha.hexdigest(),
+                                      self.length, self.compress)
+
+
+class Publisher(object):
+    """Writes files only when their content changes.
+
+    Content hashes are remembered between calls, and read from the files
+    on disk the first time each is published.
+
+    stats counts files and bytes 'written' and 'skipped' (unchanged) since
+    creation.
+    """
+
+    def __init__(self):
+        self.hashes = {}
+        self.stats = dict.fromkeys(('written', 'skipped', 'writtenbytes',
+                                    'skippedbytes'), 0)
+
+    def _hash(self, filename):
+        if filename not in self.hashes:
+            try:
+                fd = open(filename, 'rb')
+                sha = hashlib.sha1()
+                for chunk in iter(lambda: fd.read(CHUNK_SIZE), ''):
+                    sha.update(chunk)
+                fd.close()
+                self.hashes[filename] = sha.hexdigest()
+            except IOError:
+                self.hashes[filename] = None
+        return self.hashes[filename]
+
+    def open(self, filename, compress=True):
+        """Returns a PublishStream for writing filename a piece at a time;
+        closing it does what publish() does."""
+        return PublishStream(self, filename, compress)
+
+    def publish(self, filename, content, compress=True):
+        """Writes content (a str) to filename if it differs from what is
+        there, along with .gz and .br copies if compress is set.
+
+        Returns True if anything was written.
+        """
+        stream = self.open(filename, compress)
+        stream.write(content)
+        return stream.close()
+
+    def _finish(self, filename, digest, length, compress):
+        siblings = []
+        if compress:
+            siblings.append(('.gz', _gzip))
+            if brotli is not None:
+                siblings.append(('.br', _brotli))
+
+        changed = digest != self._hash(filename)
+        written = False
+        if changed:
+            os.rename(filename + '.new', filename)
+            self.hashes[filename] = digest
+            self.stats['written'] += 1
+            self.stats['writtenbytes'] += length
+            written = True
+        else:
+            os.remove(filename + '.new')
+            self.stats['skipped'] += 1
+            self.stats['skippedbytes'] += length
+
+        for suffix, compressor in siblings:
+            if changed or not os.path.exists(filename + suffix):
+                self.stats['writtenbytes'] += _compress(filename, suffix,
+                                                        compressor)
+                written = True
+        if compress and brotli is None and os.path.exists(filename + '.br'):
+            # don't leave a stale copy behind for the web server to find
+            os.remove(filename + '.br')
+        return written
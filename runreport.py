@@ -0,0 +1,230 @@
+#!/usr/bin/python
+
+# Per-run instrumentation: where a run of the map generator spent its time.
+#
+# A RunReport collects
+#   stages  wall, busy and CPU seconds, calls and longest call per named
+#           stage (page fetches, parsing, geocoder requests, rendering...)
+#   fetch   page fetch latency: a histogram per host, and the time and
+#           HTTP status of each URL
+#   values  whatever else the run notes down (cache stats, record counts)
+# and hands it all back as a dictionary for dumping as JSON.
+#
+# A stage's wall time is how long it had a call in progress; its busy
+# time adds up every call, so for stages that run in several threads at
+# once (parse, geocode) it can be many times the wall time.  CPU time is
+# the whole process's, so those stages share it out among themselves.
+#
+# NULL does nothing, for runs that don't want a report: its stage() is one
+# shared do-nothing context manager and its timed() hands back the function
+# untouched, so instrumented code costs next to nothing.
+
+import os
+import threading
+import time
+import urlparse
+
+# Upper bounds of the fetch latency histogram buckets, in seconds
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _cpu():
+    user, system = os.times()[:2]
+    return user + system
+
+
+class _Stage(object):
+    # Times one pass through a stage.
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+
+    def __enter__(self):
+        self.wall = self.report._begin(self.name)
+        self.cpu = _cpu()
+
+    def __exit__(self, type, value, traceback):
+        cpu = _cpu() - self.cpu
+        self.report._end(self.name, self.wall, cpu)
+
+
+class RunReport(object):
+    """Timings and counts for one run.  Safe to use from worker threads.
+
+    >>> report = RunReport()
+    >>> with report.stage('render'):
+    ...     pass
+    >>> report.fetched('http://example.com/RGE.html', 0.2, 200)
+    >>> report.note('streets', 12)
+    >>> data = report.report()
+    >>> data['stages']['render']['calls'], data['values']
+    (1, {'streets': 12})
+
+    Overlapping calls count once towards wall time, and each towards busy.
+
+    >>> first, second = report.stage('geocode'), report.stage('geocode')
+    >>> first.__enter__(); second.__enter__()
+    >>> time.sleep(0.1)
+    >>> first.__exit__(None, None, None); second.__exit__(None, None, None)
+    >>> geocode = report.report()['stages']['geocode']
+    >>> round(geocode['wall'], 1), round(geocode['busy'], 1)
+    (0.1, 0.2)
+    >>> data['fetch']['hosts']['example.com']['buckets'][:4]
+    [[0.05, 0], [0.1, 0], [0.25, 1], [0.5, 1]]
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.startcpu = _cpu()
+        self.stages = {}
+        self.hosts = {}
+        self.urls = {}
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def stage(self, name):
+        """Returns a context manager timing a pass through stage name."""
+        return _Stage(self, name)
+
+    def timed(self, name, func):
+        """Returns func wrapped to time each call as stage name."""
+        def timed(*args, **kwargs):
+            with _Stage(self, name):
+                return func(*args, **kwargs)
+        return timed
+
+    def _stage(self, name):
+        # The named stage's totals; call with lock held
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'calls': 0, 'wall': 0.0,
+                                         'busy': 0.0, 'cpu': 0.0, 'max': 0.0,
+                                         'active': 0, 'since': 0.0}
+        return stage
+
+    def _begin(self, name):
+        # Notes a call to stage name starting.  Returns the time.
+        now = time.time()
+        with self.lock:
+            stage = self._stage(name)
+            if not stage['active']:
+                stage['since'] = now
+            stage['active'] += 1
+        return now
+
+    def _end(self, name, start, cpu):
+        # Notes a call to stage name, started at start, ending
+        now = time.time()
+        with self.lock:
+            stage = self._stage(name)
+            stage['active'] -= 1
+            if not stage['active']:
+                stage['wall'] += now - stage['since']
+            stage['calls'] += 1
+            stage['busy'] += now - start
+            stage['cpu'] += cpu
+            stage['max'] = max(stage['max'], now - start)
+
+    def add(self, name, wall, cpu=0.0, calls=1, busy=None):
+        """Adds time spent in stage name: wall seconds, and busy seconds
+        over all threads (wall by default)."""
+        if busy is None:
+            busy = wall
+        with self.lock:
+            stage = self._stage(name)
+            stage['calls'] += calls
+            stage['wall'] += wall
+            stage['busy'] += busy
+            stage['cpu'] += cpu
+            stage['max'] = max(stage['max'], wall)
+
+    def fetched(self, url, seconds, status):
+        """Notes a page fetch: how long it took and its HTTP status (None
+        if it failed)."""
+        host = urlparse.urlsplit(url).netloc
+        with self.lock:
+            entry = self.hosts.get(host)
+            if entry is None:
+                entry = self.hosts[host] = {'count': 0, 'seconds': 0.0,
+                                            'max': 0.0,
+                                            'buckets': [0] * len(FETCH_BUCKETS)}
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            for i, bound in enumerate(FETCH_BUCKETS):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+            self.urls[url] = {'seconds': round(seconds, 4), 'status': status}
+
+    def note(self, name, value):
+        """Notes down value (anything JSON can take) under name."""
+        self.values[name] = value
+
+    def report(self):
+        """Returns the report as a dictionary."""
+        now = time.time()
+        with self.lock:
+            stages = dict((name, {'calls': stage['calls'],
+                                  'wall': round(stage['wall'], 4),
+                                  'busy': round(stage['busy'], 4),
+                                  'cpu': round(stage['cpu'], 4),
+                                  'max': round(stage['max'], 4)})
+                          for name, stage in self.stages.items())
+            hosts = dict((host, {'count': entry['count'],
+                                 'seconds': round(entry['seconds'], 4),
+                                 'max': round(entry['max'], 4),
+                                 # cumulative, as Prometheus does it
+                                 'buckets': [list(bucket) for bucket in
+                                             zip(FETCH_BUCKETS, entry['buckets'])]})
+                         for host, entry in self.hosts.items())
+            urls = dict(self.urls)
+        return { 'started': int(self.started),
+                 'wall': round(now - self.started, 4),
+                 'cpu': round(_cpu() - self.startcpu, 4),
+                 'stages': stages,
+                 'fetch': {'hosts': hosts, 'urls': urls},
+                 'values': dict(self.values) }
+
+    def summary(self):
+        """Returns a line of the stages, slowest first, with their busy
+        time too where calls overlapped."""
+        stages = self.report()['stages']
+        return ', '.join("%s %.2fs/%d%s" % (name, stage['wall'], stage['calls'],
+                                            stage['busy'] > stage['wall'] + 0.005
+                                            and " (%.2fs busy)" % stage['busy'] or '')
+                         for name, stage in sorted(stages.items(),
+                                                   key=lambda i: -i[1]['wall']))
+
+
+class _NullStage(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+class NullReport(object):
+    """A RunReport that notes nothing down."""
+
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def timed(self, name, func):
+        return func
+
+    def add(self, name, wall, cpu=0.0, calls=1, busy=None):
+        pass
+
+    def fetched(self, url, seconds, status):
+        pass
+
+    def note(self, name, value):
+        pass
+
+
+NULL = NullReport()
@@ -3,13 +3,33 @@
 # Scrapes RG&E outage information.
 # Requires:
 #   python-pycurl
-#   python-beautifulsoup
+#   python-beautifulsoup (optional; only for PARSER = 'soup')
 
+import hashlib
+import HTMLParser
 import os
 import pycurl
+import Queue
+import re
+import sqlite3
 import StringIO
+import threading
+import time
+import urlparse
+import zlib
 
-from BeautifulSoup import BeautifulSoup
+try:
+    from BeautifulSoup import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+try:
+    import json
+except:
+    import simplejson as json
+
+import outagerecords
+import runreport
 
 BASE_URL="http://www3.rge.com/OutageReports/"
 START_URL="RGE.html"
@@ -22,15 +42,198 @@ except IOError:
 
 USERAGENT="rgeoutages/%s (http://hoopycat.com/rgeoutages/; version %s)" % (GIT_MODTIME, GIT_VERSION)
 
-def get_url(url):
-    c = pycurl.Curl()
+# Concurrency limits for crawl_outages: total worker threads, and how many
+# of them may talk to any one host at a time.
+MAX_WORKERS = 8
+MAX_PER_HOST = 4
+
+# Fetch limits: seconds to connect and seconds for a whole request, and
+# how many times a Fetcher retries a request that fails or gets a 5xx
+# (waiting RETRY_DELAY seconds, doubling each time).  A Fetcher's
+# deadline, if it has one, cuts all of these short.
+CONNECT_TIMEOUT = 10
+REQUEST_TIMEOUT = 30
+FETCH_RETRIES = 2
+RETRY_DELAY = 1.0
+
+# Where SnapshotArchive keeps its crawls by default
+SNAPSHOT_FILE = "snapshots.sqlite3"
+
+# Which parser parse_page uses: 'fast' (TableExtractor) or 'soup'
+# (BeautifulSoup and scrape_table, the original implementation).
+PARSER = 'fast'
+
+class FetchError(IOError):
+    """A page couldn't be fetched: it kept failing, or time ran out."""
+
+def get_response(url, curl=None, headers=None, timeout=REQUEST_TIMEOUT):
+    """Fetches a URL, optionally reusing a pycurl.Curl handle (and with it,
+    libcurl's kept-alive connection) and sending extra request headers.
+    The request is given up on (raising pycurl.error) after timeout
+    seconds, or CONNECT_TIMEOUT if it hasn't connected by then.
+
+    Returns tuple of (status code, dictionary of lowercased response
+    headers, StringIO of the response body).
+    """
+    c = curl or pycurl.Curl()
     c.setopt(pycurl.URL, str(url))
     c.setopt(pycurl.USERAGENT, USERAGENT)
+    c.setopt(pycurl.NOSIGNAL, 1)
+    # (0 would mean no limit at all)
+    c.setopt(pycurl.CONNECTTIMEOUT_MS, max(1, int(min(CONNECT_TIMEOUT, timeout) * 1000)))
+    c.setopt(pycurl.TIMEOUT_MS, max(1, int(timeout * 1000)))
+    c.setopt(pycurl.HTTPHEADER, headers or [])
     b = StringIO.StringIO()
     c.setopt(pycurl.WRITEFUNCTION, b.write)
+    h = {}
+    def header(line):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            h[key.strip().lower()] = value.strip()
+    c.setopt(pycurl.HEADERFUNCTION, header)
     c.perform()
     b.seek(0)
-    return b
+    return (c.getinfo(pycurl.RESPONSE_CODE), h, b)
+
+def get_url(url, curl=None):
+    """Fetches a URL.  Returns a StringIO of the response body."""
+    return get_response(url, curl)[2]
+
+class Fetcher(object):
+    """Fetches pages over a bounded pool of persistent connections.
+
+    Each worker owns a pycurl.Curl handle for the life of the Fetcher, so
+    repeated requests to the same host reuse the connection.  At most
+    per_host requests are in flight to any single host.
+
+    A request that fails or gets a 5xx is tried again, up to retries
+    times; one that times out is not, having had its time.  If deadline
+    (a time.time(); none by default) is set, requests are cut short to end
+    by then, and none are started after.
+
+    Each fetch is noted in report (a runreport.RunReport; none by default).
+    """
+
+    def __init__(self, workers=MAX_WORKERS, per_host=MAX_PER_HOST):
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.handles = Queue.Queue()
+        for i in range(self.workers):
+            self.handles.put(pycurl.Curl())
+        self.host_slots = {}
+        self.lock = threading.Lock()
+        self.retries = FETCH_RETRIES
+        self.deadline = None
+        self.report = runreport.NULL
+
+    def _host_slot(self, url):
+        host = urlparse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_slots[host]
+
+    def fetch_response(self, url, headers=None):
+        """Fetches a single URL, retrying as need be.
+
+        Returns the same tuple as get_response.  Raises FetchError if it
+        timed out, the last try failed or got a 5xx, or the deadline came
+        first.
+        """
+        tries = 0
+        while True:
+            try:
+                response = self._fetch_once(url, headers)
+                if response[0] < 500:
+                    return response
+                error = "HTTP status %d" % response[0]
+            except pycurl.error, e:
+                if e.args[0] == pycurl.E_OPERATION_TIMEDOUT:
+                    raise FetchError("%s: %s" % (url, e.args[-1]))
+                error = e.args[-1]
+            tries += 1
+            delay = RETRY_DELAY * 2 ** (tries - 1)
+            if tries > self.retries:
+                raise FetchError("%s: %s (tried %d times)" % (url, error, tries))
+            if self.deadline is not None and time.time() + delay >= self.deadline:
+                raise FetchError("%s: %s (no time left to retry)" % (url, error))
+            time.sleep(delay)
+
+    def _fetch_once(self, url, headers):
+        slot = self._host_slot(url)
+        handle = self.handles.get()
+        try:
+            with slot:
+                timeout = REQUEST_TIMEOUT
+                if self.deadline is not None:
+                    timeout = min(timeout, self.deadline - time.time())
+                    if timeout <= 0:
+                        raise FetchError("%s: out of time" % url)
+                start = time.time()
+                status = None
+                try:
+                    response = get_response(url, handle, headers, timeout)
+                    status = response[0]
+                    return response
+                finally:
+                    self.report.fetched(url, time.time() - start, status)
+        finally:
+            self.handles.put(handle)
+
+    def fetch(self, url):
+        """Fetches a single URL.  Returns the response body as a string."""
+        return self.fetch_response(url)[2].getvalue()
+
+    def imap(self, func, items):
+        """Calls func on each of a collection of items concurrently, using
+        up to one thread per worker.
+
+        Yields (item, result) tuples in the order the calls complete.  The
+        first exception raised by any call is re-raised here.
+        """
+        items = list(set(items))
+        todo = Queue.Queue()
+        for item in items:
+            todo.put(item)
+        done = Queue.Queue()
+        stop = []
+
+        def worker():
+            while not stop:
+                try:
+                    item = todo.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    done.put((item, func(item), None))
+                except Exception, e:
+                    done.put((item, None, e))
+
+        for i in range(min(self.workers, len(items))):
+            t = threading.Thread(target=worker)
+            t.daemon = True
+            t.start()
+
+        try:
+            for i in range(len(items)):
+                item, result, error = done.get()
+                if error is not None:
+                    raise error
+                yield (item, result)
+        finally:
+            # Workers finish what they're doing and take nothing more.
+            stop.append(True)
+
+    def map(self, func, items):
+        """Like imap, but waits for every call.
+
+        Returns dictionary of item to result.
+        """
+        return dict(self.imap(func, items))
+
+    def close(self):
+        while not self.handles.empty():
+            self.handles.get().close()
 
 def clean_int(num):
     return int(num.replace(',', ''))
@@ -44,13 +247,15 @@ def scrape_table(table):
             if len(row('th')) > 1 and str(row.th.string) != str('&nbsp;'):
                 headings = [cell.renderContents() for cell in row('th')]
         elif row.td:
-            contents = [cell.renderContents() for cell in row('td')]
+            cells = row('td')
+            contents = [cell.renderContents() for cell in cells]
             href = None
-            if row('td')[0].a:
-                for attr in row('td')[0].a.attrs:
+            if cells[0].a:
+                for attr in cells[0].a.attrs:
                     if attr[0] == 'href':
                         href = attr[1]
-                contents[0] = row('td')[0].a.contents[0]
+                # A Tag, if the link starts with markup; str renders it
+                contents[0] = str(cells[0].a.contents[0])
             if href:
                 data[href] = contents
             elif not contents[0].startswith('&'):
@@ -58,26 +263,678 @@ def scrape_table(table):
 
     return (headings, data)
 
-def get_soup(url):
-    content = get_url(url).readlines()
-    return BeautifulSoup(''.join(content))
+_BARE_AMPERSAND_OR_BRACKET = re.compile(r'([<>]|&(?!#\d+;|#x[0-9a-fA-F]+;|\w+;))')
+_ENTITIES = {'<': '&lt;', '>': '&gt;', '&': '&amp;'}
+_VOID_TAGS = frozenset(['br', 'hr', 'img', 'input', 'meta', 'link', 'area',
+                        'base', 'col', 'param', 'spacer', 'frame',
+                        'basefont', 'wbr'])
+
+def _render_tag(tag, attrs, close=''):
+    # Renders a start tag the way BeautifulSoup 3 does.
+    out = ['<', tag]
+    for key, value in attrs:
+        if value is None:
+            out.append(' ' + key)
+            continue
+        fmt = ' %s="%s"'
+        if '"' in value:
+            fmt = " %s='%s'"
+            if "'" in value:
+                value = value.replace("'", "&squot;")
+        value = _BARE_AMPERSAND_OR_BRACKET.sub(
+            lambda m: _ENTITIES[m.group(0)], value)
+        out.append(fmt % (key, value))
+    out.append(close + '>')
+    return ''.join(out)
+
+class _Cell(object):
+    __slots__ = ('kind', 'parts', 'href', 'linktext', 'in_link', 'link_seen',
+                 'child_start', 'child_depth')
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.parts = []
+        self.href = None
+        self.linktext = None
+        self.in_link = False
+        self.link_seen = False
+        # where the link's first child starts in parts, if it is a tag
+        self.child_start = None
+        self.child_depth = 0
+
+class TableExtractor(HTMLParser.HTMLParser):
+    """Event-driven extractor for the first <table> on an outage page.
+
+    Builds no tree; it keeps only the current row and cell, rendering each
+    cell's inner HTML as BeautifulSoup's renderContents would, and applies
+    scrape_table's rules as each row ends.  Tables nested inside a cell are
+    kept as cell content only (BeautifulSoup would also count their rows).
+
+    After feed() and close(), headings and data hold the scrape_table
+    result.
+    """
+
+    def __init__(self):
+        HTMLParser.HTMLParser.__init__(self)
+        self.headings = []
+        self.data = {}
+        self.depth = 0
+        self.done = False
+        self.row = None
+        self.cell = None
+
+    def _end_cell(self):
+        if self.cell is not None:
+            self.row.append(self.cell)
+            self.cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        row, self.row = self.row, None
+        if not row:
+            return
+        ths = [cell for cell in row if cell.kind == 'th']
+        if ths:
+            if len(ths) > 1 and ''.join(ths[0].parts) != '&nbsp;':
+                self.headings = [''.join(cell.parts) for cell in ths]
+            return
+        contents = [''.join(cell.parts) for cell in row]
+        first = row[0]
+        if first.link_seen:
+            contents[0] = first.linktext or ''
+        if first.href:
+            self.data[first.href] = contents
+        elif not contents[0].startswith('&'):
+            self.data[contents[0]] = contents[1:]
+
+    def _text(self, text):
+        cell = self.cell
+        if cell is None or self.depth == 0:
+            return
+        cell.parts.append(text)
+        if cell.in_link and cell.linktext is not None:
+            cell.linktext += text
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self.depth == 0:
+            if tag == 'table':
+                self.depth = 1
+            return
+        if self.depth == 1:
+            if tag == 'tr':
+                self._end_row()
+                self.row = []
+                return
+            if tag in ('td', 'th'):
+                self._end_cell()
+                if self.row is None:
+                    self.row = []
+                self.cell = _Cell(tag)
+                return
+        if tag == 'table':
+            self.depth += 1
+        cell = self.cell
+        if cell is None:
+            return
+        if cell.in_link:
+            # the link's first child was text, or is this tag
+            if not cell.linktext:
+                cell.child_start = len(cell.parts)
+            cell.in_link = False
+        if tag in _VOID_TAGS:
+            cell.parts.append(_render_tag(tag, attrs, ' /'))
+            self._child_ended(cell, 0)
+        else:
+            cell.parts.append(_render_tag(tag, attrs))
+            self._child_ended(cell, 1)
+        if tag == 'a' and not cell.link_seen and self._first_td(cell):
+            cell.link_seen = True
+            cell.in_link = True
+            cell.linktext = ''
+            for key, value in attrs:
+                if key == 'href':
+                    cell.href = value
+
+    def _child_ended(self, cell, delta):
+        # Tracks the nesting of a link's first child; when it closes, the
+        # child's rendering becomes the link text.
+        if cell.child_start is None:
+            return
+        cell.child_depth += delta
+        if cell.child_depth <= 0:
+            cell.linktext = ''.join(cell.parts[cell.child_start:])
+            cell.child_start = None
+
+    def _first_td(self, cell):
+        # Only the first <td> of a row contributes a link.
+        return cell.kind == 'td' and not [c for c in self.row if c.kind == 'td']
+
+    def handle_startendtag(self, tag, attrs):
+        if self.done or self.depth == 0 or self.cell is None:
+            return
+        cell = self.cell
+        if cell.in_link and not cell.linktext:
+            cell.child_start = len(cell.parts)
+        cell.in_link = False
+        cell.parts.append(_render_tag(tag, attrs, ' /'))
+        self._child_ended(cell, 0)
+
+    def handle_endtag(self, tag):
+        if self.done or self.depth == 0:
+            return
+        if self.depth == 1:
+            if tag in ('td', 'th'):
+                self._end_cell()
+                return
+            if tag == 'tr':
+                self._end_row()
+                return
+            if tag == 'table':
+                self._end_row()
+                self.depth = 0
+                self.done = True
+                return
+        if tag == 'table':
+            self.depth -= 1
+        cell = self.cell
+        if cell is None or tag in _VOID_TAGS:
+            return
+        cell.parts.append('</%s>' % tag)
+        cell.in_link = False
+        self._child_ended(cell, -1)
+
+    def handle_data(self, data):
+        self._text(data)
+
+    def handle_entityref(self, name):
+        self._text('&%s;' % name)
+
+    def handle_charref(self, name):
+        self._text('&#%s;' % name)
+
+    def handle_comment(self, data):
+        if self.cell is not None and self.depth:
+            self.cell.parts.append('<!--%s-->' % data)
+
+    def close(self):
+        HTMLParser.HTMLParser.close(self)
+        if self.depth:
+            self._end_row()
+            self.done = True
+
+def extract_table(content):
+    """Extracts the first table of a page without building a soup.
+
+    Returns the same (headings, data) tuple as scrape_table.
+    """
+    extractor = TableExtractor()
+    extractor.feed(content)
+    extractor.close()
+    return (extractor.headings, extractor.data)
+
+def parse_page(content, parser=None):
+    """Parses a page's outage table with the given parser ('fast' or 'soup';
+    PARSER by default).  The fast parser falls back to BeautifulSoup on
+    HTML it cannot handle.
+
+    Returns the scrape_table result, in plain strings either way, so it
+    can go in the PageCache as JSON.
+
+    >>> page = ('<table><tr><td><a href="T.html"><b>Brighton</b></a></td>'
+    ...         '<td>12</td></tr></table>')
+    >>> parse_page(page, 'soup') == parse_page(page, 'fast')
+    True
+    >>> json.dumps(parse_page(page, 'soup'))
+    '[[], {"T.html": ["<b>Brighton</b>", "12"]}]'
+    """
+    if (parser or PARSER) == 'fast':
+        try:
+            return extract_table(content)
+        except HTMLParser.HTMLParseError:
+            if BeautifulSoup is None:
+                raise
+    return scrape_table(BeautifulSoup(content).table)
+
+def _plain(obj):
+    # JSON hands back unicode; renderContents hands out utf-8 str.
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    if isinstance(obj, list):
+        return [_plain(i) for i in obj]
+    if isinstance(obj, dict):
+        return dict((_plain(k), _plain(v)) for k, v in obj.items())
+    return obj
+
+class PageCache(object):
+    """Persistent per-URL cache of HTTP validators and parsed tables.
+
+    Pages are revalidated with If-None-Match/If-Modified-Since; a 304, or a
+    200 whose body hashes the same as last time, is answered with the
+    stored scrape_table result instead of building a new soup.
+
+    A page that can't be fetched (FetchError, or a status other than 200
+    or 304) is answered with its last good parse, and its URL kept in
+    stale until it is fetched again.
+
+    stats counts pages 'parsed' (fetched and parsed), 'notmodified'
+    (answered 304), 'unchanged' (same content hash), 'stale' (answered
+    from the last good parse) and 'missing' (not fetched, with nothing to
+    fall back on) since creation.
+    Parsing is timed in report (a runreport.RunReport; none by default).
+    If archive (a SnapshotArchive) is set, every page is added to it; a
+    page is only revalidated if the archive has its content.
+    """
+
+    def __init__(self, filename="rgeoutages.sqlite3"):
+        self.db = sqlite3.connect(filename)
+        c = self.db.cursor()
+        c.execute("""create table if not exists pagecache
+            (url text primary key, etag text, lastmodified text,
+             contenthash text, parsed text)""")
+        self.db.commit()
+
+        self.entries = {}
+        c.execute('select url, etag, lastmodified, contenthash, parsed from pagecache')
+        for url, etag, lastmodified, contenthash, parsed in c.fetchall():
+            self.entries[str(url)] = {
+                'etag': etag,
+                'lastmodified': lastmodified,
+                'contenthash': contenthash,
+                'parsed': tuple(_plain(json.loads(parsed))),
+                }
+        self.dirty = set()
+        self.stale = set()
+        self.lock = threading.Lock()
+        self.stats = {'parsed': 0, 'notmodified': 0, 'unchanged': 0,
+                      'stale': 0, 'missing': 0}
+        self.report = runreport.NULL
+        self.archive = None
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def scrape(self, fetcher, url):
+        """Fetches (conditionally) and parses a page through fetcher.
+
+        Returns the scrape_table result, or None if the page couldn't be
+        fetched and there is no earlier one.  Safe to call from worker
+        threads.
+        """
+        entry = self.entries.get(url)
+        headers = []
+        if entry and (self.archive is None or
+                      self.archive.has(entry['contenthash'])):
+            if entry['etag']:
+                headers.append('If-None-Match: %s' % entry['etag'])
+            if entry['lastmodified']:
+                headers.append('If-Modified-Since: %s' % entry['lastmodified'])
+
+        try:
+            status, respheaders, body = fetcher.fetch_response(url, headers)
+            if status not in (200, 304):
+                raise FetchError("%s: HTTP status %d" % (url, status))
+        except IOError:
+            if not entry:
+                self._count('missing')
+                return None
+            self._count('stale')
+            if self.archive is not None and self.archive.has(entry['contenthash']):
+                self.archive.add(url, entry['contenthash'])
+            with self.lock:
+                self.stale.add(url)
+            return entry['parsed']
+
+        with self.lock:
+            self.stale.discard(url)
+        if status == 304 and entry:
+            self._count('notmodified')
+            if self.archive is not None:
+                self.archive.add(url, entry['contenthash'])
+            return entry['parsed']
+
+        content = body.getvalue()
+        contenthash = hashlib.sha1(content).hexdigest()
+        if self.archive is not None:
+            self.archive.add(url, contenthash, content)
+        if entry and entry['contenthash'] == contenthash:
+            self._count('unchanged')
+            parsed = entry['parsed']
+        else:
+            self._count('parsed')
+            with self.report.stage('parse'):
+                parsed = _plain(parse_page(content))
+
+        with self.lock:
+            self.entries[url] = {
+                'etag': respheaders.get('etag'),
+                'lastmodified': respheaders.get('last-modified'),
+                'contenthash': contenthash,
+                'parsed': parsed,
+                }
+            self.dirty.add(url)
+        return parsed
+
+    def save(self):
+        """Writes entries changed since the last save in one transaction."""
+        with self.lock:
+            rows = [(url, e['etag'], e['lastmodified'], e['contenthash'],
+                     json.dumps(e['parsed']))
+                    for url, e in ((u, self.entries[u]) for u in self.dirty)]
+            self.dirty = set()
+        c = self.db.cursor()
+        c.executemany("""insert or replace into pagecache
+                            (url, etag, lastmodified, contenthash, parsed)
+                         values (?,?,?,?,?)""", rows)
+        self.db.commit()
+
+class SnapshotArchive(object):
+    """Archive of every crawl, for replaying later.
+
+    Each page's content is stored once, zlib-compressed, under its SHA-1
+    (the PageCache content hash).  So is each run's manifest, a JSON
+    dictionary of URL -> content hash, so a run where nothing changed
+    costs a row.  begin() starts a run, add() notes a page (from any
+    thread), and finish() writes the run in one transaction.
+
+    stats counts the last run's 'pages', and the content 'stored' new and
+    its compressed 'storedbytes'.
+    """
+
+    def __init__(self, filename=SNAPSHOT_FILE):
+        self.db = sqlite3.connect(filename)
+        c = self.db.cursor()
+        c.execute("""create table if not exists snapshotcontent
+            (hash text primary key, content blob)""")
+        c.execute("""create table if not exists snapshotrun
+            (id integer primary key, time integer, baseurl text,
+             manifest text)""")
+        self.db.commit()
+
+        c.execute('select hash from snapshotcontent')
+        self.hashes = set(str(row[0]) for row in c.fetchall())
+        self.lock = threading.Lock()
+        self.run = None
+        self.pages = {}
+        self.blobs = {}
+        self.stats = dict.fromkeys(('pages', 'stored', 'storedbytes'), 0)
+
+    def begin(self, base_url, now):
+        """Starts archiving a crawl of base_url made at time now."""
+        with self.lock:
+            self.run = (int(now), base_url)
+            self.pages = {}
+            self.blobs = {}
+
+    def has(self, contenthash):
+        """Tells whether content with the given hash is archived."""
+        with self.lock:
+            return contenthash in self.hashes or contenthash in self.blobs
+
+    def add(self, url, contenthash, content=None):
+        """Notes that url had the content with the given hash.  content is
+        only needed if the archive doesn't have it yet."""
+        if content is not None and not self.has(contenthash):
+            blob = zlib.compress(content, 9)
+        else:
+            blob = None
+        with self.lock:
+            if self.run is None:
+                return
+            self.pages[url] = contenthash
+            if blob is not None:
+                self.blobs[contenthash] = blob
+
+    def finish(self):
+        """Writes the run begun by begin().  Returns its ID."""
+        with self.lock:
+            (now, base_url), pages, blobs = self.run, self.pages, self.blobs
+            self.run = None
+            self.pages = {}
+            self.blobs = {}
+        manifest = json.dumps(pages, sort_keys=True)
+        manifesthash = hashlib.sha1(manifest).hexdigest()
+        if not self.has(manifesthash):
+            blobs[manifesthash] = zlib.compress(manifest, 9)
+        c = self.db.cursor()
+        c.executemany("insert or ignore into snapshotcontent (hash, content) values (?,?)",
+                      [(h, sqlite3.Binary(blob)) for h, blob in blobs.items()])
+        c.execute("insert into snapshotrun (time, baseurl, manifest) values (?,?,?)",
+                  (now, base_url, manifesthash))
+        run = c.lastrowid
+        self.db.commit()
+        with self.lock:
+            self.hashes.update(blobs)
+        self.stats = { 'pages': len(pages),
+                       'stored': len(blobs),
+                       'storedbytes': sum(len(blob) for blob in blobs.values()) }
+        return run
+
+    def runs(self, since=None, until=None):
+        """Returns list of (run ID, time, base URL) for the runs archived
+        between since and until (both optional), oldest first."""
+        return [(run, runtime, str(base_url))
+                for run, runtime, base_url in self.db.execute(
+                    """select id, time, baseurl from snapshotrun
+                       where time >= ? and time <= ? order by time, id""",
+                    (since or 0, until or 2**62))]
+
+    def manifest(self, run):
+        """Returns dictionary of URL -> content hash for a run."""
+        row = self.db.execute("select manifest from snapshotrun where id=?",
+                              (run,)).fetchone()
+        if row is None:
+            raise KeyError(run)
+        return _plain(json.loads(self.content(row[0])))
+
+    def content(self, contenthash):
+        """Returns archived content, by hash."""
+        row = self.db.execute("select content from snapshotcontent where hash=?",
+                              (contenthash,)).fetchone()
+        if row is None:
+            raise KeyError(contenthash)
+        return zlib.decompress(row[0])
+
+    def close(self):
+        self.db.close()
+
+class ArchiveFetcher(Fetcher):
+    """Fetches the pages of an archived run (see SnapshotArchive) instead
+    of going to RG&E.  Everything happens in the calling thread, since
+    there is no network to wait on.
+    """
+
+    def __init__(self, archive, run):
+        self.archive = archive
+        self.pages = archive.manifest(run)
+        self.report = runreport.NULL
+
+    def fetch_response(self, url, headers=None):
+        if url not in self.pages:
+            raise IOError("%s was not archived in this run" % url)
+        return (200, {}, StringIO.StringIO(self.archive.content(self.pages[url])))
+
+    def imap(self, func, items):
+        for item in set(items):
+            yield (item, func(item))
+
+    def close(self):
+        pass
+
+def _page_scraper(fetcher, cache=None):
+    if cache:
+        return lambda url: cache.scrape(fetcher, url)
+    return lambda url: parse_page(fetcher.fetch(url))
+
+def scrape_pages(fetcher, base_url, files, cache=None):
+    """Fetches and scrapes a batch of pages concurrently, through cache (a
+    PageCache) if given.
+
+    Returns dictionary of file name to scrape_table result (None for
+    pages the cache couldn't come up with).
+    """
+    tables = fetcher.map(_page_scraper(fetcher, cache),
+                         [base_url + f for f in files])
+    return dict((f, tables[base_url + f]) for f in files)
+
+def _crawl_upper(fetcher, base_url, start_url, cache):
+    # Crawls the county, town and location levels.  Returns the county
+    # table, the county files, the town and location tables, and the set
+    # of those files that were answered from the cache's last good copy.
+    # A page that couldn't be fetched (see PageCache) is left out, and
+    # everything under it with it; the start page can't be.
+    countytable = scrape_pages(fetcher, base_url, [start_url],
+                               cache)[start_url]
+    if countytable is None:
+        raise FetchError("%s%s: couldn't fetch the start page"
+                         % (base_url, start_url))
+    countyheadings, countydata = countytable
+
+    # It isn't our normal relative URL; ignore it
+    countyfiles = [f for f in countydata if not f.startswith('http')]
+    towntables = scrape_pages(fetcher, base_url, countyfiles, cache)
+    countyfiles = [f for f in countyfiles if towntables[f] is not None]
+
+    townfiles = [f for countyfile in countyfiles
+                   for f in towntables[countyfile][1]
+                   if str(f) != str(start_url)]
+    locationtables = scrape_pages(fetcher, base_url, townfiles, cache)
+    for townfile in townfiles:
+        if locationtables[townfile] is None:
+            locationtables[townfile] = ([], {})
+
+    stalefiles = set()
+    if cache is not None:
+        stalefiles = set(f for f in [start_url] + countyfiles + townfiles
+                         if base_url + f in cache.stale)
+
+    return countydata, countyfiles, towntables, locationtables, stalefiles
+
+def _street_rows(countyfile, streetdata):
+    # Yields (street name, street dictionary) for the real streets on a
+    # street page.
+    for streetname, streetrow in streetdata.items():
+        if str(streetname) == str(countyfile):
+            continue
+        if str(streetname).lower().endswith('html'): continue
+
+        if len(streetrow) == 2:
+            streetrow = streetrow + ['Unknown']
+
+        yield streetname, {
+            'TotalCustomers': clean_int(streetrow[0]),
+            'CustomersWithoutPower': clean_int(streetrow[1]),
+            'EstimatedRestoration': streetrow[2],
+            }
+
+def iter_outages(base_url=BASE_URL, start_url=START_URL, fetcher=None,
+                 cache=None, towns=None):
+    """Crawls the outage report tree, yielding street outages as soon as
+    each street page is parsed.
+
+    fetcher and cache are as for crawl_outages.  If towns (a dictionary) is
+    given, it is filled with county -> town -> dictionary of TotalCustomers
+    and CustomersWithoutPower before the first street is yielded.
+
+    Yields an outagerecords.StreetOutage per street, marked stale if its
+    page, or any page above it, couldn't be fetched and the cache's last
+    good copy was used.
+    Streets whose page couldn't be fetched at all are left out.
+    """
+    if fetcher is None:
+        fetcher = Fetcher()
+        try:
+            for record in iter_outages(base_url, start_url, fetcher, cache,
+                                       towns):
+                yield record
+        finally:
+            fetcher.close()
+        return
+
+    countydata, countyfiles, towntables, locationtables, stalefiles = \
+        _crawl_upper(fetcher, base_url, start_url, cache)
+
+    # Where each street page sits in the tree, and whether anything above
+    # it is stale
+    parents = {}
+    for countyfile in countyfiles:
+        county = countydata[countyfile][0]
+        countystale = start_url in stalefiles or countyfile in stalefiles
+        for townfile, townrow in towntables[countyfile][1].items():
+            if str(townfile) == str(start_url):
+                continue
+            townstale = countystale or townfile in stalefiles
+            if towns is not None:
+                towns.setdefault(county, {})[townrow[0]] = {
+                    'TotalCustomers': clean_int(townrow[1]),
+                    'CustomersWithoutPower': clean_int(townrow[2]),
+                    }
+            for locationfile, locationrow in locationtables[townfile][1].items():
+                if str(locationfile) == str(start_url):
+                    continue
+                if len(locationrow) < 3: continue
+                parents.setdefault(base_url + locationfile, []).append(
+                    (countyfile, county, townrow[0], locationrow[0],
+                     townstale))
+
+    for url, table in fetcher.imap(_page_scraper(fetcher, cache),
+                                   parents.keys()):
+        if table is None:
+            continue
+        streetheadings, streetdata = table
+        stale = cache is not None and url in cache.stale
+        for countyfile, county, town, location, upperstale in parents[url]:
+            for streetname, street in _street_rows(countyfile, streetdata):
+                outage = outagerecords.StreetOutage(
+                    county, town, location, streetname,
+                    street['TotalCustomers'], street['CustomersWithoutPower'],
+                    street['EstimatedRestoration'])
+                outage.stale = stale or upperstale
+                yield outage
+
+    if cache:
+        cache.save()
+
+def crawl_outages(base_url=BASE_URL, start_url=START_URL, fetcher=None,
+                  cache=None):
+    """Crawls the outage report tree.
+
+    Each level's child pages are fetched concurrently through fetcher (a
+    Fetcher; one is created and closed here if not given).  If cache (a
+    PageCache) is given, pages are revalidated against it and it is saved
+    at the end of the crawl; pages that can't be fetched are answered from
+    it, or left out.
+
+    Returns nested dictionary of counties, towns, locations and streets.
+    """
+    if fetcher is None:
+        fetcher = Fetcher()
+        try:
+            return crawl_outages(base_url, start_url, fetcher, cache)
+        finally:
+            fetcher.close()
 
-def crawl_outages(base_url=BASE_URL, start_url=START_URL):
     outages = {}
 
-    # Get bunch of counties
-    countysoup = get_soup(base_url + start_url)
-    countyheadings, countydata = scrape_table(countysoup.table)
+    countydata, countyfiles, towntables, locationtables, stalefiles = \
+        _crawl_upper(fetcher, base_url, start_url, cache)
+
+    locationfiles = [f for townfile in locationtables
+                       for f in locationtables[townfile][1]
+                       if str(f) != str(start_url)]
+    streettables = scrape_pages(fetcher, base_url, locationfiles, cache)
+
+    if cache:
+        cache.save()
 
     # From here, we need to get a bunch of townships...
-    for countyfile, countyrow in countydata.items():
-        if countyfile.startswith('http'):
-            # It isn't our normal relative URL; ignore it
-            continue
+    for countyfile in countyfiles:
+        countyrow = countydata[countyfile]
         countydict = {}
 
-        townsoup = get_soup(base_url + countyfile)
-        townheadings, towndata = scrape_table(townsoup.table)
+        townheadings, towndata = towntables[countyfile]
 
         # And then a bunch of locations...
         for townfile, townrow in towndata.items():
@@ -85,29 +942,16 @@ def crawl_outages(base_url=BASE_URL, start_url=START_URL):
                 continue
             towndict = {}
 
-            locationsoup = get_soup(base_url + townfile)
-            locationheadings, locationdata = scrape_table(locationsoup.table)
+            locationheadings, locationdata = locationtables[townfile]
                    
             # And then a bunch of streets...
             for locationfile, locationrow in locationdata.items():
                 if str(locationfile) == str(start_url):
                     continue
-                locationdict = {}
-                streetsoup = get_soup(base_url + locationfile)
-                streetheadings, streetdata = scrape_table(streetsoup.table)
-                for streetname, streetrow in streetdata.items():
-                    if str(streetname) == str(countyfile):
-                        continue
-                    if str(streetname).lower().endswith('html'): continue
-
-                    if len(streetrow) == 2:
-                        streetrow.append('Unknown')
-
-                    locationdict[streetname] = {
-                        'TotalCustomers': clean_int(streetrow[0]),
-                        'CustomersWithoutPower': clean_int(streetrow[1]),
-                        'EstimatedRestoration': streetrow[2],
-                        }
+                if streettables[locationfile] is None:
+                    continue
+                streetheadings, streetdata = streettables[locationfile]
+                locationdict = dict(_street_rows(countyfile, streetdata))
 
                 if len(locationrow) < 3: continue
                 towndict[locationrow[0]] = {
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+
+# Spatial summaries of outage locations, for laying out the map: where the
+# outages are once the odd geocoding blunder (a street matched to the
+# wrong Main St three counties over) is set aside, and how far to zoom out
+# to show them; and where each town's outages are, for the list of towns.
+#
+# Stray points are found by their distance from the median center: a
+# point is left out if its modified z-score (0.6745 times its distance
+# less the median distance, over the median absolute deviation) is over
+# MAD_LIMIT, and it is more than MIN_RADIUS km out.  Everything is worked
+# out from medians and sorted coordinates, so the answer doesn't depend on
+# the order the points come in.
+#
+# Uses NumPy if it is installed, and plain Python otherwise.
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import clusters
+
+EARTH_RADIUS = 6371.0
+
+MAD_LIMIT = 3.5
+MIN_RADIUS = 15.0
+
+# The map size zoom levels are fitted to, in pixels, and the zoom levels
+# allowed
+MAP_WIDTH = 1024
+MAP_HEIGHT = 768
+MIN_ZOOM = 9
+MAX_ZOOM = 15
+
+
+def _median(values):
+    # values must be sorted
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def _limit(median, mad):
+    return max(MIN_RADIUS, median + MAD_LIMIT * mad / 0.6745)
+
+
+def fit_zoom(south, west, north, east, width=MAP_WIDTH, height=MAP_HEIGHT):
+    """Returns the deepest zoom level, between MIN_ZOOM and MAX_ZOOM, at
+    which a box fits on a map width by height pixels.
+
+    >>> fit_zoom(43.0, -77.8, 43.3, -77.4)
+    11
+    >>> fit_zoom(43.15, -77.6, 43.15, -77.6)
+    15
+    """
+    x0, y0 = clusters.project(north, west, 0)
+    x1, y1 = clusters.project(south, east, 0)
+    scale = min(width / max(x1 - x0, 1e-9), height / max(y1 - y0, 1e-9))
+    return min(max(int(math.floor(math.log(scale, 2))), MIN_ZOOM), MAX_ZOOM)
+
+
+def summarize(lats, lngs):
+    """Summarizes a set of points, given as sequences of latitudes and
+    longitudes, leaving out stray points.
+
+    Returns dictionary of count, inliers (how many points were kept),
+    south, west, north and east edges and latitude and longitude of the
+    centroid of the points kept, and zoom (see fit_zoom); or None if there
+    are no points.
+
+    >>> s = summarize([43.1, 43.2, 43.15, 40.7], [-77.5, -77.7, -77.6, -74.0])
+    >>> s['inliers'], s['south'], s['east'], s['latitude'], s['zoom']
+    (3, 43.1, -77.5, 43.15, 12)
+    """
+    count = len(lats)
+    if count == 0:
+        return None
+
+    if numpy is not None:
+        lats = numpy.asarray(lats, dtype=float)
+        lngs = numpy.asarray(lngs, dtype=float)
+        mlat = float(numpy.median(lats))
+        mlng = float(numpy.median(lngs))
+        dist = numpy.hypot((lats - mlat) * math.radians(EARTH_RADIUS),
+                           (lngs - mlng) * math.radians(EARTH_RADIUS) *
+                           math.cos(math.radians(mlat)))
+        median = numpy.median(dist)
+        keep = dist <= _limit(median, numpy.median(numpy.abs(dist - median)))
+        lats = numpy.sort(lats[keep])
+        lngs = numpy.sort(lngs[keep])
+        latsum = float(lats.sum())
+        lngsum = float(lngs.sum())
+    else:
+        mlat = _median(sorted(lats))
+        mlng = _median(sorted(lngs))
+        coslat = math.cos(math.radians(mlat))
+        dist = [math.hypot((lat - mlat) * math.radians(EARTH_RADIUS),
+                           (lng - mlng) * math.radians(EARTH_RADIUS) * coslat)
+                for lat, lng in zip(lats, lngs)]
+        ordered = sorted(dist)
+        median = _median(ordered)
+        limit = _limit(median, _median(sorted(abs(d - median) for d in ordered)))
+        lats, lngs = zip(*[(lat, lng) for lat, lng, d in zip(lats, lngs, dist)
+                           if d <= limit])
+        lats = sorted(lats)
+        lngs = sorted(lngs)
+        latsum = math.fsum(lats)
+        lngsum = math.fsum(lngs)
+
+    south, north = float(lats[0]), float(lats[-1])
+    west, east = float(lngs[0]), float(lngs[-1])
+    return { 'count': count,
+             'inliers': len(lats),
+             'south': south,
+             'west': west,
+             'north': north,
+             'east': east,
+             'latitude': round(latsum / len(lats), 6),
+             'longitude': round(lngsum / len(lngs), 6),
+             'zoom': fit_zoom(south, west, north, east) }
+
+
+def town_centroids(towns, lats, lngs):
+    """Returns dictionary of town -> (latitude, longitude, number of points)
+    for points given as sequences of towns, latitudes and longitudes.
+
+    >>> town_centroids(['a', 'b', 'a'], [43.0, 42.0, 43.2], [-77.0, -78.0, -77.2])
+    {'a': (43.1, -77.1, 2), 'b': (42.0, -78.0, 1)}
+    """
+    if len(towns) == 0:
+        return {}
+
+    if numpy is not None:
+        towns = numpy.asarray(towns)
+        lats = numpy.asarray(lats, dtype=float)
+        lngs = numpy.asarray(lngs, dtype=float)
+        # sums come out the same whatever order the points were in
+        order = numpy.lexsort((lngs, lats, towns))
+        names, index, counts = numpy.unique(towns[order], return_inverse=True,
+                                            return_counts=True)
+        latsums = numpy.bincount(index, weights=lats[order])
+        lngsums = numpy.bincount(index, weights=lngs[order])
+        return dict((names[i].item(),
+                     (round(latsums[i] / counts[i], 6),
+                      round(lngsums[i] / counts[i], 6), int(counts[i])))
+                    for i in range(len(names)))
+
+    groups = {}
+    for town, lat, lng in zip(towns, lats, lngs):
+        groups.setdefault(town, []).append((lat, lng))
+    return dict((town, (round(math.fsum(p[0] for p in points) / len(points), 6),
+                        round(math.fsum(p[1] for p in points) / len(points), 6),
+                        len(points)))
+                for town, points in groups.items())
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+
+# Street and place name normalization, so that the different spellings RG&E
+# and the geocoder use for one street end up as one cache key.
+#
+# Street types and directionals are reduced to their USPS (Publication 28)
+# abbreviations, along with the truncated forms RG&E's pages are known to
+# use.  A leading or trailing word is only treated as a directional when
+# there is a street name besides it ("N MAIN ST", but not "EAST AVE"), and
+# a street type only in last place ("ST PAUL ST" keeps its saint).  North
+# Main and Main stay different streets.
+
+import re
+import urllib
+
+# Street types: USPS abbreviation -> other spellings
+SUFFIXES = {
+    'aly': ['alley', 'ally'],
+    'ave': ['avenue', 'av', 'aven', 'avn', 'avnue'],
+    'blvd': ['boulevard', 'boul', 'boulv', 'bl', 'bv'],
+    'byp': ['bypass', 'bypa', 'bypas', 'byps'],
+    'cir': ['circle', 'circ', 'circl', 'crcl', 'crcle', 'ci'],
+    'ct': ['court', 'crt'],
+    'cv': ['cove'],
+    'cres': ['crescent', 'crsent', 'crsnt'],
+    'xing': ['crossing', 'crssng'],
+    'dr': ['drive', 'driv', 'drv'],
+    'expy': ['expressway', 'exp', 'expr', 'express', 'expw'],
+    'ext': ['extension', 'extn', 'extnsn'],
+    'gdns': ['gardens', 'gardn', 'grden', 'grdn'],
+    'grn': ['green'],
+    'hts': ['heights', 'ht'],
+    'hwy': ['highway', 'highwy', 'hiway', 'hiwy', 'hway', 'hw'],
+    'holw': ['hollow', 'hllw', 'hollows', 'holws'],
+    'is': ['island', 'islnd'],
+    'jct': ['junction', 'jction', 'jctn', 'junctn', 'juncton'],
+    'knl': ['knoll', 'knol'],
+    'ln': ['lane', 'la'],
+    'lndg': ['landing', 'lndng'],
+    'loop': ['loops'],
+    'mdws': ['meadows', 'mdw', 'medows'],
+    'mnr': ['manor'],
+    'pkwy': ['parkway', 'parkwy', 'pkway', 'pky', 'pkw'],
+    'pass': [],
+    'path': ['paths'],
+    'pike': ['pikes'],
+    'pl': ['place'],
+    'plz': ['plaza', 'plza'],
+    'pt': ['point'],
+    'rdg': ['ridge', 'rdge'],
+    'rd': ['road'],
+    'run': [],
+    'sq': ['square', 'sqr', 'sqre', 'squ'],
+    'st': ['street', 'strt', 'str'],
+    'ter': ['terrace', 'terr', 'te'],
+    'trce': ['trace', 'traces'],
+    'trl': ['trail', 'trails', 'trls'],
+    'tpke': ['turnpike', 'trnpk', 'turnpk'],
+    'vw': ['view'],
+    'vlg': ['village', 'vill', 'villag', 'villg', 'villiage'],
+    'walk': ['walks'],
+    'way': ['wy'],
+}
+
+DIRECTIONALS = {
+    'n': ['north'],
+    's': ['south'],
+    'e': ['east'],
+    'w': ['west'],
+    'ne': ['northeast'],
+    'nw': ['northwest'],
+    'se': ['southeast'],
+    'sw': ['southwest'],
+}
+
+# Whole place names RG&E cuts short
+PLACES = {
+    'honeoye fl': 'honeoye falls',
+    'honeoye fls': 'honeoye falls',
+    'e rochester': 'east rochester',
+    'n chili': 'north chili',
+    'w henrietta': 'west henrietta',
+    'n rose': 'north rose',
+    'e bloomfield': 'east bloomfield',
+    'w bloomfield': 'west bloomfield',
+}
+
+def _table(groups):
+    table = {}
+    for canonical, spellings in groups.items():
+        table[canonical] = canonical
+        for spelling in spellings:
+            table[spelling] = canonical
+    return table
+
+SUFFIX_MAP = _table(SUFFIXES)
+DIRECTIONAL_MAP = _table(DIRECTIONALS)
+
+_JUNK = re.compile(r"[.,#]+")
+
+# Normalized names seen so far; the same few thousand come up every run.
+_streets = {}
+_places = {}
+
+def _words(name):
+    return _JUNK.sub(' ', urllib.unquote(name).lower()).split()
+
+def normalize_street(name):
+    """Normalizes a street name.
+
+    >>> normalize_street('NORTH MAIN STREET'), normalize_street('N. Main St')
+    ('n main st', 'n main st')
+    >>> normalize_street('EAST AVE'), normalize_street('ST PAUL BOULEVARD')
+    ('east ave', 'st paul blvd')
+    >>> normalize_street('HIGH POINT LA'), normalize_street('MAIN ST N')
+    ('high point ln', 'main st n')
+    """
+    try:
+        return _streets[name]
+    except KeyError:
+        pass
+
+    words = _words(name)
+    last = len(words) - 1
+    # a trailing directional after a street type
+    if last >= 2 and words[last] in DIRECTIONAL_MAP and \
+            words[last-1] in SUFFIX_MAP:
+        words[last] = DIRECTIONAL_MAP[words[last]]
+        last -= 1
+    if last >= 1 and words[last] in SUFFIX_MAP:
+        words[last] = SUFFIX_MAP[words[last]]
+        last -= 1
+    # a leading directional, if a name is left after it
+    if last >= 1 and words[0] in DIRECTIONAL_MAP:
+        words[0] = DIRECTIONAL_MAP[words[0]]
+
+    normalized = ' '.join(words)
+    _streets[name] = normalized
+    return normalized
+
+def normalize_place(name):
+    """Normalizes a town or location name, undoing RG&E's truncations.
+
+    >>> normalize_place('HONEOYE%20FL'), normalize_place(' Brighton ')
+    ('honeoye falls', 'brighton')
+    """
+    try:
+        return _places[name]
+    except KeyError:
+        pass
+
+    normalized = ' '.join(_words(name))
+    normalized = PLACES.get(normalized, normalized)
+    _places[name] = normalized
+    return normalized
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+# Templates for the pages generate_map writes, rendered straight to a
+# stream.
+#
+# A Template takes str.format syntax ({name}, {name:spec}, {{ and }} for
+# braces), but is split into literal text and fields once, when it is
+# made, rather than every time it is filled in.  Rendering writes each
+# piece to the output as it goes, so the page is never built up in memory;
+# a field's value can be a list or generator of chunks, which are written
+# one by one.
+#
+# Values go in as they are.  Escape text from outside with escape(), once,
+# where it comes in; text that comes in as HTML already (RG&E's table
+# cells, say) goes through unescape() first.
+
+import cgi
+import HTMLParser
+import string
+
+from StringIO import StringIO
+
+
+def escape(text):
+    """Escapes text for HTML, quotes and all.
+
+    >>> print escape('Lyons & Sodus <"Wayne">')
+    Lyons &amp; Sodus &lt;&quot;Wayne&quot;&gt;
+    """
+    return cgi.escape(text, True)
+
+
+def unescape(html):
+    """Returns HTML text (no tags) as plain text, entities and all
+    replaced, the reverse of escape.  UTF-8 byte strings are decoded.
+
+    >>> print escape(unescape('Lyons &amp; Sodus &lt;&quot;Wayne&quot;&gt;'))
+    Lyons &amp; Sodus &lt;&quot;Wayne&quot;&gt;
+    """
+    if isinstance(html, str):
+        html = html.decode('utf-8')
+    return HTMLParser.HTMLParser().unescape(html)
+
+
+class Template(object):
+    """A template, parsed once and rendered to streams.
+
+    >>> t = Template(u"<p>{count} street{s}: {names}</p> {{braces}} {pi:.2f}")
+    >>> print t.render_string(count=2, s='s', names=iter(['A', ', ', 'B']),
+    ...                       pi=3.14159)
+    <p>2 streets: A, B</p> {braces} 3.14
+    """
+
+    def __init__(self, text):
+        self.parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if conversion:
+                raise ValueError("Conversions aren't supported: {%s!%s}"
+                                 % (field, conversion))
+            self.parts.append((literal, field, spec))
+        self.fields = set(field for literal, field, spec in self.parts
+                          if field is not None)
+
+    def render(self, out, **values):
+        """Writes the template to out (anything with a write method), with
+        values filled in."""
+        write = out.write
+        for literal, field, spec in self.parts:
+            if literal:
+                write(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if spec:
+                write(format(value, spec))
+            elif isinstance(value, basestring):
+                write(value)
+            elif hasattr(value, '__iter__'):
+                for chunk in value:
+                    write(chunk)
+            else:
+                write(unicode(value))
+
+    def render_string(self, **values):
+        """Returns the template with values filled in."""
+        out = StringIO()
+        self.render(out, **values)
+        return out.getvalue()